@@ -0,0 +1,132 @@
+import streamlit as st
+import os
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(PROJECT_ROOT / 'src'))
+
+# so o leitor do snapshot (biblioteca padrao): nada de pandas, plotly ou pptx na partida
+from snapshot import SNAPSHOT_PATH, read_snapshot
+
+
+st.set_page_config(
+    page_title="E-commerce Funnel Dashboard",
+    page_icon="🛒",
+    layout="wide",
+    initial_sidebar_state="collapsed",
+)
+
+# Arquivo gerado pelo job em lote: python src/snapshot.py
+DASHBOARD_SNAPSHOT = os.environ.get('FUNNEL_SNAPSHOT_PATH', SNAPSHOT_PATH)
+
+@st.cache_resource(max_entries=1)
+def load_snapshot(path, mtime_ns):
+    # mtime na chave: um snapshot novo e lido no proximo rerun, o antigo sai do cache
+    return read_snapshot(path)
+
+def format_ci(interval):
+    return f"{interval[0]}–{interval[1]}%" if interval else ""
+
+def step_table(segments, funnel_key, label):
+    # uma linha por valor do segmento, uma coluna por passo do funil
+    rows = []
+    for value, data in segments.items():
+        funnel = data[funnel_key]
+        stages, rates = funnel['Stage'], funnel['Conversion_Rate']
+        row = {label: value}
+        for i in range(1, len(stages)):
+            row[f"{stages[i - 1]} to {stages[i]}"] = f"{rates[i]}%"
+        row["Overall"] = f"{data['overall_conversion']}%"
+        if data.get('overall_conversion_ci'):
+            row["Overall CI"] = format_ci(data['overall_conversion_ci'])
+        rows.append(row)
+    return rows
+
+def render_overview(results):
+    overall = results['overall']
+    funnel = overall['funnel']
+    drop_off = overall['drop_off']
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Total Users", f"{results['user_counts']['total']:,}")
+    col2.metric(
+        "Overall Conversion Rate", f"{overall['conversion_rate']}%",
+        help=f"95% CI {format_ci(overall['conversion_rate_ci'])}" if overall.get('conversion_rate_ci') else None
+    )
+    worst = max(range(len(drop_off['Stage'])), key=lambda i: drop_off['Drop_Off_Percentage'][i])
+    col3.metric(
+        "Biggest Drop-off Point", drop_off['Stage'][worst],
+        delta=f"-{drop_off['Drop_Off_Percentage'][worst]}%", delta_color="inverse"
+    )
+
+    chart_col, table_col = st.columns(2)
+    with chart_col:
+        # sort=None: etapas na ordem do funil, nao em ordem alfabetica
+        st.vega_lite_chart(
+            {'Stage': funnel['Stage'], 'Users': funnel['Users']},
+            {
+                'mark': {'type': 'bar'},
+                'encoding': {
+                    'x': {'field': 'Stage', 'type': 'nominal', 'sort': None},
+                    'y': {'field': 'Users', 'type': 'quantitative'}
+                }
+            },
+            use_container_width=True
+        )
+    with table_col:
+        st.dataframe(funnel, hide_index=True, use_container_width=True)
+        st.dataframe(drop_off, hide_index=True, use_container_width=True)
+
+def render_segments(results, significance):
+    segments = results['segments']
+    device_col, gender_col = st.columns(2)
+    with device_col:
+        st.subheader("By Device")
+        st.dataframe(step_table(segments['device'], 'funnel_df', "Device"), hide_index=True, use_container_width=True)
+    with gender_col:
+        st.subheader("By Gender")
+        st.dataframe(step_table(segments['gender'], 'funnel_df', "Gender"), hide_index=True, use_container_width=True)
+
+    st.subheader("New vs Existing Users")
+    user_types = {
+        "New Users": segments['user_type']['new'],
+        "Existing Users": segments['user_type']['existing']
+    }
+    st.dataframe(step_table(user_types, 'funnel', "User Type"), hide_index=True, use_container_width=True)
+    st.caption(
+        f"New users: {results['user_counts']['new']:,} · Existing users: {results['user_counts']['existing']:,}"
+    )
+
+    if significance:
+        st.subheader("Statistical Significance")
+        st.dataframe(significance, hide_index=True, use_container_width=True)
+
+def main():
+    st.title("🛒 E-commerce Funnel Dashboard")
+
+    if not os.path.exists(DASHBOARD_SNAPSHOT):
+        st.error("No analysis snapshot found. Build one with `python src/snapshot.py`.")
+        return
+    snapshot = load_snapshot(DASHBOARD_SNAPSHOT, os.stat(DASHBOARD_SNAPSHOT).st_mtime_ns)
+    st.caption(f"Snapshot of {snapshot['created_at']} · data fingerprint {snapshot['fingerprint'][:12]}")
+
+    results = snapshot['analysis_results']
+    overview_tab, segments_tab, insights_tab = st.tabs(["📊 Funnel Overview", "👥 Segments", "💡 Insights & Recommendations"])
+
+    with overview_tab:
+        render_overview(results)
+
+    with segments_tab:
+        render_segments(results, snapshot.get('significance'))
+
+    with insights_tab:
+        st.subheader("Insights")
+        for insight in snapshot['insights']:
+            st.markdown(f"- {insight}")
+        st.subheader("Recommendations")
+        for recommendation in snapshot['recommendations']:
+            st.markdown(f"- {recommendation}")
+
+if __name__ == "__main__":
+    main()
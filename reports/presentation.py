@@ -8,6 +8,14 @@ import pandas as pd
 import io
 import tempfile
 import os
+from visualization import FUNNEL_COLORS
+
+def add_step_rates(tf, funnel_df, prefix="  - ", level=1):
+    # uma linha por passo do funil, na ordem das etapas de funnel_df
+    for i in range(1, len(funnel_df)):
+        p = tf.add_paragraph()
+        p.text = f"{prefix}{funnel_df.loc[i - 1, 'Stage']} to {funnel_df.loc[i, 'Stage']}: {funnel_df.loc[i, 'Conversion_Rate']}%"
+        p.level = level
 
 def create_presentation(analysis_results, insights, recommendations):
     prs = Presentation()
@@ -29,8 +37,11 @@ def create_presentation(analysis_results, insights, recommendations):
     tf = body.text_frame
     tf.text = "Analysis of the e-commerce conversion funnel:"
     
+    funnel_df = analysis_results['overall']['funnel']
+    stages = funnel_df['Stage'].tolist()
+    
     p = tf.add_paragraph()
-    p.text = "• Home → Search → Payment → Confirmation"
+    p.text = "• " + " → ".join(stages)
     p.level = 1
     
     p = tf.add_paragraph()
@@ -52,18 +63,12 @@ def create_presentation(analysis_results, insights, recommendations):
     title.text = "Funnel Analysis"
     tf = body.text_frame
     
-    funnel_df = analysis_results['overall']['funnel']
     with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp:
-        funnel_data = [
-            funnel_df.loc[0, 'Users'],
-            funnel_df.loc[1, 'Users'],
-            funnel_df.loc[2, 'Users'],
-            funnel_df.loc[3, 'Users']
-        ]
-        stages = funnel_df['Stage'].tolist()
+        funnel_data = funnel_df['Users'].tolist()
+        colors = [FUNNEL_COLORS[i % len(FUNNEL_COLORS)] for i in range(len(stages))]
         
         plt.figure(figsize=(8, 6))
-        plt.bar(stages, funnel_data, color=['#0068c9', '#83c9ff', '#29b09d', '#7defa1'])
+        plt.bar(stages, funnel_data, color=colors)
         for i, v in enumerate(funnel_data):
             plt.text(i, v + 0.1, str(v), ha='center')
         plt.title('User Funnel')
@@ -82,20 +87,10 @@ def create_presentation(analysis_results, insights, recommendations):
     title.text = "Conversion Rates Between Stages"
     tf = body.text_frame
     
-    p = tf.add_paragraph()
-    p.text = f"• Home to Search: {funnel_df.loc[1, 'Conversion_Rate']}%"
-    p.level = 0
-    
-    p = tf.add_paragraph()
-    p.text = f"• Search to Payment: {funnel_df.loc[2, 'Conversion_Rate']}%"
-    p.level = 0
-    
-    p = tf.add_paragraph()
-    p.text = f"• Payment to Confirmation: {funnel_df.loc[3, 'Conversion_Rate']}%"
-    p.level = 0
+    add_step_rates(tf, funnel_df, prefix="• ", level=0)
     
     p = tf.add_paragraph()
-    p.text = f"• Overall (Home to Confirmation): {analysis_results['overall']['conversion_rate']}%"
+    p.text = f"• Overall ({stages[0]} to {stages[-1]}): {analysis_results['overall']['conversion_rate']}%"
     p.level = 0
     
     slide = prs.slides.add_slide(bullet_slide_layout)
@@ -126,17 +121,7 @@ def create_presentation(analysis_results, insights, recommendations):
         p.level = 0
         
         funnel = data['funnel_df']
-        p = tf.add_paragraph()
-        p.text = f"  - Home to Search: {funnel.loc[1, 'Conversion_Rate']}%"
-        p.level = 1
-        
-        p = tf.add_paragraph()
-        p.text = f"  - Search to Payment: {funnel.loc[2, 'Conversion_Rate']}%"
-        p.level = 1
-        
-        p = tf.add_paragraph()
-        p.text = f"  - Payment to Confirmation: {funnel.loc[3, 'Conversion_Rate']}%"
-        p.level = 1
+        add_step_rates(tf, funnel)
     
     slide = prs.slides.add_slide(bullet_slide_layout)
     title = slide.shapes.title
@@ -152,17 +137,7 @@ def create_presentation(analysis_results, insights, recommendations):
         p.level = 0
         
         funnel = data['funnel_df']
-        p = tf.add_paragraph()
-        p.text = f"  - Home to Search: {funnel.loc[1, 'Conversion_Rate']}%"
-        p.level = 1
-        
-        p = tf.add_paragraph()
-        p.text = f"  - Search to Payment: {funnel.loc[2, 'Conversion_Rate']}%"
-        p.level = 1
-        
-        p = tf.add_paragraph()
-        p.text = f"  - Payment to Confirmation: {funnel.loc[3, 'Conversion_Rate']}%"
-        p.level = 1
+        add_step_rates(tf, funnel)
     
     slide = prs.slides.add_slide(bullet_slide_layout)
     title = slide.shapes.title
@@ -179,34 +154,14 @@ def create_presentation(analysis_results, insights, recommendations):
     p.level = 0
     
     new_funnel = new_data['funnel']
-    p = tf.add_paragraph()
-    p.text = f"  - Home to Search: {new_funnel.loc[1, 'Conversion_Rate']}%"
-    p.level = 1
-    
-    p = tf.add_paragraph()
-    p.text = f"  - Search to Payment: {new_funnel.loc[2, 'Conversion_Rate']}%"
-    p.level = 1
-    
-    p = tf.add_paragraph()
-    p.text = f"  - Payment to Confirmation: {new_funnel.loc[3, 'Conversion_Rate']}%"
-    p.level = 1
+    add_step_rates(tf, new_funnel)
     
     p = tf.add_paragraph()
     p.text = f"• Existing Users: {existing_data['overall_conversion']}% overall conversion"
     p.level = 0
     
     existing_funnel = existing_data['funnel']
-    p = tf.add_paragraph()
-    p.text = f"  - Home to Search: {existing_funnel.loc[1, 'Conversion_Rate']}%"
-    p.level = 1
-    
-    p = tf.add_paragraph()
-    p.text = f"  - Search to Payment: {existing_funnel.loc[2, 'Conversion_Rate']}%"
-    p.level = 1
-    
-    p = tf.add_paragraph()
-    p.text = f"  - Payment to Confirmation: {existing_funnel.loc[3, 'Conversion_Rate']}%"
-    p.level = 1
+    add_step_rates(tf, existing_funnel)
     
     slide = prs.slides.add_slide(bullet_slide_layout)
     title = slide.shapes.title
@@ -1,53 +1,70 @@
 import pandas as pd
 import numpy as np
 from utils import *
+from funnel_spec import DEFAULT_FUNNEL
+from user_index import UserIndex, USER_TYPES, USER_TYPE_KEYS
+from bootstrap import analysis_intervals, attach_intervals, DEFAULT_CONFIDENCE
+from significance import analysis_tests, find_test
 
-def perform_funnel_analysis(home_df, search_df, payment_df, confirmation_df, user_df):
-    funnel_df, overall_conversion, user_sets = calculate_user_journeys(
-        home_df, search_df, payment_df, confirmation_df
-    )
-    device_segments = segment_by_attribute(
-        home_df, search_df, payment_df, confirmation_df, user_df, 'device'
-    )
-    gender_segments = segment_by_attribute(
-        home_df, search_df, payment_df, confirmation_df, user_df, 'sex'
-    )
-    new_users, existing_users = identify_new_users(user_df)
-    
-    new_user_home = home_df[home_df['user_id'].isin(new_users['user_id'])]
-    new_user_search = search_df[search_df['user_id'].isin(new_users['user_id'])]
-    new_user_payment = payment_df[payment_df['user_id'].isin(new_users['user_id'])]
-    new_user_confirmation = confirmation_df[confirmation_df['user_id'].isin(new_users['user_id'])]
-    
-    existing_user_home = home_df[home_df['user_id'].isin(existing_users['user_id'])]
-    existing_user_search = search_df[search_df['user_id'].isin(existing_users['user_id'])]
-    existing_user_payment = payment_df[payment_df['user_id'].isin(existing_users['user_id'])]
-    existing_user_confirmation = confirmation_df[confirmation_df['user_id'].isin(existing_users['user_id'])]
-    
-    new_user_funnel, new_user_overall, _ = calculate_user_journeys(
-        new_user_home, new_user_search, new_user_payment, new_user_confirmation
-    )
-    
-    existing_user_funnel, existing_user_overall, _ = calculate_user_journeys(
-        existing_user_home, existing_user_search, existing_user_payment, existing_user_confirmation
+# quantas diferencas significativas por etapa viram insights
+MAX_STEP_INSIGHTS = 3
+
+def perform_funnel_analysis(*tables, spec=None, n_resamples=0):
+    # tabelas de etapa na ordem do spec, seguidas de user_df
+    # n_resamples > 0 acrescenta intervalos de confianca bootstrap a todos os funis
+    *stage_dfs, user_df = tables
+    spec = spec or DEFAULT_FUNNEL
+    # um unico indice de usuarios serve a todas as segmentacoes
+    index = UserIndex(user_df)
+
+    funnel_df, overall_conversion, drop_off_df = analyze_overall_funnel(*stage_dfs, spec=spec)
+    device_segments = segment_by_attribute(*stage_dfs, user_df, 'device', spec=spec, index=index)
+    gender_segments = segment_by_attribute(*stage_dfs, user_df, 'sex', spec=spec, index=index)
+    user_types = analyze_user_types(*stage_dfs, index=index, spec=spec)
+    
+    analysis_results = build_analysis_results(
+        funnel_df, overall_conversion, drop_off_df, device_segments, gender_segments,
+        user_types['new']['funnel'], user_types['new']['overall_conversion'],
+        user_types['existing']['funnel'], user_types['existing']['overall_conversion'],
+        len(user_df), user_types['new']['count'], user_types['existing']['count']
     )
-    
-    drop_off_data = {
-        'Stage': ['Home to Search', 'Search to Payment', 'Payment to Confirmation'],
-        'Drop_Off_Count': [
-            len(user_sets['home_users']) - len(user_sets['home_to_search']),
-            len(user_sets['search_users']) - len(user_sets['search_to_payment']),
-            len(user_sets['payment_users']) - len(user_sets['payment_to_confirmation'])
-        ]
-    }
-    
-    drop_off_df = pd.DataFrame(drop_off_data)
-    drop_off_df['Drop_Off_Percentage'] = [
-        round(drop_off_df.loc[0, 'Drop_Off_Count'] / len(user_sets['home_users']) * 100, 2) if len(user_sets['home_users']) > 0 else 0,
-        round(drop_off_df.loc[1, 'Drop_Off_Count'] / len(user_sets['search_users']) * 100, 2) if len(user_sets['search_users']) > 0 else 0,
-        round(drop_off_df.loc[2, 'Drop_Off_Count'] / len(user_sets['payment_users']) * 100, 2) if len(user_sets['payment_users']) > 0 else 0
-    ]
-    
+    if n_resamples:
+        intervals = analysis_intervals(*stage_dfs, user_df, spec=spec, index=index, n_resamples=n_resamples)
+        analysis_results = attach_intervals(analysis_results, intervals)
+    return analysis_results
+
+def analyze_overall_funnel(*stage_dfs, spec=None):
+    # uma unica passada: mascara por usuario, histograma de padroes e o plano do spec
+    spec = spec or DEFAULT_FUNNEL
+    _, masks = spec.masks(stage_dfs)
+    patterns = spec.pattern_counts(masks)
+    
+    funnel_df, overall_conversion = spec.funnel(patterns)
+    drop_off_df = spec.drop_off(patterns)
+    return funnel_df, overall_conversion, drop_off_df
+
+def analyze_user_types(*stage_dfs, index, spec=None):
+    """
+    New and existing user funnels from a single grouped reduction over the
+    user index (same cutoff as identify_new_users).
+    """
+    spec = spec or DEFAULT_FUNNEL
+    patterns, _ = spec.segment_patterns(stage_dfs, index.user_ids, index.user_codes('user_type'), len(USER_TYPES))
+    counts = index.value_counts('user_type')
+
+    user_types = {}
+    for i, (key, label) in enumerate(zip(USER_TYPE_KEYS, USER_TYPES)):
+        funnel_df, overall_conversion = spec.funnel(patterns[i])
+        user_types[key] = {
+            'funnel': funnel_df,
+            'overall_conversion': overall_conversion,
+            'count': counts[label]
+        }
+    return user_types
+
+def build_analysis_results(funnel_df, overall_conversion, drop_off_df, device_segments, gender_segments,
+                           new_user_funnel, new_user_overall, existing_user_funnel, existing_user_overall,
+                           total_users, new_count, existing_count):
     return {
         'overall': {
             'funnel': funnel_df,
@@ -61,27 +78,45 @@ def perform_funnel_analysis(home_df, search_df, payment_df, confirmation_df, use
                 'new': {
                     'funnel': new_user_funnel,
                     'overall_conversion': new_user_overall,
-                    'count': len(new_users)
+                    'count': new_count
                 },
                 'existing': {
                     'funnel': existing_user_funnel,
                     'overall_conversion': existing_user_overall,
-                    'count': len(existing_users)
+                    'count': existing_count
                 }
             }
         },
         'user_counts': {
-            'total': len(user_df),
-            'new': len(new_users),
-            'existing': len(existing_users)
+            'total': total_users,
+            'new': new_count,
+            'existing': existing_count
         }
     }
 
-def generate_insights(analysis_results):
+def format_ci(interval):
+    # texto do intervalo de confianca, vazio quando nao foi calculado
+    if interval is None:
+        return ""
+    return f"{DEFAULT_CONFIDENCE:.0%} CI {interval[0]}–{interval[1]}%"
+
+def format_rate(rate, interval=None):
+    ci = format_ci(interval)
+    return f"{rate}% ({ci})" if ci else f"{rate}%"
+
+def format_p(test):
+    # p-valor ajustado de uma linha de analysis_tests
+    p = test['P_Adjusted']
+    return "adjusted p < 0.001" if p < 0.001 else f"adjusted p = {p:.3f}"
+
+def generate_insights(analysis_results, tests=None):
+    if tests is None:
+        tests = analysis_tests(analysis_results)
     insights = []
     
     overall_cr = analysis_results['overall']['conversion_rate']
-    insights.append(f"Overall funnel conversion rate: {overall_cr}% from Home to Confirmation")
+    overall_ci = analysis_results['overall'].get('conversion_rate_ci')
+    insights.append(f"Overall funnel conversion rate: {format_rate(overall_cr, overall_ci)} from Home to Confirmation")
     
     drop_off = analysis_results['overall']['drop_off']
     max_drop_idx = drop_off['Drop_Off_Percentage'].idxmax()
@@ -93,7 +128,11 @@ def generate_insights(analysis_results):
     device_cr = {device: data['overall_conversion'] for device, data in devices.items()}
     best_device = max(device_cr, key=device_cr.get)
     worst_device = min(device_cr, key=device_cr.get)
-    insights.append(f"Device comparison: {best_device} performs best with {device_cr[best_device]}% conversion rate, while {worst_device} has {device_cr[worst_device]}%")
+    device_test = find_test(tests, 'device', best_device, worst_device)
+    if device_test is not None and device_test['Significant']:
+        insights.append(f"Device comparison: {best_device} performs best with {device_cr[best_device]}% conversion rate, while {worst_device} has {device_cr[worst_device]}% ({format_p(device_test)})")
+    else:
+        insights.append(f"Device comparison: no significant difference in conversion between {best_device} ({device_cr[best_device]}%) and {worst_device} ({device_cr[worst_device]}%)")
     
     genders = analysis_results['segments']['gender']
     gender_cr = {gender: data['overall_conversion'] for gender, data in genders.items()}
@@ -102,7 +141,13 @@ def generate_insights(analysis_results):
     
     new_cr = analysis_results['segments']['user_type']['new']['overall_conversion']
     existing_cr = analysis_results['segments']['user_type']['existing']['overall_conversion']
-    insights.append(f"New users convert at {new_cr}% compared to {existing_cr}% for existing users")
+    new_ci = analysis_results['segments']['user_type']['new'].get('overall_conversion_ci')
+    existing_ci = analysis_results['segments']['user_type']['existing'].get('overall_conversion_ci')
+    user_type_test = find_test(tests, 'user_type', 'new', 'existing')
+    if user_type_test is not None and user_type_test['Significant']:
+        insights.append(f"New users convert at {format_rate(new_cr, new_ci)} compared to {format_rate(existing_cr, existing_ci)} for existing users ({format_p(user_type_test)})")
+    else:
+        insights.append(f"New users convert at {format_rate(new_cr, new_ci)} compared to {format_rate(existing_cr, existing_ci)} for existing users, not a significant difference")
     
     new_funnel = analysis_results['segments']['user_type']['new']['funnel']
     new_worst_stage_idx = new_funnel['Drop_Off_Rate'].idxmax()
@@ -110,9 +155,17 @@ def generate_insights(analysis_results):
     new_worst_drop = new_funnel.loc[new_worst_stage_idx, 'Drop_Off_Rate']
     insights.append(f"New users struggle most at the {new_worst_stage} stage with a {new_worst_drop}% drop-off rate")
     
+    # diferencas significativas por etapa, das mais fortes para as mais fracas
+    step_tests = tests[tests['Significant'] & (tests['Metric'] != 'Overall')].sort_values('P_Adjusted')
+    for _, row in step_tests.head(MAX_STEP_INSIGHTS).iterrows():
+        dimension = row['Dimension'].replace('_', ' ')
+        insights.append(f"{row['Metric']} conversion differs by {dimension}: {row['Segment_A']} {row['Rate_A']}% vs {row['Segment_B']} {row['Rate_B']}% ({format_p(row)})")
+    
     return insights
 
-def generate_recommendations(analysis_results):
+def generate_recommendations(analysis_results, tests=None):
+    if tests is None:
+        tests = analysis_tests(analysis_results)
     recommendations = []
     
     drop_off = analysis_results['overall']['drop_off']
@@ -141,12 +194,18 @@ def generate_recommendations(analysis_results):
         recommendations.append("Add multiple payment options to accommodate user preferences")
         recommendations.append("Implement guest checkout to reduce friction for new users")
     
-    if new_cr < existing_cr * 0.8: 
+    user_type_test = find_test(tests, 'user_type', 'new', 'existing')
+    if new_cr < existing_cr and user_type_test is not None and user_type_test['Significant']:
         recommendations.append("Create a first-time user discount to incentivize completion of first purchase")
         recommendations.append("Add a guided tutorial for new users explaining the shopping process")
         recommendations.append("Implement live chat support to assist new users with questions")
     
-    if 'Mobile' in device_cr and device_cr['Mobile'] < device_cr.get('Desktop', 100):
+    # mobile significativamente abaixo de algum outro dispositivo
+    mobile_behind = any(
+        device_cr['Mobile'] < cr and find_test(tests, 'device', 'Mobile', device)['Significant']
+        for device, cr in device_cr.items() if device != 'Mobile'
+    ) if 'Mobile' in device_cr else False
+    if mobile_behind:
         recommendations.append("Optimize the mobile experience with a responsive design")
         recommendations.append("Simplify the mobile checkout process")
         recommendations.append("Implement mobile-specific features like saved payment details")
@@ -0,0 +1,136 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from funnel_spec import DEFAULT_FUNNEL
+from user_index import UserIndex, USER_TYPES, USER_TYPE_KEYS
+
+DEFAULT_RESAMPLES = 1000
+DEFAULT_CONFIDENCE = 0.95
+
+# abaixo disso o custo de subir processos nao compensa
+POOL_MIN_RESAMPLES = 200_000
+POOL_CHUNK = 50_000
+
+CI_LOW = 'Conversion_Rate_CI_Low'
+CI_HIGH = 'Conversion_Rate_CI_High'
+
+def _rates(patterns, reached_matrix):
+    # taxa de cada passo e taxa geral (ultima coluna), em %
+    users = patterns @ reached_matrix
+    with np.errstate(divide='ignore', invalid='ignore'):
+        steps = users[..., 1:] / users[..., :-1] * 100
+        overall = users[..., -1] / users[..., 0] * 100
+    return np.concatenate([steps, overall[..., None]], axis=-1)
+
+def _resample(pattern_counts, reached_matrix, n_resamples, seed):
+    """
+    Bootstrap resamples of the users behind each histogram. Drawing N users
+    with replacement from N per-user bitmasks only depends on how many
+    users have each pattern, so a resample is one multinomial draw over the
+    pattern histogram instead of N random indices.
+    """
+    rng = np.random.default_rng(seed)
+    totals = pattern_counts.sum(axis=-1)
+    pvals = pattern_counts / np.maximum(totals, 1)[..., None]
+    resampled = rng.multinomial(totals, pvals, size=(n_resamples,) + totals.shape)
+    return _rates(resampled, reached_matrix)
+
+def funnel_intervals(pattern_counts, spec=None, n_resamples=DEFAULT_RESAMPLES, confidence=DEFAULT_CONFIDENCE,
+                     seed=0, n_jobs=None):
+    """
+    Percentile bootstrap intervals for the step and overall conversion
+    rates of one histogram (shape (2**n,)) or a stack of them (shape
+    (k, 2**n)), all resampled in one batch.
+
+    Returns (low, high), each with the step rates followed by the overall
+    rate on the last axis. With n_jobs > 1 and at least POOL_MIN_RESAMPLES
+    resamples, the draws are split over a process pool.
+    """
+    spec = spec or DEFAULT_FUNNEL
+    pattern_counts = np.asarray(pattern_counts, dtype=np.int64)
+
+    if n_jobs and n_jobs > 1 and n_resamples >= POOL_MIN_RESAMPLES:
+        sizes = [POOL_CHUNK] * (n_resamples // POOL_CHUNK)
+        if n_resamples % POOL_CHUNK:
+            sizes.append(n_resamples % POOL_CHUNK)
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            parts = executor.map(
+                _resample, [pattern_counts] * len(sizes), [spec.reached_matrix] * len(sizes), sizes, seeds
+            )
+            rates = np.concatenate(list(parts))
+    else:
+        rates = _resample(pattern_counts, spec.reached_matrix, n_resamples, seed)
+
+    tail = (1 - confidence) / 2 * 100
+    with np.errstate(all='ignore'):
+        low, high = np.nanpercentile(rates, [tail, 100 - tail], axis=0)
+    return np.round(low, 2), np.round(high, 2)
+
+def with_intervals(funnel_df, interval):
+    """funnel_df with CI columns for Conversion_Rate, plus the overall (low, high)."""
+    low, high = interval
+    funnel_df = funnel_df.copy()
+    funnel_df[CI_LOW] = [100.0] + low[:-1].tolist()
+    funnel_df[CI_HIGH] = [100.0] + high[:-1].tolist()
+    return funnel_df, (float(low[-1]), float(high[-1]))
+
+def analysis_intervals(*tables, spec=None, index=None, n_resamples=DEFAULT_RESAMPLES,
+                       confidence=DEFAULT_CONFIDENCE, seed=0, n_jobs=None):
+    """
+    Intervals for every funnel of perform_funnel_analysis (overall, each
+    device, each sex, new and existing users), from a single batched
+    bootstrap over all their histograms.
+    """
+    *stage_dfs, user_df = tables
+    spec = spec or DEFAULT_FUNNEL
+    index = index or UserIndex(user_df)
+
+    _, masks = spec.masks(stage_dfs)
+    blocks = {'overall': spec.pattern_counts(masks)[None, :]}
+    for key, attribute, n_values in [
+        ('device', 'device', len(index.categories('device'))),
+        ('gender', 'sex', len(index.categories('sex'))),
+        ('user_type', 'user_type', len(USER_TYPES))
+    ]:
+        blocks[key], _ = spec.segment_patterns(stage_dfs, index.user_ids, index.user_codes(attribute), n_values)
+
+    low, high = funnel_intervals(
+        np.vstack(list(blocks.values())), spec, n_resamples, confidence, seed, n_jobs
+    )
+
+    intervals = {}
+    start = 0
+    for key, block in blocks.items():
+        intervals[key] = [(low[i], high[i]) for i in range(start, start + len(block))]
+        start += len(block)
+    intervals['overall'] = intervals['overall'][0]
+    intervals['user_type'] = dict(zip(USER_TYPE_KEYS, intervals['user_type']))
+    return intervals
+
+def attach_overall(overall, interval):
+    funnel_df, conversion_rate_ci = with_intervals(overall['funnel'], interval)
+    return {**overall, 'funnel': funnel_df, 'conversion_rate_ci': conversion_rate_ci}
+
+def attach_segments(segments, intervals, funnel_key='funnel_df'):
+    # intervals na mesma ordem dos segmentos (lista) ou por chave (dict)
+    if not isinstance(intervals, dict):
+        intervals = dict(zip(segments, intervals))
+    attached = {}
+    for value, data in segments.items():
+        funnel_df, overall_ci = with_intervals(data[funnel_key], intervals[value])
+        attached[value] = {**data, funnel_key: funnel_df, 'overall_conversion_ci': overall_ci}
+    return attached
+
+def attach_intervals(analysis_results, intervals):
+    """Copy of analysis_results with the bootstrap intervals added to every funnel."""
+    segments = analysis_results['segments']
+    return {
+        **analysis_results,
+        'overall': attach_overall(analysis_results['overall'], intervals['overall']),
+        'segments': {
+            **segments,
+            'device': attach_segments(segments['device'], intervals['device']),
+            'gender': attach_segments(segments['gender'], intervals['gender']),
+            'user_type': attach_segments(segments['user_type'], intervals['user_type'], funnel_key='funnel')
+        }
+    }
@@ -0,0 +1,72 @@
+import pandas as pd
+import numpy as np
+from funnel_spec import DEFAULT_FUNNEL
+from user_index import UserIndex
+
+def daily_patterns(*stage_dfs, user_df, spec=None, index=None):
+    """
+    Stage-pattern histogram of the users who signed up on each day, for
+    every day between the first and last signup date of user_df (days
+    without signups get zeros). Returns (days, patterns, signups) with
+    shapes (n_days,), (n_days, 2**n_stages) and (n_days,).
+    """
+    spec = spec or DEFAULT_FUNNEL
+    index = index or UserIndex(user_df)
+
+    dates = pd.to_datetime(user_df['date'], errors='coerce').dt.normalize()
+    first_day, last_day = dates.min(), dates.max()
+    if pd.isnull(first_day):
+        raise ValueError("Nenhuma data válida encontrada em user_df['date'].")
+    days = pd.date_range(first_day, last_day, freq='D')
+
+    # dia de cadastro de cada linha como deslocamento desde o primeiro dia (-1 = sem data)
+    offsets = ((dates - first_day).dt.days).fillna(-1).to_numpy(dtype=np.int64)
+    signups = np.bincount(offsets[offsets >= 0], minlength=len(days))
+
+    patterns, _ = spec.segment_patterns(stage_dfs, index.user_ids, offsets[index.first_rows], len(days))
+    return days, patterns, signups
+
+def rolling_cohort_funnels(*stage_dfs, user_df, window_days=7, spec=None, index=None):
+    """
+    Funnel of every window of `window_days` consecutive signup days, sliding
+    one day at a time over the whole date range. All windows come from one
+    pass: per-day pattern histograms, a prefix sum and one difference per
+    window.
+
+    One row per window: Window_Start, Window_End, Signups, the users at
+    each stage (one column per stage label), the conversion of each step
+    ('<step>_Rate') and Overall_Conversion, all in percent as in funnel_df.
+    """
+    if window_days < 1:
+        raise ValueError("window_days must be at least 1")
+    spec = spec or DEFAULT_FUNNEL
+    days, patterns, signups = daily_patterns(*stage_dfs, user_df=user_df, spec=spec, index=index)
+
+    n_windows = len(days) - window_days + 1
+    if n_windows < 1:
+        print(f"Date range has {len(days)} days, shorter than a {window_days}-day window")
+        return pd.DataFrame()
+
+    # somas de prefixo com uma linha de zeros no inicio: janela [i, i+N) = P[i+N] - P[i]
+    pattern_prefix = np.vstack([np.zeros((1, patterns.shape[1]), dtype=np.int64), np.cumsum(patterns, axis=0)])
+    signup_prefix = np.concatenate([[0], np.cumsum(signups)])
+    window_patterns = pattern_prefix[window_days:] - pattern_prefix[:n_windows]
+    window_signups = signup_prefix[window_days:] - signup_prefix[:n_windows]
+
+    users = spec.stage_users(window_patterns)
+
+    result = pd.DataFrame({
+        'Window_Start': days[:n_windows],
+        'Window_End': days[window_days - 1:],
+        'Signups': window_signups
+    })
+    for i, label in enumerate(spec.labels):
+        result[label] = users[:, i]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for i, step in enumerate(spec.step_labels, start=1):
+            rate = np.where(users[:, i - 1] > 0, users[:, i] / users[:, i - 1] * 100, 0)
+            result[f"{step}_Rate"] = np.round(rate, 2)
+        overall = np.where(users[:, 0] > 0, users[:, -1] / users[:, 0] * 100, 0)
+    result['Overall_Conversion'] = np.round(overall, 2)
+    return result
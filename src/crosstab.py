@@ -0,0 +1,54 @@
+import pandas as pd
+import numpy as np
+
+def step_segment_counts(step_labels, segments):
+    """
+    Rows per (step, segment) as an (n_steps, n_segments) matrix, from one
+    label vector per step (the segment of every event row, e.g. a column of
+    UserIndex.label). One grouped count over all steps; labels outside
+    `segments` (or missing) are not counted.
+    """
+    segments = list(segments)
+    n_segments = len(segments)
+    # -1 para rotulos ausentes ou fora de segments
+    lookup = pd.Index(segments)
+    codes = []
+    for step, labels in enumerate(step_labels):
+        step_codes = lookup.get_indexer(labels).astype(np.int64)
+        codes.append(np.where(step_codes >= 0, step * n_segments + step_codes, -1))
+    codes = np.concatenate(codes) if codes else np.empty(0, dtype=np.int64)
+
+    counts = np.bincount(codes[codes >= 0], minlength=len(step_labels) * n_segments)
+    return counts.reshape(len(step_labels), n_segments)
+
+def step_rates(step_labels, segments):
+    """
+    Conversion and drop-off of every consecutive pair of steps for every
+    segment, as row counts (next step rows / start step rows, in %). One row
+    per (step, segment), step-major; rates are NaN where the start step has
+    no rows for the segment.
+    """
+    segments = list(segments)
+    counts = step_segment_counts(step_labels, segments)
+    start, following = counts[:-1].astype(float), counts[1:].astype(float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(start > 0, following / start, np.nan)
+
+    n_steps = len(step_labels) - 1
+    return pd.DataFrame({
+        'Step': np.repeat([f"Step {i + 1} → {i + 2}" for i in range(n_steps)], len(segments)),
+        'Segment': np.tile(np.array(segments, dtype=object), n_steps),
+        'Start Rows': start.ravel().astype(np.int64),
+        'Next Rows': following.ravel().astype(np.int64),
+        'Conversion Rate': np.round(ratio.ravel() * 100, 2),
+        'Drop-off Rate': np.round((1 - ratio.ravel()) * 100, 2)
+    })
+
+def step_conversion(step_labels, segments):
+    """Step, Segment and Conversion Rate columns of step_rates."""
+    return step_rates(step_labels, segments)[['Step', 'Segment', 'Conversion Rate']]
+
+def step_dropoff(step_labels, segments):
+    """From Step, Segment and Drop-off Rate columns of step_rates."""
+    rates = step_rates(step_labels, segments)[['Step', 'Segment', 'Drop-off Rate']]
+    return rates.rename(columns={'Step': 'From Step'})
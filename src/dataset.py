@@ -0,0 +1,308 @@
+import pandas as pd
+import numpy as np
+from functools import cached_property, wraps
+from utils import load_data, segment_by_attribute, LazyDict
+from analysis import (
+    analyze_overall_funnel, analyze_user_types, generate_insights, generate_recommendations
+)
+from funnel_analysis import funnel_depth
+from funnel_cube import FunnelCube
+from funnel_spec import DEFAULT_FUNNEL
+from user_index import UserIndex, USER_TYPES, USER_TYPE_KEYS
+from cohorts import rolling_cohort_funnels
+from bootstrap import analysis_intervals, attach_overall, attach_segments
+from significance import analysis_tests
+
+BACKENDS = ('pandas', 'sqlite')
+
+def product(method):
+    """
+    Property computed once per handle and, when the handle has a shared
+    ResultCache, once per data fingerprint across every handle.
+    """
+    @property
+    @wraps(method)
+    def getter(self):
+        return self._memo(method.__name__, lambda: method(self))
+    return getter
+
+class FunnelDataset:
+    """
+    Lazy handle over the processed tables and every product derived from
+    them. Nothing is loaded or computed until it is first accessed, and each
+    result is kept for the lifetime of the handle. With backend='sqlite'
+    the funnel and segment products are answered by SQLiteBackend instead
+    of pandas; the raw tables are then only loaded if something reads them.
+
+    Passing a ResultCache shares every product with other handles built on
+    the same data fingerprint (e.g. all sessions of the Streamlit app).
+
+    The funnel products follow `spec` (a FunnelSpec; default Home → Search →
+    Payment → Confirmation). Stage tables outside the five standard ones
+    are read on demand. With n_resamples > 0 every funnel also carries
+    bootstrap confidence intervals (see bootstrap.py).
+    """
+
+    def __init__(self, use_cache=True, compact=False, backend='pandas', cache=None, spec=None, n_resamples=0):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend: {backend}. Use one of {BACKENDS}")
+        spec = spec or DEFAULT_FUNNEL
+        if backend == 'sqlite' and spec.key != DEFAULT_FUNNEL.key:
+            raise ValueError("The sqlite backend only supports the default funnel spec")
+        if backend == 'sqlite' and n_resamples:
+            raise ValueError("Bootstrap intervals need the pandas backend")
+        self.use_cache = use_cache
+        self.compact = compact
+        self.backend = backend
+        self.cache = cache
+        self.spec = spec
+        self.n_resamples = n_resamples
+        self._products = {}
+
+    @cached_property
+    def fingerprint(self):
+        from result_cache import data_fingerprint
+        # um spec com outras tabelas de etapa tambem depende desses arquivos
+        return data_fingerprint(extra_files=self.spec.table_files)
+
+    def _cache_key(self, name):
+        return (self.fingerprint, self.backend, self.use_cache, self.compact, self.spec.key, self.n_resamples, name)
+
+    def _memo(self, name, compute):
+        if name not in self._products:
+            if self.cache is None:
+                self._products[name] = compute()
+            else:
+                self._products[name] = self.cache.get_or_compute(self._cache_key(name), compute)
+        return self._products[name]
+
+    def memo(self, name, compute):
+        """
+        Memoize a result derived from this dataset (e.g. the tables of one
+        dashboard section) like the products: once per handle and, with a
+        shared cache, once per data fingerprint.
+        """
+        return self._memo(('memo', name), compute)
+
+    def _forget(self, name):
+        self._products.pop(name, None)
+        if self.cache is not None:
+            self.cache.discard(self._cache_key(name))
+
+    @cached_property
+    def sql(self):
+        # import tardio: o backend SQLite so e necessario quando selecionado
+        from sql_backend import SQLiteBackend
+        return SQLiteBackend()
+
+    @property
+    def tables(self):
+        tables = self._memo('tables', lambda: load_data(use_cache=self.use_cache, compact=self.compact))
+        if tables[0] is None:
+            # falha de leitura nao fica no cache, a proxima execucao tenta de novo
+            self._forget('tables')
+        return tables
+
+    @property
+    def loaded(self):
+        return self.tables[0] is not None
+
+    @property
+    def home_df(self):
+        return self.tables[0]
+
+    @property
+    def search_df(self):
+        return self.tables[1]
+
+    @property
+    def payment_df(self):
+        return self.tables[2]
+
+    @property
+    def confirmation_df(self):
+        return self.tables[3]
+
+    @property
+    def user_df(self):
+        return self.tables[4]
+
+    @property
+    def page_tables(self):
+        if self.spec.key == DEFAULT_FUNNEL.key:
+            return self.tables[:4]
+
+        def compute():
+            home_df, search_df, payment_df, confirmation_df, user_df = self.tables
+            tables = {'home': home_df, 'search': search_df, 'payment': payment_df, 'confirmation': confirmation_df}
+            return self.spec.stage_tables(tables, use_cache=self.use_cache)
+        return self._memo('stage_tables', compute)
+
+    @product
+    def overall(self):
+        if self.backend == 'sqlite':
+            return self.sql.overall()
+        funnel_df, overall_conversion, drop_off_df = analyze_overall_funnel(*self.page_tables, spec=self.spec)
+        overall = {
+            'funnel': funnel_df,
+            'conversion_rate': overall_conversion,
+            'drop_off': drop_off_df
+        }
+        if self.n_resamples:
+            overall = attach_overall(overall, self.intervals['overall'])
+        return overall
+
+    @product
+    def device_segments(self):
+        if self.backend == 'sqlite':
+            return self.sql.segment_by_attribute('device')
+        segments = segment_by_attribute(*self.page_tables, self.user_df, 'device', spec=self.spec, index=self.user_index)
+        if self.n_resamples:
+            segments = attach_segments(segments, self.intervals['device'])
+        return segments
+
+    @product
+    def gender_segments(self):
+        if self.backend == 'sqlite':
+            return self.sql.segment_by_attribute('sex')
+        segments = segment_by_attribute(*self.page_tables, self.user_df, 'sex', spec=self.spec, index=self.user_index)
+        if self.n_resamples:
+            segments = attach_segments(segments, self.intervals['gender'])
+        return segments
+
+    @product
+    def intervals(self):
+        # um unico bootstrap em lote para todos os funis
+        return analysis_intervals(
+            *self.page_tables, self.user_df, spec=self.spec, index=self.user_index, n_resamples=self.n_resamples
+        )
+
+    @product
+    def user_type_segments(self):
+        if self.backend == 'sqlite':
+            return self.sql.user_type_segments()
+        user_types = analyze_user_types(*self.page_tables, index=self.user_index, spec=self.spec)
+        if self.n_resamples:
+            user_types = attach_segments(user_types, self.intervals['user_type'], funnel_key='funnel')
+        return user_types
+
+    @product
+    def user_counts(self):
+        if self.backend == 'sqlite':
+            return self.sql.user_counts()
+        counts = self.user_index.value_counts('user_type')
+        return {
+            'total': len(self.user_df),
+            **{key: counts[label] for key, label in zip(USER_TYPE_KEYS, USER_TYPES)}
+        }
+
+    @cached_property
+    def analysis_results(self):
+        """
+        Same layout as perform_funnel_analysis, but each branch is computed
+        only when it is read (e.g. analysis_results['overall'] does not run
+        the segment funnels).
+        """
+        return LazyDict({
+            'overall': lambda: self.overall,
+            'segments': lambda: LazyDict({
+                'device': lambda: self.device_segments,
+                'gender': lambda: self.gender_segments,
+                'user_type': lambda: self.user_type_segments
+            }),
+            'user_counts': lambda: self.user_counts
+        })
+
+    @product
+    def cube(self):
+        # o cubo salvo em disco so e reaproveitado se foi montado com os mesmos dados e o mesmo funil
+        if self.use_cache:
+            try:
+                return FunnelCube.load(self.fingerprint, spec=self.spec)
+            except (OSError, ValueError, ImportError):
+                pass
+        if self.backend == 'sqlite':
+            cube = self.sql.cube()
+        else:
+            cube = FunnelCube.build(*self.page_tables, self.user_df, spec=self.spec)
+        if self.use_cache:
+            try:
+                cube.save(self.fingerprint)
+            except (OSError, ValueError, ImportError) as e:
+                print(f"Could not save the funnel cube: {str(e)}")
+        return cube
+
+    @product
+    def filter_options(self):
+        """
+        Signup date range and the values of every FunnelCube dimension, read
+        from the user table so the filter widgets can be drawn without
+        building the cube.
+        """
+        dates = pd.to_datetime(self.user_df['date'], errors='coerce').dt.normalize()
+        return {
+            'date': (dates.min(), dates.max()),
+            'device': self.user_index.categories('device'),
+            'sex': self.user_index.categories('sex'),
+            'user_type': self.user_index.categories('user_type')
+        }
+
+    def filtered_results(self, **filters):
+        """
+        analysis_results restricted to the FunnelCube.rollup filters (signup
+        date range, device, sex, user_type), summed from the cached cube
+        instead of the events. Without filters, the regular analysis_results.
+        """
+        if not filters:
+            return self.analysis_results
+        return self.cube.analysis_results(**filters)
+
+    def rolling_cohorts(self, window_days=7):
+        """Funnels of every `window_days`-day signup window (see cohorts.rolling_cohort_funnels)."""
+        def compute():
+            return rolling_cohort_funnels(
+                *self.page_tables, user_df=self.user_df, window_days=window_days,
+                spec=self.spec, index=self.user_index
+            )
+        return self._memo(('rolling_cohorts', window_days), compute)
+
+    @product
+    def significance(self):
+        """Pairwise segment tests of every step, corrected as one family (see significance.analysis_tests)."""
+        return analysis_tests(self.analysis_results)
+
+    @product
+    def insights(self):
+        return generate_insights(self.analysis_results, self.significance)
+
+    @product
+    def recommendations(self):
+        return generate_recommendations(self.analysis_results, self.significance)
+
+    @product
+    def funnel_depth(self):
+        """(depth_df, pattern_df) of the page tables, see funnel_analysis.funnel_depth."""
+        return funnel_depth(*self.page_tables, spec=self.spec)
+
+    @product
+    def user_index(self):
+        return UserIndex(self.user_df)
+
+    def labeled(self, table, column):
+        """
+        Page table ('home', 'search', 'payment', 'confirmation') labeled with
+        one user attribute (a user_df column, 'user_type' or 'signup_date')
+        through the shared user index, memoized like the other products.
+        """
+        def compute():
+            return self.user_index.label(getattr(self, f"{table}_df"), column)
+        return self._memo(('labeled', table, column), compute)
+
+    @product
+    def user_types(self):
+        # como UserIndex.label: usuarios sem data valida (codigo -1) ficam NA
+        codes = self.user_index.row_codes('user_type')
+        return pd.Series(
+            pd.Categorical.from_codes(codes, categories=self.user_index.categories('user_type')),
+            index=self.user_df.index, name='user_type'
+        )
@@ -0,0 +1,75 @@
+import pandas as pd
+import numpy as np
+from funnel_spec import DEFAULT_FUNNEL
+
+# Cada usuario e resumido por uma mascara de bits: bit 0 = Home, 1 = Search,
+# 2 = Payment, 3 = Confirmation. Com 4 etapas existem 16 padroes possiveis.
+# Outros funis sao descritos por um FunnelSpec (funnel_spec.py).
+
+def calculate_user_journeys_bitmask(*stage_dfs, spec=None, n_resamples=0):
+    """
+    Vectorized calculate_user_journeys: same funnel_df and overall conversion,
+    and the same user_sets keys. The sets are only built when read.
+
+    With n_resamples > 0, funnel_df also gets bootstrap confidence intervals
+    for Conversion_Rate (see bootstrap.py).
+    """
+    spec = spec or DEFAULT_FUNNEL
+    user_masks = spec.masks(stage_dfs)
+    funnel_df, overall_conversion, user_sets = spec.journeys(stage_dfs, user_masks)
+    if n_resamples:
+        from bootstrap import funnel_intervals, with_intervals
+        interval = funnel_intervals(spec.pattern_counts(user_masks[1]), spec, n_resamples)
+        funnel_df, _ = with_intervals(funnel_df, interval)
+    return funnel_df, overall_conversion, user_sets
+
+def popcount(values):
+    """Number of set bits of every element of an unsigned integer array."""
+    values = np.asarray(values)
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values).astype(np.int64)
+    # numpy < 2.0: soma dos bits de cada byte
+    as_bytes = values.astype('<u8')[..., None].view(np.uint8)
+    return np.unpackbits(as_bytes, axis=-1).sum(axis=-1).astype(np.int64)
+
+def pattern_table(pattern_counts, spec=None):
+    """
+    One row per stage pattern (which stages a user hit, in any order):
+    Pattern (bitmask), Stages ('Home + Search'), Steps_Completed, Users and
+    Share (% of users seen in any stage). Pattern 0 (no stage) is left out.
+    """
+    spec = spec or DEFAULT_FUNNEL
+    pattern_counts = np.asarray(pattern_counts, dtype=np.int64)
+    patterns = np.arange(1, spec.n_patterns)
+    total = pattern_counts[1:].sum()
+
+    stages = [
+        ' + '.join(label for i, label in enumerate(spec.labels) if pattern >> i & 1)
+        for pattern in patterns.tolist()
+    ]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        share = np.where(total > 0, pattern_counts[1:] / total * 100, 0)
+    return pd.DataFrame({
+        'Pattern': patterns,
+        'Stages': stages,
+        'Steps_Completed': popcount(patterns),
+        'Users': pattern_counts[1:],
+        'Share': np.round(share, 2)
+    })
+
+def funnel_depth(*stage_dfs, spec=None):
+    """
+    How deep every user got, from the per-user stage bitmasks: (depth_df,
+    pattern_df). depth_df has Steps_Completed (1..n stages) and Users, a
+    bincount of the popcount of each mask; pattern_df is the full
+    stage-combination histogram (see pattern_table).
+    """
+    spec = spec or DEFAULT_FUNNEL
+    _, masks = spec.masks(stage_dfs)
+    depths = np.bincount(popcount(masks), minlength=len(spec.stages) + 1)
+
+    depth_df = pd.DataFrame({
+        'Steps_Completed': np.arange(1, len(spec.stages) + 1),
+        'Users': depths[1:]
+    })
+    return depth_df, pattern_table(spec.pattern_counts(masks), spec)
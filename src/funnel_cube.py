@@ -0,0 +1,252 @@
+import pandas as pd
+import numpy as np
+import os
+import hashlib
+from utils import PROCESSED_DIR, _replace_atomically
+from analysis import build_analysis_results
+from funnel_spec import DEFAULT_FUNNEL, gather
+from user_index import USER_TYPES
+
+CUBE_PATH = os.path.join(PROCESSED_DIR, 'funnel_cube.parquet')
+
+DIMENSIONS = ['device', 'sex', 'user_type']
+
+def cube_path(spec=None):
+    """Cube file of a funnel spec: funnel_cube.parquet for the default funnel, one file per custom spec."""
+    spec = spec or DEFAULT_FUNNEL
+    if spec.key == DEFAULT_FUNNEL.key:
+        return CUBE_PATH
+    digest = hashlib.blake2b(repr(spec.key).encode(), digest_size=6).hexdigest()
+    return os.path.join(PROCESSED_DIR, f'funnel_cube-{digest}.parquet')
+
+def pattern_columns(spec):
+    return [f"pattern_{i}" for i in range(spec.n_patterns)]
+
+def row_columns(spec):
+    return [f"rows_{stage}" for stage in spec.names]
+
+class FunnelCube:
+    """
+    Per-stage user counts for every combination of signup date, device, sex
+    and user type. Each cell stores a histogram of stage patterns (one bin
+    per combination of the spec stages) and the event rows of its users, so
+    any slice or marginal is a sum over a few hundred cells instead of a
+    pass over the events.
+
+    Users that only appear in the page tables (not in user_df) live in cells
+    with known=False and missing dimensions; they count in the overall
+    funnel only.
+    """
+
+    def __init__(self, dates, known, codes, categories, patterns, rows, days_threshold=7, spec=None):
+        self.dates = dates
+        self.known = known
+        self.codes = codes
+        self.categories = categories
+        self.patterns = patterns
+        self.rows = rows
+        self.days_threshold = days_threshold
+        self.spec = spec or DEFAULT_FUNNEL
+
+    @classmethod
+    def build(cls, *tables, spec=None, days_threshold=7):
+        """
+        Cube of the stage tables (in spec order) followed by user_df, e.g.
+        build(home_df, search_df, payment_df, confirmation_df, user_df).
+        """
+        spec = spec or DEFAULT_FUNNEL
+        *stage_dfs, user_df = tables
+        users = user_df[~user_df['user_id'].duplicated()]
+        user_ids = users['user_id'].to_numpy(dtype=np.int64)
+
+        dates = pd.to_datetime(users['date'], errors='coerce')
+        cutoff = dates.max() - pd.Timedelta(days=days_threshold)
+        user_type = np.where(dates >= cutoff, 0, np.where(dates < cutoff, 1, -1))
+
+        codes = {}
+        categories = {}
+        for dim in ['device', 'sex']:
+            codes[dim], uniques = pd.factorize(users[dim])
+            categories[dim] = list(uniques)
+        codes['user_type'] = user_type
+        categories['user_type'] = list(USER_TYPES)
+
+        # usuarios que so aparecem nas tabelas de eventos
+        stage_ids, masks = spec.masks(stage_dfs)
+        event_only = np.setdiff1d(stage_ids, user_ids)
+
+        all_ids = np.concatenate([user_ids, event_only])
+        groups = pd.DataFrame({
+            'known': np.concatenate([np.ones(len(user_ids), dtype=bool), np.zeros(len(event_only), dtype=bool)]),
+            'date': np.concatenate([
+                dates.to_numpy(dtype='datetime64[ns]'), np.full(len(event_only), np.datetime64('NaT'), dtype='datetime64[ns]')
+            ]),
+            **{dim: np.concatenate([codes[dim], np.full(len(event_only), -1)]) for dim in DIMENSIONS},
+            'mask': gather(stage_ids, masks, all_ids).astype(np.int64),
+            'users': 1
+        })
+        for column, df in zip(row_columns(spec), stage_dfs):
+            ids, counts = np.unique(df['user_id'].to_numpy(dtype=np.int64), return_counts=True)
+            groups[column] = gather(ids, counts, all_ids)
+        return cls.from_groups(groups, categories, spec=spec, days_threshold=days_threshold)
+
+    @classmethod
+    def from_groups(cls, groups, categories, spec=None, days_threshold=7):
+        """
+        Cube from pre-aggregated user groups: one row per (known, date,
+        device, sex, user_type, mask) with the number of users in 'users'
+        and their event rows in one rows_<stage> column per stage.
+        Dimensions are codes into `categories` (-1 when missing). Used by
+        build and by the SQLite backend, which aggregates in SQL.
+        """
+        spec = spec or DEFAULT_FUNNEL
+        groups = groups.copy()
+        # as celulas sao por dia de cadastro, mesmo que 'date' traga horario
+        groups['date'] = pd.to_datetime(groups['date']).dt.normalize()
+
+        cell_ids = groups.groupby(['known', 'date'] + DIMENSIONS, dropna=False, sort=True).ngroup().to_numpy()
+        n_cells = cell_ids.max() + 1 if len(cell_ids) else 0
+        first = pd.Series(np.arange(len(cell_ids))).groupby(cell_ids).first().to_numpy()
+
+        users = groups['users'].to_numpy(dtype=np.int64)
+        patterns = np.bincount(
+            cell_ids * spec.n_patterns + groups['mask'].to_numpy(dtype=np.int64),
+            weights=users, minlength=n_cells * spec.n_patterns
+        ).reshape(n_cells, spec.n_patterns)
+
+        rows = np.zeros((n_cells, len(spec.names)), dtype=np.int64)
+        for i, column in enumerate(row_columns(spec)):
+            rows[:, i] = np.bincount(cell_ids, weights=groups[column].to_numpy(dtype=np.int64), minlength=n_cells)
+
+        return cls(
+            groups['date'].to_numpy(dtype='datetime64[ns]')[first], groups['known'].to_numpy(dtype=bool)[first],
+            {dim: groups[dim].to_numpy(dtype=np.int64)[first] for dim in DIMENSIONS},
+            categories, patterns.astype(np.int64), rows, days_threshold, spec
+        )
+
+    def _selection(self, filters):
+        selected = np.ones(len(self.dates), dtype=bool)
+        for dim, value in filters.items():
+            if dim == 'date':
+                start, end = value if isinstance(value, (tuple, list)) else (value, value)
+                # o dia final entra inteiro: ate o inicio do dia seguinte
+                start = pd.Timestamp(start).normalize()
+                end = pd.Timestamp(end).normalize() + pd.Timedelta(days=1)
+                selected &= (self.dates >= np.datetime64(start, 'ns')) & (self.dates < np.datetime64(end, 'ns'))
+            elif dim in self.codes:
+                values = value if isinstance(value, (list, tuple, set)) else [value]
+                wanted = [self.categories[dim].index(v) for v in values if v in self.categories[dim]]
+                selected &= np.isin(self.codes[dim], wanted)
+            else:
+                raise ValueError(f"Unknown cube dimension: {dim}")
+        return selected
+
+    def rollup(self, **filters):
+        """
+        Sum the cells matching the filters, e.g. rollup(device='Mobile',
+        sex='Female', date=('2015-02-01', '2015-02-28')). Values can be a
+        single value or a list; date takes one day or an inclusive range.
+        Returns (pattern_counts, rows_per_stage).
+        """
+        selected = self._selection(filters)
+        return self.patterns[selected].sum(axis=0), self.rows[selected].sum(axis=0)
+
+    def _funnel_at(self, selected):
+        patterns = self.patterns[selected].sum(axis=0)
+        rows = self.rows[selected].sum(axis=0)
+        funnel_df, overall_conversion = self.spec.funnel(patterns)
+        return {
+            'funnel_df': funnel_df,
+            'overall_conversion': overall_conversion,
+            'counts': {stage: int(rows[i]) for i, stage in enumerate(self.spec.names)}
+        }
+
+    def funnel(self, **filters):
+        return self._funnel_at(self._selection(filters))
+
+    def marginal(self, dimension, **filters):
+        """
+        One funnel per value of `dimension` (same layout as
+        segment_by_attribute), within the cells matching the filters. Values
+        left without cells by the filters are skipped.
+        """
+        selected = self._selection(filters)
+        marginal = {}
+        for code, value in enumerate(self.categories[dimension]):
+            cells = selected & (self.codes[dimension] == code)
+            if cells.any() or not filters:
+                marginal[value] = self._funnel_at(cells)
+        return marginal
+
+    def user_count(self, **filters):
+        # usuarios fora de user_df nao entram na contagem de usuarios
+        selected = self._selection(filters) & self.known
+        return int(self.patterns[selected].sum())
+
+    def date_range(self):
+        """First and last signup day in the cube."""
+        dates = self.dates[~np.isnat(self.dates)]
+        return pd.Timestamp(dates.min()), pd.Timestamp(dates.max())
+
+    def analysis_results(self, **filters):
+        """
+        perform_funnel_analysis rebuilt from the cube, restricted to the
+        cells matching the filters (see rollup). The cost depends on the
+        number of cells only, so any filter combination is a few small sums.
+        """
+        selected = self._selection(filters)
+        patterns = self.patterns[selected].sum(axis=0)
+        funnel_df, overall_conversion = self.spec.funnel(patterns)
+        drop_off_df = self.spec.drop_off(patterns)
+        user_type = self.codes['user_type']
+        new = self._funnel_at(selected & (user_type == 0))
+        existing = self._funnel_at(selected & (user_type == 1))
+        known = selected & self.known
+        return build_analysis_results(
+            funnel_df, overall_conversion, drop_off_df,
+            self.marginal('device', **filters), self.marginal('sex', **filters),
+            new['funnel_df'], new['overall_conversion'], existing['funnel_df'], existing['overall_conversion'],
+            int(self.patterns[known].sum()),
+            int(self.patterns[known & (user_type == 0)].sum()),
+            int(self.patterns[known & (user_type == 1)].sum())
+        )
+
+    def to_frame(self):
+        df = pd.DataFrame({'known': self.known, 'date': self.dates})
+        for dim in DIMENSIONS:
+            df[dim] = pd.Categorical.from_codes(self.codes[dim], categories=self.categories[dim])
+        df[pattern_columns(self.spec)] = self.patterns
+        df[row_columns(self.spec)] = self.rows
+        return df
+
+    def save(self, fingerprint, path=None):
+        """
+        Write the cube next to the processed data (see cube_path), tagged
+        with the data fingerprint and the funnel spec it was built from.
+        """
+        path = path or cube_path(self.spec)
+        df = self.to_frame()
+        df.attrs['days_threshold'] = self.days_threshold
+        df.attrs['fingerprint'] = fingerprint
+        df.attrs['spec'] = repr(self.spec.key)
+        # temporario unico: duas sessoes podem salvar o cubo ao mesmo tempo
+        _replace_atomically(path, lambda tmp_path: df.to_parquet(tmp_path, index=False))
+
+    @classmethod
+    def load(cls, fingerprint, path=None, spec=None):
+        """
+        Read a saved cube; a cube built from other data (another fingerprint)
+        or for another funnel spec raises ValueError.
+        """
+        spec = spec or DEFAULT_FUNNEL
+        path = path or cube_path(spec)
+        df = pd.read_parquet(path)
+        if df.attrs.get('fingerprint') != fingerprint or df.attrs.get('spec') != repr(spec.key):
+            raise ValueError(f"Stale funnel cube in {path}")
+        codes = {dim: df[dim].cat.codes.to_numpy().astype(np.int64) for dim in DIMENSIONS}
+        categories = {dim: list(df[dim].cat.categories) for dim in DIMENSIONS}
+        return cls(
+            df['date'].to_numpy(dtype='datetime64[ns]'), df['known'].to_numpy(), codes, categories,
+            df[pattern_columns(spec)].to_numpy(dtype=np.int64), df[row_columns(spec)].to_numpy(dtype=np.int64),
+            df.attrs.get('days_threshold', 7), spec
+        )
@@ -0,0 +1,221 @@
+import pandas as pd
+import numpy as np
+import os
+from utils import PROCESSED_DIR, TABLE_FILES, read_table, LazyDict
+from user_set import UserSet
+
+# o histograma de padroes tem 2**n posicoes por segmento
+MAX_STAGES = 16
+
+class FunnelStage:
+    """
+    One funnel step: its name, the table its users come from (a key of
+    TABLE_FILES or a CSV file name under data/processed) and, optionally,
+    its own strict/loose link to the previous step.
+    """
+
+    def __init__(self, name, table=None, label=None, strict=None):
+        self.name = name
+        self.table = table or name
+        self.label = label or name.replace('_', ' ').title()
+        self.strict = strict
+
+    def __repr__(self):
+        return f"FunnelStage({self.name!r}, table={self.table!r})"
+
+class FunnelSpec:
+    """
+    Ordered funnel stages compiled into one vectorized plan.
+
+    Every user gets a single bitmask with one bit per stage, built from one
+    concatenation of all stage tables, and every count of the funnel is a
+    product of the pattern histogram with a 0/1 matrix fixed at compile
+    time. Adding a stage adds a bit, not another pass over the data.
+
+    A loose step counts users seen in the previous stage and in this one
+    (the original pairwise funnel); a strict step counts users who reached
+    every earlier step as well.
+    """
+
+    def __init__(self, stages, strict=False):
+        stages = [stage if isinstance(stage, FunnelStage) else FunnelStage(stage) for stage in stages]
+        if not 2 <= len(stages) <= MAX_STAGES:
+            raise ValueError(f"A funnel needs between 2 and {MAX_STAGES} stages, got {len(stages)}")
+        names = [stage.name for stage in stages]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Duplicated stage names in {names}")
+
+        self.stages = stages
+        self.strict = strict
+        self.names = names
+        self.labels = [stage.label for stage in stages]
+        self.step_labels = [f"{a} to {b}" for a, b in zip(self.labels, self.labels[1:])]
+        self.n_patterns = 1 << len(stages)
+        self.mask_dtype = np.uint8 if len(stages) <= 8 else np.uint16
+        self.bits = {name: 1 << i for i, name in enumerate(names)}
+        self._compile()
+
+    def _compile(self):
+        # bits exigidos para contar um usuario em cada etapa
+        required = []
+        for i, stage in enumerate(self.stages):
+            bits = 1 << i
+            if i > 0:
+                strict = self.strict if stage.strict is None else stage.strict
+                bits |= required[-1] if strict else 1 << (i - 1)
+            required.append(bits)
+        required = np.array(required)
+        # base do drop-off de cada passo: o que o passo seguinte exige, menos a propria etapa
+        step_from = required[1:] & ~(1 << np.arange(1, len(required)))
+
+        patterns = np.arange(self.n_patterns)[:, None]
+        self.required = required
+        self.reached_matrix = ((patterns & required) == required).astype(np.int64)
+        self.step_from_matrix = ((patterns & step_from) == step_from).astype(np.int64)
+
+    @property
+    def key(self):
+        """Hashable description of the spec, for cache keys."""
+        return tuple(
+            (stage.name, stage.table, stage.label, self.strict if stage.strict is None else stage.strict)
+            for stage in self.stages
+        )
+
+    def __repr__(self):
+        return f"FunnelSpec({' -> '.join(self.names)}, strict={self.strict})"
+
+    @property
+    def table_files(self):
+        """CSV file name (under data/processed) of every stage, in spec order."""
+        return [TABLE_FILES.get(stage.table, stage.table) for stage in self.stages]
+
+    def stage_tables(self, tables, data_dir=PROCESSED_DIR, use_cache=True):
+        """
+        Stage DataFrames in spec order. Tables missing from `tables` (a dict
+        keyed by table name) are read from data_dir.
+        """
+        stage_dfs = []
+        for stage, file_name in zip(self.stages, self.table_files):
+            if stage.table not in tables:
+                tables[stage.table] = read_table(os.path.join(data_dir, file_name), use_cache=use_cache)
+            stage_dfs.append(tables[stage.table])
+        return stage_dfs
+
+    def _check(self, stage_dfs):
+        if len(stage_dfs) != len(self.stages):
+            raise ValueError(f"{self!r} expects {len(self.stages)} stage tables, got {len(stage_dfs)}")
+
+    def masks(self, stage_dfs):
+        """
+        Map every user seen in any stage to a dense position (sorted user ids)
+        and one stage bitmask per user.
+        """
+        self._check(stage_dfs)
+        stage_ids = [pd.unique(df['user_id'].to_numpy(dtype=np.int64)) for df in stage_dfs]
+        user_ids, positions = np.unique(np.concatenate(stage_ids), return_inverse=True)
+
+        masks = np.zeros(len(user_ids), dtype=self.mask_dtype)
+        start = 0
+        for i, ids in enumerate(stage_ids):
+            masks[positions[start:start + len(ids)]] |= self.mask_dtype(1 << i)
+            start += len(ids)
+        return user_ids, masks
+
+    def pattern_counts(self, masks):
+        return np.bincount(masks, minlength=self.n_patterns)
+
+    def stage_users(self, pattern_counts):
+        """Users counted at each stage; works on one histogram or a stack of them."""
+        return np.asarray(pattern_counts) @ self.reached_matrix
+
+    def funnel(self, pattern_counts):
+        """(funnel_df, overall_conversion) in the layout of utils.build_funnel_df."""
+        return self.funnel_from_users(self.stage_users(pattern_counts).tolist())
+
+    def funnel_from_users(self, users):
+        """Same as funnel(), from the users counted at each stage."""
+        rates = [100.0]
+        for previous, current in zip(users, users[1:]):
+            rates.append(round(current / previous * 100, 2) if previous > 0 else 0)
+
+        funnel_df = pd.DataFrame({'Stage': self.labels, 'Users': users})
+        funnel_df['Conversion_Rate'] = rates
+        funnel_df['Drop_Off_Rate'] = [0] + [round(100 - rate, 2) for rate in rates[1:]]
+
+        overall_conversion = round(users[-1] / users[0] * 100, 2) if users[0] > 0 else 0
+        return funnel_df, overall_conversion
+
+    def drop_off(self, pattern_counts):
+        """Drop-off between consecutive steps: Stage, Drop_Off_Count and Drop_Off_Percentage."""
+        pattern_counts = np.asarray(pattern_counts)
+        step_from = (pattern_counts @ self.step_from_matrix).tolist()
+        step_to = self.stage_users(pattern_counts).tolist()[1:]
+
+        drop_off_df = pd.DataFrame({
+            'Stage': self.step_labels,
+            'Drop_Off_Count': [start - end for start, end in zip(step_from, step_to)]
+        })
+        drop_off_df['Drop_Off_Percentage'] = [
+            round((start - end) / start * 100, 2) if start > 0 else 0
+            for start, end in zip(step_from, step_to)
+        ]
+        return drop_off_df
+
+    def journeys(self, stage_dfs, user_masks=None):
+        """
+        (funnel_df, overall_conversion, user_sets) as calculate_user_journeys:
+        '<stage>_users' for each stage and '<previous>_to_<stage>' for each
+        step, as UserSet. The sets are only built when read. `user_masks`
+        reuses a (user_ids, masks) pair already computed by masks().
+        """
+        user_ids, masks = user_masks if user_masks is not None else self.masks(stage_dfs)
+        funnel_df, overall_conversion = self.funnel(self.pattern_counts(masks))
+
+        def user_set(bits):
+            return lambda: UserSet.from_sorted(user_ids[(masks & bits) == bits])
+
+        factories = {f"{name}_users": user_set(1 << i) for i, name in enumerate(self.names)}
+        for i, (previous, name) in enumerate(zip(self.names, self.names[1:]), start=1):
+            factories[f"{previous}_to_{name}"] = user_set(int(self.required[i]))
+        return funnel_df, overall_conversion, LazyDict(factories)
+
+    def segment_patterns(self, stage_dfs, segment_user_ids, segment_codes, n_segments):
+        """
+        Stage-pattern histograms and event row counts for every segment at once.
+
+        segment_user_ids/segment_codes label users with a segment code in
+        [0, n_segments) (-1 = no segment). Returns (patterns, rows) with shapes
+        (n_segments, 2**n_stages) and (n_segments, n_stages).
+        """
+        segment_user_ids = np.asarray(segment_user_ids, dtype=np.int64)
+        segment_codes = np.asarray(segment_codes)
+        valid = segment_codes >= 0
+        codes = segment_codes[valid]
+
+        user_ids, masks = self.masks(stage_dfs)
+        user_masks = gather(user_ids, masks, segment_user_ids)[valid]
+        patterns = np.bincount(
+            codes * self.n_patterns + user_masks, minlength=n_segments * self.n_patterns
+        ).reshape(n_segments, self.n_patterns)
+
+        rows = np.zeros((n_segments, len(self.stages)), dtype=np.int64)
+        for i, df in enumerate(stage_dfs):
+            stage_ids, stage_rows = np.unique(df['user_id'].to_numpy(dtype=np.int64), return_counts=True)
+            user_rows = gather(stage_ids, stage_rows, segment_user_ids)[valid]
+            rows[:, i] = np.bincount(codes, weights=user_rows, minlength=n_segments).astype(np.int64)
+
+        return patterns, rows
+
+def gather(sorted_ids, values, ids, default=0):
+    # valor de cada id em `ids`, buscando por searchsorted nos ids ordenados
+    if len(sorted_ids) == 0:
+        return np.full(len(ids), default, dtype=values.dtype)
+    pos = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+    return np.where(sorted_ids[pos] == ids, values[pos], default)
+
+DEFAULT_FUNNEL = FunnelSpec([
+    FunnelStage('home'),
+    FunnelStage('search'),
+    FunnelStage('payment'),
+    FunnelStage('confirmation')
+])
@@ -0,0 +1,394 @@
+import pandas as pd
+import numpy as np
+import os
+import shutil
+import tempfile
+from utils import PROJECT_ROOT, PROCESSED_DIR, TABLE_FILES, read_table
+from analysis import build_analysis_results
+from funnel_spec import DEFAULT_FUNNEL
+
+STATE_PATH = os.path.join(PROJECT_ROOT, 'data', 'state', 'funnel_state')
+
+NEW_USER_DAYS = 7
+NAT = np.iinfo(np.int64).min
+DAY_NS = 24 * 60 * 60 * 10 ** 9
+
+SEGMENT_FIELDS = ['user_ids', 'masks', 'cells', 'row_counts']
+# dois segmentos vizinhos sao fundidos quando o mais antigo nao passa deste multiplo do mais novo
+MERGE_RATIO = 2
+# capacidade inicial das celulas; cresce dobrando
+CELL_CAPACITY = 64
+
+class FunnelState:
+    """
+    Persistent funnel state that can absorb daily batches of events and users.
+
+    Every known user keeps a stage bitmask, per-stage event row counts and,
+    for users from the user table, a cell (signup date, device, sex). Each
+    cell holds a histogram of stage patterns and the event rows of its
+    users, so analysis_results() depends on the number of cells only.
+
+    Users live in immutable sorted segments, one per batch, holding the
+    latest values of the users that batch touched (newer segments shadow
+    older ones). Segments are merged when their sizes get close, so there
+    are O(log users) of them and a batch costs its own size (amortized),
+    both in memory and on disk.
+
+    The stages follow `spec` (a FunnelSpec, default Home -> Search ->
+    Payment -> Confirmation); a saved state can only be reopened with a
+    spec of the same stages.
+    """
+
+    def __init__(self, spec=None):
+        self.spec = spec or DEFAULT_FUNNEL
+        n_patterns, n_stages = self.spec.n_patterns, len(self.spec.stages)
+        # segmentos do mais antigo ao mais novo; 'name' e a pasta em disco (None se ainda nao salvo)
+        self.segments = []
+        self.overall_patterns = np.zeros(n_patterns, dtype=np.int64)
+        self.total_users = 0
+
+        # uma linha por celula (data de cadastro, device, sexo), com capacidade de sobra
+        self.n_cells = 0
+        self._cell_keys = np.empty((CELL_CAPACITY, 3), dtype=np.int64)
+        self._cell_patterns = np.zeros((CELL_CAPACITY, n_patterns), dtype=np.int64)
+        self._cell_rows = np.zeros((CELL_CAPACITY, n_stages), dtype=np.int64)
+
+        # valores de device/sexo na ordem em que apareceram (mesma ordem de unique())
+        self.devices = []
+        self.sexes = []
+        self._cell_index = {}
+
+        # pasta de onde os segmentos foram lidos e segmentos fundidos a apagar no proximo save
+        self._path = None
+        self._next_segment = 0
+        self._dropped = []
+
+    @property
+    def cell_dates(self):
+        return self._cell_keys[:self.n_cells, 0]
+
+    @property
+    def cell_devices(self):
+        return self._cell_keys[:self.n_cells, 1]
+
+    @property
+    def cell_sexes(self):
+        return self._cell_keys[:self.n_cells, 2]
+
+    @property
+    def cell_patterns(self):
+        return self._cell_patterns[:self.n_cells]
+
+    @property
+    def cell_rows(self):
+        return self._cell_rows[:self.n_cells]
+
+    def _lookup(self, ids):
+        """Latest (masks, cells, row_counts, found) of the sorted unique ids, newest segment first."""
+        masks = np.zeros(len(ids), dtype=self.spec.mask_dtype)
+        cells = np.full(len(ids), -1, dtype=np.int64)
+        row_counts = np.zeros((len(ids), len(self.spec.stages)), dtype=np.int64)
+        found = np.zeros(len(ids), dtype=bool)
+
+        for segment in reversed(self.segments):
+            pending = np.flatnonzero(~found)
+            if len(pending) == 0:
+                break
+            segment_ids = segment['user_ids']
+            if len(segment_ids) == 0:
+                continue
+            wanted = ids[pending]
+            pos = np.minimum(np.searchsorted(segment_ids, wanted), len(segment_ids) - 1)
+            hit = segment_ids[pos] == wanted
+            at, pos = pending[hit], pos[hit]
+            masks[at] = segment['masks'][pos]
+            cells[at] = segment['cells'][pos]
+            row_counts[at] = segment['row_counts'][pos]
+            found[at] = True
+        return masks, cells, row_counts, found
+
+    def _encode(self, values, known):
+        codes = np.full(len(values), -1, dtype=np.int64)
+        for value in pd.unique(values[values.notna()]):
+            if value not in known:
+                known.append(value)
+            codes[(values == value).to_numpy()] = known.index(value)
+        return codes
+
+    def _grow_cells(self, n_new):
+        needed = self.n_cells + n_new
+        capacity = len(self._cell_keys)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in ['_cell_keys', '_cell_patterns', '_cell_rows']:
+            old = getattr(self, name)
+            grown = np.zeros((capacity, old.shape[1]), dtype=old.dtype)
+            grown[:self.n_cells] = old[:self.n_cells]
+            setattr(self, name, grown)
+
+    def _cell_ids(self, dates, devices, sexes):
+        keys = np.column_stack([dates, devices, sexes])
+        unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+
+        mapped = np.empty(len(unique_keys), dtype=np.int64)
+        new_keys = []
+        for i, key in enumerate(map(tuple, unique_keys.tolist())):
+            if key not in self._cell_index:
+                self._cell_index[key] = self.n_cells + len(new_keys)
+                new_keys.append(key)
+            mapped[i] = self._cell_index[key]
+
+        if new_keys:
+            self._grow_cells(len(new_keys))
+            self._cell_keys[self.n_cells:self.n_cells + len(new_keys)] = new_keys
+            self.n_cells += len(new_keys)
+        return mapped[inverse.ravel()]
+
+    def _add_users(self, user_df, batch):
+        ids_batch, masks, cells, row_counts = batch
+        user_df = user_df[~user_df['user_id'].duplicated()]
+        ids = user_df['user_id'].to_numpy(dtype=np.int64)
+        pos = np.searchsorted(ids_batch, ids)
+
+        already = cells[pos] >= 0
+        if already.any():
+            print(f"Warning: skipping {already.sum()} users already present in the state")
+            user_df = user_df[~already]
+            pos = pos[~already]
+
+        if len(pos) == 0:
+            return
+
+        dates = pd.to_datetime(user_df['date'], errors='coerce').to_numpy(dtype='datetime64[ns]').view(np.int64)
+        cell_ids = self._cell_ids(
+            dates,
+            self._encode(user_df['device'].astype(object), self.devices),
+            self._encode(user_df['sex'].astype(object), self.sexes)
+        )
+
+        # usuarios que ja tinham eventos passam a contar na sua celula
+        cells[pos] = cell_ids
+        np.add.at(self.cell_patterns, (cell_ids, masks[pos]), 1)
+        np.add.at(self.cell_rows, cell_ids, row_counts[pos])
+        self.total_users += len(pos)
+
+    def _add_events(self, stage, page_df, batch):
+        ids_batch, masks, cells, row_counts = batch
+        stage_index = self.spec.names.index(stage)
+        ids, counts = np.unique(page_df['user_id'].to_numpy(dtype=np.int64), return_counts=True)
+        pos = np.searchsorted(ids_batch, ids)
+
+        old = masks[pos]
+        new = old | self.spec.mask_dtype(self.spec.bits[stage])
+        masks[pos] = new
+        row_counts[pos, stage_index] += counts
+
+        np.add.at(self.overall_patterns, old, -1)
+        np.add.at(self.overall_patterns, new, 1)
+
+        user_cells = cells[pos]
+        in_table = user_cells >= 0
+        user_cells = user_cells[in_table]
+        np.add.at(self.cell_patterns, (user_cells, old[in_table]), -1)
+        np.add.at(self.cell_patterns, (user_cells, new[in_table]), 1)
+        np.add.at(self.cell_rows[:, stage_index], user_cells, counts[in_table])
+
+    def append(self, events=None, users=None):
+        """
+        Merge a batch into the state. `events` maps stage name (a name of
+        the spec, e.g. 'home') to a DataFrame or CSV path;
+        `users` is a user table DataFrame or CSV path. Only the users of the
+        batch are looked up and rewritten.
+        """
+        events = events or {}
+        for stage in events:
+            if stage not in self.spec.names:
+                raise ValueError(f"Unknown funnel stage: {stage}")
+        users = _as_frame(users) if users is not None else None
+        events = {stage: _as_frame(page_df) for stage, page_df in events.items()}
+
+        tables = ([users] if users is not None else []) + list(events.values())
+        if not tables:
+            return
+        ids = np.unique(np.concatenate([df['user_id'].to_numpy(dtype=np.int64) for df in tables]))
+        if len(ids) == 0:
+            return
+
+        masks, cells, row_counts, found = self._lookup(ids)
+        self.overall_patterns[0] += int((~found).sum())
+        batch = (ids, masks, cells, row_counts)
+
+        if users is not None:
+            self._add_users(users, batch)
+        for stage, page_df in events.items():
+            self._add_events(stage, page_df, batch)
+
+        self._push({'user_ids': ids, 'masks': masks, 'cells': cells, 'row_counts': row_counts, 'name': None})
+
+    def _push(self, segment):
+        self.segments.append(segment)
+        # segmentos de tamanhos parecidos sao fundidos: os tamanhos crescem geometricamente
+        while len(self.segments) > 1 and (
+            len(self.segments[-2]['user_ids']) <= MERGE_RATIO * len(self.segments[-1]['user_ids'])
+        ):
+            newer = self.segments.pop()
+            older = self.segments.pop()
+            self.segments.append(_merge_segments(older, newer))
+            for segment in (older, newer):
+                if segment['name'] is not None:
+                    self._dropped.append(segment['name'])
+
+    def _segments(self, cell_codes, values):
+        results = {}
+        for code, value in enumerate(values):
+            selected = cell_codes == code
+            funnel_df, overall_conversion = self.spec.funnel(self.cell_patterns[selected].sum(axis=0))
+            rows = self.cell_rows[selected].sum(axis=0)
+            results[value] = {
+                'funnel_df': funnel_df,
+                'overall_conversion': overall_conversion,
+                'counts': {stage: int(rows[i]) for i, stage in enumerate(self.spec.names)}
+            }
+        return results
+
+    def analysis_results(self):
+        """Same dict as perform_funnel_analysis, rebuilt from the cell aggregates."""
+        funnel_df, overall_conversion = self.spec.funnel(self.overall_patterns)
+        drop_off_df = self.spec.drop_off(self.overall_patterns)
+
+        valid = self.cell_dates != NAT
+        if not valid.any():
+            raise ValueError("Nenhuma data válida encontrada em user_df['date'].")
+        cutoff = self.cell_dates[valid].max() - NEW_USER_DAYS * DAY_NS
+        new_patterns = self.cell_patterns[valid & (self.cell_dates >= cutoff)].sum(axis=0)
+        existing_patterns = self.cell_patterns[valid & (self.cell_dates < cutoff)].sum(axis=0)
+
+        new_user_funnel, new_user_overall = self.spec.funnel(new_patterns)
+        existing_user_funnel, existing_user_overall = self.spec.funnel(existing_patterns)
+
+        return build_analysis_results(
+            funnel_df, overall_conversion, drop_off_df,
+            self._segments(self.cell_devices, self.devices),
+            self._segments(self.cell_sexes, self.sexes),
+            new_user_funnel, new_user_overall, existing_user_funnel, existing_user_overall,
+            self.total_users, int(new_patterns.sum()), int(existing_patterns.sum())
+        )
+
+    def save(self, path=STATE_PATH):
+        """
+        Write the segments not yet on disk, then the cell aggregates and the
+        segment list (atomically), then remove merged segments. A save after
+        one batch writes that batch and the cells, not the history.
+        """
+        os.makedirs(path, exist_ok=True)
+        if os.path.abspath(path) != self._path:
+            # outra pasta: todos os segmentos sao escritos nela e os que ja estavam la sao substituidos
+            existing = sorted(name for name in os.listdir(path) if name.startswith('segment-'))
+            if existing:
+                self._next_segment = max(self._next_segment, int(existing[-1].split('-')[1]) + 1)
+            for segment in self.segments:
+                segment['name'] = None
+            self._dropped = existing
+
+        for segment in self.segments:
+            if segment['name'] is None:
+                name = f"segment-{self._next_segment:06d}"
+                self._next_segment += 1
+                _write_segment(segment, os.path.join(path, name))
+                segment['name'] = name
+
+        tmp_path = os.path.join(path, 'state.tmp.npz')
+        np.savez(
+            tmp_path,
+            stages=np.array(self.spec.names, dtype=str),
+            segments=np.array([segment['name'] for segment in self.segments], dtype=str),
+            next_segment=np.array(self._next_segment),
+            overall_patterns=self.overall_patterns,
+            total_users=np.array(self.total_users),
+            cell_keys=self._cell_keys[:self.n_cells],
+            cell_patterns=self.cell_patterns, cell_rows=self.cell_rows,
+            devices=np.array(self.devices, dtype=str), sexes=np.array(self.sexes, dtype=str)
+        )
+        os.replace(tmp_path, os.path.join(path, 'state.npz'))
+
+        for name in self._dropped:
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+        self._dropped = []
+        self._path = os.path.abspath(path)
+
+    @classmethod
+    def load(cls, path=STATE_PATH, spec=None):
+        """Open a saved state; segments are memory-mapped, so only the pages a batch touches are read."""
+        state = cls(spec)
+        with np.load(os.path.join(path, 'state.npz')) as data:
+            if data['stages'].tolist() != state.spec.names:
+                raise ValueError(f"State in {path} was built for stages {data['stages'].tolist()}, not {state.spec.names}")
+            names = data['segments'].tolist()
+            state._next_segment = int(data['next_segment'])
+            state.overall_patterns = data['overall_patterns']
+            state.total_users = int(data['total_users'])
+            cell_keys = data['cell_keys']
+            state.n_cells = 0
+            state._grow_cells(len(cell_keys))
+            state.n_cells = len(cell_keys)
+            state._cell_keys[:state.n_cells] = cell_keys
+            state._cell_patterns[:state.n_cells] = data['cell_patterns']
+            state._cell_rows[:state.n_cells] = data['cell_rows']
+            state.devices = data['devices'].tolist()
+            state.sexes = data['sexes'].tolist()
+
+        state.segments = [_read_segment(os.path.join(path, name), name) for name in names]
+        state._cell_index = {key: i for i, key in enumerate(map(tuple, cell_keys.tolist()))}
+        state._path = os.path.abspath(path)
+        return state
+
+def _merge_segments(older, newer):
+    # o segmento mais novo vem primeiro: np.unique guarda a primeira ocorrencia, a versao mais recente
+    ids = np.concatenate([newer['user_ids'], older['user_ids']])
+    ids, first = np.unique(ids, return_index=True)
+    merged = {'user_ids': ids, 'name': None}
+    for field in SEGMENT_FIELDS[1:]:
+        merged[field] = np.concatenate([newer[field], older[field]])[first]
+    return merged
+
+def _write_segment(segment, path):
+    tmp_path = tempfile.mkdtemp(dir=os.path.dirname(path))
+    for field in SEGMENT_FIELDS:
+        np.save(os.path.join(tmp_path, f"{field}.npy"), np.asarray(segment[field]))
+    os.replace(tmp_path, path)
+
+def _read_segment(path, name):
+    segment = {field: np.load(os.path.join(path, f"{field}.npy"), mmap_mode='r') for field in SEGMENT_FIELDS}
+    segment['name'] = name
+    return segment
+
+def _as_frame(table):
+    if isinstance(table, pd.DataFrame):
+        return table
+    return pd.read_csv(table)
+
+def build_state(data_dir=PROCESSED_DIR, state_path=STATE_PATH, spec=None):
+    """Seed the state store from the full processed history."""
+    state = FunnelState(spec)
+    stage_dfs = state.spec.stage_tables({}, data_dir=data_dir)
+    state.append(
+        events=dict(zip(state.spec.names, stage_dfs)),
+        users=read_table(os.path.join(data_dir, TABLE_FILES['user']), date_columns=['date'])
+    )
+    state.save(state_path)
+    return state
+
+def append_batch(events=None, users=None, state_path=STATE_PATH, spec=None):
+    """
+    Merge one batch of new page events and users into the persisted state and
+    return the refreshed analysis_results, without reloading the history.
+    """
+    if os.path.exists(os.path.join(state_path, 'state.npz')):
+        state = FunnelState.load(state_path, spec)
+    else:
+        state = FunnelState(spec)
+    state.append(events=events, users=users)
+    state.save(state_path)
+    return state.analysis_results()
@@ -0,0 +1,133 @@
+import pandas as pd
+import os
+import json
+import argparse
+import time
+from utils import PROJECT_ROOT, PROCESSED_DIR, TABLE_FILES, file_fingerprint, content_hash
+
+RAW_DIR = os.path.join(PROJECT_ROOT, 'data', 'raw')
+MANIFEST_PATH = os.path.join(PROJECT_ROOT, 'data', 'pipeline_manifest.json')
+
+# mesmos passos de limpeza dos notebooks 01-05, em versao vetorizada
+def clean_page_table(df):
+    return df.drop_duplicates()
+
+def clean_user_table(df):
+    return df
+
+CLEANING_STEPS = {
+    'home': clean_page_table,
+    'search': clean_page_table,
+    'payment': clean_page_table,
+    'confirmation': clean_page_table,
+    'user': clean_user_table
+}
+
+# incrementar quando um passo de limpeza mudar, para forcar o rebuild
+STEP_VERSION = 1
+
+def load_manifest(path=MANIFEST_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def _raw_hash(raw_path, entry):
+    # so recalcula o hash quando tamanho ou mtime do arquivo bruto mudaram
+    current = file_fingerprint(raw_path)
+    if entry and current['size'] == entry.get('raw_size') and current['mtime_ns'] == entry.get('raw_mtime_ns'):
+        return entry['raw_hash']
+
+    raw_hash = content_hash(raw_path)
+    if entry and raw_hash == entry.get('raw_hash'):
+        # mesmo conteudo com novo mtime: atualiza para nao recalcular da proxima vez
+        entry['raw_size'] = current['size']
+        entry['raw_mtime_ns'] = current['mtime_ns']
+    return raw_hash
+
+def is_stale(name, manifest, raw_dir=RAW_DIR, processed_dir=PROCESSED_DIR):
+    entry = manifest.get(name)
+    raw_path = os.path.join(raw_dir, TABLE_FILES[name])
+    processed_path = os.path.join(processed_dir, TABLE_FILES[name])
+
+    if not entry or entry.get('step_version') != STEP_VERSION:
+        return True
+    if not os.path.exists(processed_path):
+        return True
+    if _raw_hash(raw_path, entry) != entry['raw_hash']:
+        return True
+    # arquivo processado editado a mao tambem conta como desatualizado
+    current = file_fingerprint(processed_path)
+    if current['size'] != entry.get('processed_size'):
+        return True
+    if current['mtime_ns'] != entry.get('processed_mtime_ns'):
+        return content_hash(processed_path) != entry['processed_hash']
+    return False
+
+def build_table(name, manifest, raw_dir=RAW_DIR, processed_dir=PROCESSED_DIR):
+    raw_path = os.path.join(raw_dir, TABLE_FILES[name])
+    processed_path = os.path.join(processed_dir, TABLE_FILES[name])
+
+    start = time.perf_counter()
+    raw_df = pd.read_csv(raw_path)
+    cleaned_df = CLEANING_STEPS[name](raw_df)
+
+    tmp_path = processed_path + '.tmp'
+    cleaned_df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, processed_path)
+
+    raw_fingerprint = file_fingerprint(raw_path)
+    processed_fingerprint = file_fingerprint(processed_path)
+    manifest[name] = {
+        'step_version': STEP_VERSION,
+        'raw_hash': content_hash(raw_path),
+        'raw_size': raw_fingerprint['size'],
+        'raw_mtime_ns': raw_fingerprint['mtime_ns'],
+        'processed_hash': content_hash(processed_path),
+        'processed_size': processed_fingerprint['size'],
+        'processed_mtime_ns': processed_fingerprint['mtime_ns'],
+        'rows_in': len(raw_df),
+        'rows_out': len(cleaned_df),
+        'seconds': round(time.perf_counter() - start, 3)
+    }
+    return manifest[name]
+
+def run_pipeline(tables=None, force=False, raw_dir=RAW_DIR, processed_dir=PROCESSED_DIR, manifest_path=MANIFEST_PATH):
+    """
+    Rebuild data/processed from data/raw, skipping every table whose raw
+    input and processed output still match the hashes in the manifest.
+    Returns {table: 'built' | 'skipped'}.
+    """
+    manifest = load_manifest(manifest_path)
+    status = {}
+
+    for name in tables or TABLE_FILES:
+        if not force and not is_stale(name, manifest, raw_dir, processed_dir):
+            status[name] = 'skipped'
+            print(f"{name}: up to date, skipped")
+            continue
+
+        entry = build_table(name, manifest, raw_dir, processed_dir)
+        # grava o manifesto a cada tabela, para nao perder progresso se algo falhar
+        save_manifest(manifest, manifest_path)
+        status[name] = 'built'
+        print(f"{name}: {entry['rows_in']} -> {entry['rows_out']} rows in {entry['seconds']}s")
+
+    save_manifest(manifest, manifest_path)
+    return status
+
+def main():
+    parser = argparse.ArgumentParser(description="Build data/processed from data/raw with hash-based skipping.")
+    parser.add_argument('--tables', nargs='+', choices=list(TABLE_FILES), help="only consider these tables")
+    parser.add_argument('--force', action='store_true', help="rebuild even if nothing changed")
+    args = parser.parse_args()
+    run_pipeline(tables=args.tables, force=args.force)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+import pandas as pd
+import numpy as np
+import os
+import sys
+import hashlib
+import threading
+from collections import OrderedDict
+from utils import PROCESSED_DIR, TABLE_FILES, file_fingerprint
+
+DEFAULT_MAX_BYTES = 1024 ** 3
+
+def data_fingerprint(data_dir=PROCESSED_DIR, extra_files=()):
+    """
+    Cheap fingerprint of the processed tables (name, size and mtime of each
+    file), plus any other files the analysis reads (e.g. the stage tables
+    of a custom FunnelSpec). Any rewrite of a source file changes it.
+    """
+    files = dict(TABLE_FILES)
+    for file_name in extra_files:
+        if file_name not in files.values():
+            files[file_name] = file_name
+
+    digest = hashlib.blake2b(digest_size=16)
+    for name, file_name in sorted(files.items()):
+        path = os.path.join(data_dir, file_name)
+        if not os.path.exists(path):
+            # arquivo ausente tambem entra na chave; a leitura e que vai reportar o erro
+            digest.update(f"{name}:missing;".encode())
+            continue
+        fingerprint = file_fingerprint(path)
+        digest.update(f"{name}:{fingerprint['size']}:{fingerprint['mtime_ns']};".encode())
+    return digest.hexdigest()
+
+def estimate_size(value, _seen=None):
+    """
+    Approximate memory held by a cached value, in bytes. Plain objects (e.g.
+    FunnelCube, UserSet, LazyDict) are measured through their attributes;
+    values reachable twice are counted once.
+    """
+    if value is None:
+        return 0
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(index=True, deep=True)
+        return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            estimate_size(k, _seen) + estimate_size(v, _seen) for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(item, _seen) for item in value)
+    if isinstance(value, (set, frozenset)):
+        # evita percorrer conjuntos enormes: ~28 bytes por int mais a tabela hash
+        return sys.getsizeof(value) + 28 * len(value)
+    if callable(value):
+        # classes e funcoes (ex.: np.uint8 guardado como dtype) nao sao dados do resultado
+        return sys.getsizeof(value)
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    if hasattr(value, '__dict__'):
+        # objetos simples: o que pesa sao os arrays e tabelas guardados nos atributos
+        return sys.getsizeof(value) + estimate_size(vars(value), _seen)
+    return sys.getsizeof(value)
+
+class ResultCache:
+    """
+    Thread-safe LRU cache for loaded tables and analysis products, bounded by
+    an approximate memory budget. Meant to be created once per process (e.g.
+    via st.cache_resource) and shared by every session.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+    def put(self, key, value):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            print(f"Not caching {key}: {size} bytes exceeds the cache budget")
+            return value
+
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._sizes.pop(key)
+                del self._entries[key]
+            self._entries[key] = value
+            self._sizes[key] = size
+            self.total_bytes += size
+
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, _ = self._entries.popitem(last=False)
+                self.total_bytes -= self._sizes.pop(old_key)
+                self.evictions += 1
+        return value
+
+    def get_or_compute(self, key, compute):
+        """
+        Return the cached value for key, computing it once if missing. Sessions
+        asking for the same key at the same time wait for a single computation.
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            return value
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            value = self.get(key, missing)
+            if value is not missing:
+                return value
+            with self._lock:
+                self.misses += 1
+            value = self.put(key, compute())
+
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return value
+
+    def discard(self, key):
+        with self._lock:
+            if key in self._entries:
+                del self._entries[key]
+                self.total_bytes -= self._sizes.pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
@@ -0,0 +1,126 @@
+import pandas as pd
+import numpy as np
+import sys
+
+# Valor constante da coluna 'page' em cada tabela de eventos
+PAGE_VALUES = {
+    'home': 'home_page',
+    'search': 'search_page',
+    'payment': 'payment_page',
+    'confirmation': 'payment_confirmation_page'
+}
+
+ID_COLUMNS = ['user_id']
+
+CATEGORICAL_COLUMNS = {
+    'user': ['device', 'sex']
+}
+
+UNSIGNED_DTYPES = [np.uint8, np.uint16, np.uint32, np.uint64]
+
+# tipo usado na leitura dos ids; compact_table ainda reduz para o menor que couber
+PARSE_ID_DTYPE = 'uint32'
+
+def parse_dtypes(table_name):
+    """
+    dtype mapping for pd.read_csv, so the compact types are used while the
+    CSV is parsed instead of after a full-width read.
+    """
+    dtypes = {column: PARSE_ID_DTYPE for column in ID_COLUMNS}
+    dtypes.update({column: 'category' for column in CATEGORICAL_COLUMNS.get(table_name, [])})
+    if table_name in PAGE_VALUES:
+        dtypes['page'] = 'category'
+    return dtypes
+
+def smallest_unsigned_dtype(values):
+    """
+    Return the narrowest unsigned integer dtype that holds every value,
+    or None when the column has nulls or negatives and must stay as is.
+    """
+    if len(values) == 0 or values.isna().any():
+        return None
+    if not pd.api.types.is_integer_dtype(values) or values.min() < 0:
+        return None
+
+    max_value = values.max()
+    for dtype in UNSIGNED_DTYPES:
+        if max_value <= np.iinfo(dtype).max:
+            return dtype
+    return None
+
+def compact_table(df, table_name):
+    """
+    Apply the declared schema to one table: downcast ids, turn low-cardinality
+    strings into categoricals and move the constant 'page' column to df.attrs.
+    """
+    df = df.copy()
+
+    for column in ID_COLUMNS:
+        if column in df.columns:
+            dtype = smallest_unsigned_dtype(df[column])
+            if dtype is not None:
+                df[column] = df[column].astype(dtype)
+
+    for column in CATEGORICAL_COLUMNS.get(table_name, []):
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+
+    if 'page' in df.columns:
+        pages = df['page'].unique()
+        if len(pages) == 1:
+            df = df.drop(columns='page')
+            df.attrs['page'] = pages[0]
+        else:
+            print(f"Warning: 'page' column in {table_name} is not constant, keeping it as category")
+            df['page'] = df['page'].astype('category')
+    elif table_name in PAGE_VALUES:
+        df.attrs['page'] = PAGE_VALUES[table_name]
+
+    return df
+
+def table_memory(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+# largura de cada celula da tabela como o read_csv padrao a monta: int64/float64/datetime64 e ponteiros de objeto
+FULL_WIDTH_BYTES = 8
+
+def _object_bytes(values):
+    # ponteiro por linha mais o tamanho de cada objeto, como memory_usage(deep=True)
+    return FULL_WIDTH_BYTES * len(values) + sum(sys.getsizeof(value) for value in values)
+
+def full_width_memory(df):
+    """
+    Memory the table would take with the default read_csv types (int64 ids,
+    object strings, the 'page' column kept), computed from the compact table
+    so the wide one never has to be built.
+    """
+    total = int(df.index.memory_usage())
+    for column in df.columns:
+        values = df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            counts = values.value_counts(dropna=False)
+            total += FULL_WIDTH_BYTES * len(values) + sum(
+                int(count) * sys.getsizeof(np.nan if pd.isna(value) else value) for value, count in counts.items()
+            )
+        elif pd.api.types.is_numeric_dtype(values) or pd.api.types.is_datetime64_any_dtype(values):
+            total += FULL_WIDTH_BYTES * len(values)
+        else:
+            total += _object_bytes(values.tolist())
+    if 'page' not in df.columns and 'page' in df.attrs:
+        total += len(df) * (FULL_WIDTH_BYTES + sys.getsizeof(df.attrs['page']))
+    return total
+
+def memory_report(tables):
+    """Before (default read_csv types) and after (compact schema) memory of every table."""
+    rows = []
+    for name, df in tables.items():
+        before_bytes = full_width_memory(df)
+        after_bytes = table_memory(df)
+        rows.append({
+            'Table': name,
+            'Rows': len(df),
+            'Before_MB': round(before_bytes / 1024 ** 2, 3),
+            'After_MB': round(after_bytes / 1024 ** 2, 3),
+            'Reduction_%': round((1 - after_bytes / before_bytes) * 100, 2) if before_bytes > 0 else 0
+        })
+    return pd.DataFrame(rows)
@@ -0,0 +1,123 @@
+import pandas as pd
+import numpy as np
+import math
+
+DEFAULT_ALPHA = 0.05
+CORRECTIONS = ('fdr_bh', 'holm', 'bonferroni')
+
+# erfc elemento a elemento (sem depender do scipy)
+_erfc = np.frompyfunc(math.erfc, 1, 1)
+
+# dimensoes de analysis_results e a chave do funil em cada uma
+DIMENSIONS = {'device': 'funnel_df', 'gender': 'funnel_df', 'user_type': 'funnel'}
+
+def two_proportion_z(successes_a, trials_a, successes_b, trials_b):
+    """
+    Pooled two-proportion z-test, element-wise over arrays of any shape.
+    Returns (z, p_value); the two-sided p-value equals the one of the 2x2
+    chi-square test without continuity correction (chi2 = z**2). Pairs
+    where a side has no trials get z = 0 and p = 1.
+    """
+    successes_a, trials_a = np.asarray(successes_a, dtype=float), np.asarray(trials_a, dtype=float)
+    successes_b, trials_b = np.asarray(successes_b, dtype=float), np.asarray(trials_b, dtype=float)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate_a = successes_a / trials_a
+        rate_b = successes_b / trials_b
+        pooled = (successes_a + successes_b) / (trials_a + trials_b)
+        se = np.sqrt(pooled * (1 - pooled) * (1 / trials_a + 1 / trials_b))
+        z = (rate_a - rate_b) / se
+
+    z = np.where(np.isfinite(z), z, 0.0)
+    p_value = np.asarray(_erfc(np.abs(z) / math.sqrt(2)), dtype=float)
+    return z, p_value
+
+def adjust_pvalues(p_values, method='fdr_bh'):
+    """Multiple-comparison correction over a flat family of p-values."""
+    if method not in CORRECTIONS:
+        raise ValueError(f"Unknown correction: {method}. Use one of {CORRECTIONS}")
+    p_values = np.asarray(p_values, dtype=float)
+    n = len(p_values)
+    if n == 0:
+        return p_values
+
+    if method == 'bonferroni':
+        return np.minimum(p_values * n, 1.0)
+
+    order = np.argsort(p_values)
+    ranked = p_values[order]
+    if method == 'holm':
+        adjusted = np.maximum.accumulate(ranked * (n - np.arange(n)))
+    else:
+        # Benjamini-Hochberg: minimo acumulado de tras para frente
+        adjusted = np.minimum.accumulate((ranked * n / np.arange(1, n + 1))[::-1])[::-1]
+
+    result = np.empty(n)
+    result[order] = np.minimum(adjusted, 1.0)
+    return result
+
+def _funnel_counts(segments, funnel_key):
+    # usuarios por etapa de cada segmento: matriz (segmentos, etapas)
+    labels = list(segments.keys())
+    users = np.array([segments[label][funnel_key]['Users'].to_numpy() for label in labels], dtype=np.int64)
+    stages = segments[labels[0]][funnel_key]['Stage'].tolist() if labels else []
+    return labels, stages, users
+
+def segment_pair_tests(segments, funnel_key='funnel_df'):
+    """
+    z-tests of every step conversion and of the overall conversion for
+    every pair of segment values, in one vectorized pass. Returns one row
+    per (pair, metric) with uncorrected p-values.
+    """
+    labels, stages, users = _funnel_counts(segments, funnel_key)
+    if len(labels) < 2:
+        return pd.DataFrame(columns=['Segment_A', 'Segment_B', 'Metric', 'Rate_A', 'Rate_B', 'Difference', 'Z', 'P_Value'])
+
+    # sucessos e tentativas de cada metrica: passos do funil e conversao geral
+    metrics = [f"{a} to {b}" for a, b in zip(stages, stages[1:])] + ['Overall']
+    successes = np.concatenate([users[:, 1:], users[:, -1:]], axis=1)
+    trials = np.concatenate([users[:, :-1], users[:, :1]], axis=1)
+
+    a, b = np.triu_indices(len(labels), k=1)
+    z, p_value = two_proportion_z(successes[a], trials[a], successes[b], trials[b])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = np.where(trials > 0, successes / trials * 100, 0)
+
+    n_metrics = len(metrics)
+    return pd.DataFrame({
+        'Segment_A': np.repeat(np.array(labels, dtype=object)[a], n_metrics),
+        'Segment_B': np.repeat(np.array(labels, dtype=object)[b], n_metrics),
+        'Metric': np.tile(metrics, len(a)),
+        'Rate_A': np.round(rates[a].ravel(), 2),
+        'Rate_B': np.round(rates[b].ravel(), 2),
+        'Difference': np.round((rates[a] - rates[b]).ravel(), 2),
+        'Z': np.round(z.ravel(), 3),
+        'P_Value': p_value.ravel()
+    })
+
+def analysis_tests(analysis_results, alpha=DEFAULT_ALPHA, method='fdr_bh'):
+    """
+    Pairwise tests for every segment dimension of analysis_results
+    (device, gender, user_type), corrected together as one family.
+    Adds Dimension, P_Adjusted and Significant columns.
+    """
+    frames = []
+    for dimension, funnel_key in DIMENSIONS.items():
+        tests = segment_pair_tests(analysis_results['segments'][dimension], funnel_key)
+        tests.insert(0, 'Dimension', dimension)
+        frames.append(tests)
+    tests = pd.concat(frames, ignore_index=True)
+
+    tests['P_Adjusted'] = adjust_pvalues(tests['P_Value'].to_numpy(), method)
+    tests['Significant'] = tests['P_Adjusted'] < alpha
+    return tests
+
+def find_test(tests, dimension, segment_a, segment_b, metric='Overall'):
+    """Row of `tests` comparing two segment values (in either order), or None."""
+    rows = tests[
+        (tests['Dimension'] == dimension) & (tests['Metric'] == metric) & (
+            ((tests['Segment_A'] == segment_a) & (tests['Segment_B'] == segment_b)) |
+            ((tests['Segment_A'] == segment_b) & (tests['Segment_B'] == segment_a))
+        )
+    ]
+    return rows.iloc[0] if len(rows) else None
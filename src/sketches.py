@@ -0,0 +1,324 @@
+import pandas as pd
+import numpy as np
+import os
+from itertools import combinations
+from utils import PROJECT_ROOT
+from funnel_spec import DEFAULT_FUNNEL
+from user_index import UserIndex
+
+SKETCH_PATH = os.path.join(PROJECT_ROOT, 'data', 'state', 'funnel_sketches.npz')
+
+# 2**14 registradores: erro padrao de ~0.8% em 16 KB por sketch
+DEFAULT_PRECISION = 14
+# a grade dia x segmento x etapa usa sketches menores (~1.6%, 4 KB cada)
+GRID_PRECISION = 12
+MIN_PRECISION = 4
+MAX_PRECISION = 18
+
+ERROR_COLUMN = 'Users_Error'
+
+def _splitmix64(user_ids):
+    # hash de 64 bits bem espalhado; a multiplicacao em uint64 da a volta sozinha
+    x = np.asarray(user_ids, dtype=np.int64).astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+def _bit_length(values):
+    # exato para inteiros de ate 32 bits (cabem na mantissa do float64)
+    return np.frexp(values.astype(np.float64))[1]
+
+def _hash_registers(user_ids, precision):
+    """Register index and rank (leading zeros + 1 of the remaining bits) of every id."""
+    hashes = _splitmix64(user_ids)
+    index = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    rest = hashes << np.uint64(precision)
+
+    high = (rest >> np.uint64(32)).astype(np.uint32)
+    low = (rest & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+    leading = np.where(high > 0, 32 - _bit_length(high), 64 - _bit_length(low))
+    rank = np.minimum(leading + 1, 64 - precision + 1).astype(np.uint8)
+    return index, rank
+
+def _check_precision(precision):
+    if not MIN_PRECISION <= precision <= MAX_PRECISION:
+        raise ValueError(f"precision must be between {MIN_PRECISION} and {MAX_PRECISION}, got {precision}")
+
+def estimate(registers):
+    """
+    HyperLogLog cardinality of one register array or of a stack of them
+    (registers on the last axis), with the linear-counting correction for
+    small sets. 64-bit hashes need no large-range correction.
+    """
+    registers = np.asarray(registers)
+    m = registers.shape[-1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.sum(np.exp2(-registers.astype(np.float64)), axis=-1)
+    zeros = np.sum(registers == 0, axis=-1)
+    with np.errstate(divide='ignore'):
+        linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+def relative_error(precision):
+    """Standard error of an estimate, relative to the count."""
+    return 1.04 / float(np.sqrt(1 << precision))
+
+class HyperLogLog:
+    """
+    Mergeable distinct-user sketch: 2**precision one-byte registers, a
+    relative standard error of 1.04 / sqrt(2**precision) whatever the number
+    of users, and merging two sketches (union of their users) is an
+    element-wise max. Serializes to precision + raw registers.
+    """
+
+    def __init__(self, precision=DEFAULT_PRECISION, registers=None):
+        _check_precision(precision)
+        self.precision = precision
+        if registers is None:
+            registers = np.zeros(1 << precision, dtype=np.uint8)
+        elif len(registers) != 1 << precision:
+            raise ValueError(f"Expected {1 << precision} registers, got {len(registers)}")
+        self.registers = registers
+
+    @classmethod
+    def from_ids(cls, user_ids, precision=DEFAULT_PRECISION):
+        return cls(precision).add(user_ids)
+
+    def add(self, user_ids):
+        index, rank = _hash_registers(user_ids, self.precision)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def _check_compatible(self, other):
+        if self.precision != other.precision:
+            raise ValueError(f"Cannot merge sketches with precision {self.precision} and {other.precision}")
+
+    def update(self, other):
+        """Merge other into this sketch in place."""
+        self._check_compatible(other)
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def __or__(self, other):
+        self._check_compatible(other)
+        return HyperLogLog(self.precision, np.maximum(self.registers, other.registers))
+
+    def copy(self):
+        return HyperLogLog(self.precision, self.registers.copy())
+
+    @property
+    def relative_error(self):
+        return relative_error(self.precision)
+
+    @property
+    def nbytes(self):
+        return self.registers.nbytes
+
+    def estimate(self):
+        return float(estimate(self.registers))
+
+    def count(self):
+        """(estimated distinct users, standard error in users)."""
+        value = self.estimate()
+        return value, value * self.relative_error
+
+    def intersection(self, *others):
+        """(estimated users in every sketch, standard error), see intersection_count."""
+        return intersection_count([self, *others])
+
+    def to_bytes(self):
+        return bytes([self.precision]) + self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(data[0], np.frombuffer(data[1:], dtype=np.uint8).copy())
+
+    def __eq__(self, other):
+        return isinstance(other, HyperLogLog) and self.precision == other.precision and np.array_equal(self.registers, other.registers)
+
+    def __repr__(self):
+        value, error = self.count()
+        return f"HyperLogLog(precision={self.precision}, ~{value:,.0f} ± {error:,.0f})"
+
+def _intersection(registers):
+    """
+    Inclusion-exclusion over the unions of every subset of the k register
+    arrays on axis 0 (2**k - 1 union estimates). The error is the
+    independent sum of the union errors, so it grows with k; loose funnel
+    steps only intersect two stages.
+    """
+    k, m = len(registers), registers.shape[-1]
+    value, variance = 0.0, 0.0
+    for size in range(1, k + 1):
+        for subset in combinations(range(k), size):
+            union = estimate(np.max(registers[list(subset)], axis=0))
+            value = value + (union if size % 2 else -union)
+            variance = variance + (union * 1.04 / np.sqrt(m)) ** 2
+    singles = [estimate(registers[i]) for i in range(k)]
+    return np.clip(value, 0, np.min(singles, axis=0)), np.sqrt(variance)
+
+def intersection_count(sketches):
+    """(estimated users present in every sketch, standard error in users)."""
+    for sketch in sketches[1:]:
+        sketches[0]._check_compatible(sketch)
+    value, error = _intersection(np.stack([sketch.registers for sketch in sketches]))
+    return float(value), float(error)
+
+def sketch_funnel(stage_sketches, spec=None):
+    """
+    Approximate (funnel_df, overall_conversion) from one sketch per stage, in
+    the layout of spec.funnel plus a Users_Error column (standard error of
+    each stage count). Each stage count is the intersection of the stages
+    the spec requires for it.
+    """
+    spec = spec or DEFAULT_FUNNEL
+    if len(stage_sketches) != len(spec.stages):
+        raise ValueError(f"{spec!r} expects {len(spec.stages)} stage sketches, got {len(stage_sketches)}")
+    registers = np.stack([sketch.registers for sketch in stage_sketches])
+
+    users, errors = [], []
+    for bits in spec.required:
+        stages = [i for i in range(len(spec.stages)) if bits >> i & 1]
+        value, error = _intersection(registers[stages])
+        users.append(int(round(float(value))))
+        errors.append(int(round(float(error))))
+
+    funnel_df, overall_conversion = spec.funnel_from_users(users)
+    funnel_df.insert(funnel_df.columns.get_loc('Users') + 1, ERROR_COLUMN, errors)
+    return funnel_df, overall_conversion
+
+class FunnelSketches:
+    """
+    One HyperLogLog sketch per (signup day, segment value, stage). Any date
+    range and any set of segment values is answered by merging the matching
+    sketches, with no pass over the events; sketches of separate batches
+    (e.g. one build per day of logs) merge with merge().
+
+    Users go to the day they signed up (as in cohorts.daily_patterns);
+    users without a signup date are left out. Users with a missing
+    attribute value go to a trailing 'unknown' slot that only counts in the
+    totals.
+    """
+
+    def __init__(self, days, categories, registers, attribute='device', stage_names=None):
+        self.days = np.asarray(days, dtype='datetime64[ns]')
+        self.categories = list(categories)
+        # (dias, valores + 1, etapas, registradores)
+        self.registers = registers
+        self.attribute = attribute
+        self.stage_names = list(stage_names or DEFAULT_FUNNEL.names)
+        self.precision = int(np.log2(registers.shape[-1]))
+
+    @classmethod
+    def build(cls, *stage_dfs, user_df, attribute='device', spec=None, index=None, precision=GRID_PRECISION):
+        _check_precision(precision)
+        spec = spec or DEFAULT_FUNNEL
+        spec._check(stage_dfs)
+        index = index or UserIndex(user_df)
+
+        dates = pd.to_datetime(user_df['date'], errors='coerce').dt.normalize()
+        first_day = dates.min()
+        if pd.isnull(first_day):
+            raise ValueError("Nenhuma data válida encontrada em user_df['date'].")
+        days = pd.date_range(first_day, dates.max(), freq='D')
+        row_days = ((dates - first_day).dt.days).fillna(-1).to_numpy(dtype=np.int64)
+
+        categories = index.categories(attribute)
+        n_slots = len(categories) + 1
+        row_slots = index.row_codes(attribute).copy()
+        row_slots[row_slots < 0] = len(categories)
+
+        m = 1 << precision
+        registers = np.zeros((len(days), n_slots, len(spec.stages), m), dtype=np.uint8)
+        flat = registers.reshape(-1)
+        for i, df in enumerate(stage_dfs):
+            ids = pd.unique(df['user_id'].to_numpy(dtype=np.int64))
+            # so usuarios de user_df com data de cadastro
+            rows = index.positions(ids)
+            keep = rows >= 0
+            keep[keep] = row_days[rows[keep]] >= 0
+            ids, rows = ids[keep], rows[keep]
+
+            # posicao de cada registrador no array achatado (dia, slot, etapa, registrador)
+            register, rank = _hash_registers(ids, precision)
+            cells = (row_days[rows] * n_slots + row_slots[rows]) * len(spec.stages) + i
+            np.maximum.at(flat, cells * m + register, rank)
+
+        return cls(days, categories, registers, attribute, spec.names)
+
+    @property
+    def nbytes(self):
+        return self.registers.nbytes
+
+    def _day_mask(self, start=None, end=None):
+        mask = np.ones(len(self.days), dtype=bool)
+        if start is not None:
+            mask &= self.days >= np.datetime64(pd.Timestamp(start).normalize(), 'ns')
+        if end is not None:
+            mask &= self.days <= np.datetime64(pd.Timestamp(end).normalize(), 'ns')
+        return mask
+
+    def _slots(self, values):
+        if values is None:
+            return list(range(len(self.categories) + 1))
+        if isinstance(values, str):
+            values = [values]
+        unknown = [value for value in values if value not in self.categories]
+        if unknown:
+            raise ValueError(f"Unknown {self.attribute} values: {unknown}")
+        return [self.categories.index(value) for value in values]
+
+    def stage_sketches(self, start=None, end=None, values=None):
+        """One merged sketch per stage for signup days in [start, end] and the given segment values."""
+        selected = self.registers[self._day_mask(start, end)][:, self._slots(values)]
+        merged = selected.max(axis=(0, 1)) if selected.size else np.zeros(self.registers.shape[2:], dtype=np.uint8)
+        return [HyperLogLog(self.precision, merged[i].copy()) for i in range(len(self.stage_names))]
+
+    def funnel(self, start=None, end=None, values=None, spec=None):
+        """Approximate funnel of a date range and segment values, see sketch_funnel."""
+        return sketch_funnel(self.stage_sketches(start, end, values), spec)
+
+    def segment_funnels(self, start=None, end=None, spec=None):
+        """{value: (funnel_df, overall_conversion)} for every segment value."""
+        return {value: self.funnel(start, end, value, spec) for value in self.categories}
+
+    def merge(self, other):
+        """
+        Sketches covering the days and segment values of both; days present
+        in both are merged register by register.
+        """
+        if (self.attribute, self.stage_names, self.precision) != (other.attribute, other.stage_names, other.precision):
+            raise ValueError("Can only merge sketches of the same attribute, stages and precision")
+
+        days = np.union1d(self.days, other.days)
+        categories = self.categories + [value for value in other.categories if value not in self.categories]
+        n_slots = len(categories) + 1
+        registers = np.zeros((len(days), n_slots) + self.registers.shape[2:], dtype=np.uint8)
+
+        for sketches in (self, other):
+            day_pos = np.searchsorted(days, sketches.days)
+            # o slot 'unknown' continua sendo o ultimo
+            slot_pos = [categories.index(value) for value in sketches.categories] + [n_slots - 1]
+            target = registers[np.ix_(day_pos, slot_pos)]
+            registers[np.ix_(day_pos, slot_pos)] = np.maximum(target, sketches.registers)
+
+        return FunnelSketches(days, categories, registers, self.attribute, self.stage_names)
+
+    def save(self, path=SKETCH_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp.npz'
+        np.savez_compressed(
+            tmp_path,
+            days=self.days.view(np.int64), registers=self.registers,
+            categories=np.array(self.categories, dtype=str), attribute=np.array(self.attribute),
+            stage_names=np.array(self.stage_names, dtype=str)
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=SKETCH_PATH):
+        with np.load(path) as data:
+            return cls(
+                data['days'].view('datetime64[ns]'), data['categories'].tolist(), data['registers'],
+                str(data['attribute']), data['stage_names'].tolist()
+            )
@@ -0,0 +1,93 @@
+import os
+import json
+import argparse
+import time
+from collections.abc import Mapping
+from datetime import datetime, timezone
+
+# so biblioteca padrao no nivel do modulo: o dashboard le o snapshot sem importar pandas
+SNAPSHOT_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'state', 'analysis_snapshot.json'
+)
+
+SNAPSHOT_VERSION = 1
+
+def _encode(value):
+    # DataFrames viram {'__table__': {coluna: valores}}; tuplas viram listas; escalares numpy viram Python
+    if hasattr(value, 'to_dict') and hasattr(value, 'columns'):
+        return {'__table__': {str(column): [_encode(v) for v in value[column].tolist()] for column in value.columns}}
+    if isinstance(value, Mapping):
+        return {str(key): _encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+def _decode(value, as_frames):
+    if isinstance(value, dict):
+        if set(value) == {'__table__'}:
+            if as_frames:
+                import pandas as pd
+                return pd.DataFrame(value['__table__'])
+            return value['__table__']
+        return {key: _decode(item, as_frames) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode(item, as_frames) for item in value]
+    return value
+
+def build_snapshot(dataset):
+    """
+    Snapshot dict of a FunnelDataset: analysis_results, insights,
+    recommendations and significance tests, with every table stored as
+    {column: values} so it can be written as plain JSON.
+    """
+    return {
+        'version': SNAPSHOT_VERSION,
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'fingerprint': dataset.fingerprint,
+        'n_resamples': dataset.n_resamples,
+        'analysis_results': _encode(dataset.analysis_results),
+        'insights': list(dataset.insights),
+        'recommendations': list(dataset.recommendations),
+        'significance': _encode(dataset.significance)
+    }
+
+def write_snapshot(snapshot, path=SNAPSHOT_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(snapshot, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+def read_snapshot(path=SNAPSHOT_PATH, as_frames=False):
+    """
+    Load a snapshot written by write_snapshot. Tables come back as
+    {column: values} dicts, or as DataFrames with as_frames=True (same
+    layout as perform_funnel_analysis, except that intervals are lists).
+    """
+    with open(path) as f:
+        snapshot = json.load(f)
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {snapshot.get('version')} in {path}")
+    return _decode(snapshot, as_frames)
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the analysis snapshot read by app/dashboard.py.")
+    parser.add_argument('--output', default=SNAPSHOT_PATH, help="snapshot file")
+    parser.add_argument('--resamples', type=int, default=1000, help="bootstrap resamples for the intervals (0 disables)")
+    args = parser.parse_args()
+
+    from dataset import FunnelDataset
+    start = time.perf_counter()
+    dataset = FunnelDataset(compact=True, n_resamples=args.resamples)
+    if not dataset.loaded:
+        print("Failed to load data, snapshot not written")
+        return
+    write_snapshot(build_snapshot(dataset), args.output)
+    print(f"Snapshot written to {args.output} in {time.perf_counter() - start:.2f}s")
+
+if __name__ == '__main__':
+    main()
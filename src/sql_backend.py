@@ -0,0 +1,326 @@
+import pandas as pd
+import numpy as np
+import os
+import json
+import sqlite3
+from utils import (
+    CACHE_DIR, PROCESSED_DIR, TABLE_FILES, file_fingerprint, content_hash, LazyDict
+)
+from analysis import build_analysis_results
+from user_set import UserSet
+from funnel_spec import DEFAULT_FUNNEL
+from funnel_cube import FunnelCube, row_columns
+from user_index import USER_TYPES
+
+# o backend SQLite atende so o funil padrao (ver FunnelDataset)
+SPEC = DEFAULT_FUNNEL
+
+SQLITE_PATH = os.path.join(CACHE_DIR, 'funnel.sqlite')
+
+PAGE_TABLES = {stage: f"{stage}_page" for stage in SPEC.names}
+
+USER_COLUMNS = ['user_id', 'date', 'device', 'sex']
+
+INGEST_CHUNKSIZE = 100_000
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# mascara de etapas por usuario, calculada dentro do SQLite
+USER_MASKS_SQL = ' UNION ALL '.join(
+    f"SELECT DISTINCT user_id, {SPEC.bits[stage]} AS bit FROM {table}"
+    for stage, table in PAGE_TABLES.items()
+)
+USER_MASKS_SQL = f"SELECT user_id, SUM(bit) AS mask FROM ({USER_MASKS_SQL}) GROUP BY user_id"
+
+# linhas de evento por etapa e mascara de etapas por usuario, numa passada so
+USER_ROWS_SQL = ' UNION ALL '.join(
+    f"SELECT user_id, {i} AS stage FROM {table}" for i, table in enumerate(PAGE_TABLES.values())
+)
+USER_ROWS_SQL = f"""
+    SELECT user_id, {', '.join(f"SUM(stage = {i}) AS rows_{stage}" for i, stage in enumerate(SPEC.names))}
+    FROM ({USER_ROWS_SQL}) GROUP BY user_id
+"""
+USER_ROWS_MASK = ' + '.join(f"(s.rows_{stage} > 0) * {SPEC.bits[stage]}" for stage in SPEC.names)
+
+class SQLiteBackend:
+    """
+    Funnel queries answered by indexed aggregate SQL over a local SQLite copy
+    of the processed tables, so no event rows are held in Python memory.
+    Results follow the layout of the pandas functions in utils/analysis.
+    """
+
+    def __init__(self, db_path=SQLITE_PATH, data_dir=PROCESSED_DIR):
+        self.db_path = db_path
+        self.data_dir = data_dir
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        if not self._is_fresh():
+            self.ingest()
+
+    def _source_paths(self):
+        return {name: os.path.join(self.data_dir, file_name) for name, file_name in TABLE_FILES.items()}
+
+    def _is_fresh(self):
+        try:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'sources'").fetchone()
+        except sqlite3.OperationalError:
+            return False
+        if row is None:
+            return False
+
+        sources = json.loads(row[0])
+        for name, path in self._source_paths().items():
+            meta = sources.get(name, {})
+            current = file_fingerprint(path)
+            if current['size'] != meta.get('size'):
+                return False
+            if current['mtime_ns'] != meta.get('mtime_ns') and content_hash(path) != meta.get('hash'):
+                return False
+        return True
+
+    def ingest(self):
+        """(Re)load the processed CSVs into SQLite, chunk by chunk, and build the indexes."""
+        conn = self.conn
+        paths = self._source_paths()
+
+        with conn:
+            conn.execute("DROP TABLE IF EXISTS meta")
+            conn.execute("DROP TABLE IF EXISTS users")
+            for table in PAGE_TABLES.values():
+                conn.execute(f"DROP TABLE IF EXISTS {table}")
+
+            conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("CREATE TABLE users (user_id INTEGER, date TEXT, device TEXT, sex TEXT)")
+            for table in PAGE_TABLES.values():
+                conn.execute(f"CREATE TABLE {table} (user_id INTEGER)")
+
+            for stage, table in PAGE_TABLES.items():
+                for chunk in pd.read_csv(paths[stage], usecols=['user_id'], chunksize=INGEST_CHUNKSIZE):
+                    conn.executemany(
+                        f"INSERT INTO {table} (user_id) VALUES (?)",
+                        ((int(user_id),) for user_id in chunk['user_id'].to_numpy())
+                    )
+
+            for chunk in pd.read_csv(paths['user'], usecols=USER_COLUMNS, chunksize=INGEST_CHUNKSIZE):
+                chunk['date'] = pd.to_datetime(chunk['date'], errors='coerce').dt.strftime(DATE_FORMAT)
+                chunk = chunk[USER_COLUMNS].astype(object)
+                chunk = chunk.where(chunk.notna(), None)
+                conn.executemany(
+                    "INSERT INTO users (user_id, date, device, sex) VALUES (?, ?, ?, ?)",
+                    chunk.itertuples(index=False, name=None)
+                )
+
+            for table in PAGE_TABLES.values():
+                conn.execute(f"CREATE INDEX idx_{table}_user_id ON {table} (user_id)")
+            for column in ['user_id', 'device', 'sex', 'date']:
+                conn.execute(f"CREATE INDEX idx_users_{column} ON users ({column})")
+
+            sources = {}
+            for name, path in paths.items():
+                sources[name] = file_fingerprint(path)
+                sources[name]['hash'] = content_hash(path)
+            conn.execute("INSERT INTO meta (key, value) VALUES ('sources', ?)", (json.dumps(sources),))
+
+        conn.execute("ANALYZE")
+
+    def _patterns(self, where='', params=()):
+        query = f"""
+            SELECT m.mask, COUNT(*) FROM ({USER_MASKS_SQL}) m
+            {"JOIN users u ON u.user_id = m.user_id WHERE " + where if where else ""}
+            GROUP BY m.mask
+        """
+        patterns = np.zeros(SPEC.n_patterns, dtype=np.int64)
+        for mask, count in self.conn.execute(query, params):
+            patterns[mask] = count
+        return patterns
+
+    def _distinct_users(self, *stages):
+        query = ' INTERSECT '.join(f"SELECT user_id FROM {PAGE_TABLES[stage]}" for stage in stages)
+        return UserSet(np.fromiter((user_id for (user_id,) in self.conn.execute(query)), dtype=np.int64))
+
+    def calculate_user_journeys(self):
+        """
+        Same (funnel_df, overall_conversion, user_sets) triple as
+        utils.calculate_user_journeys. The user sets are only fetched from
+        SQLite when a key is actually read.
+        """
+        funnel_df, overall_conversion = SPEC.funnel(self._patterns())
+        user_sets = LazyDict({
+            'home_users': lambda: self._distinct_users('home'),
+            'search_users': lambda: self._distinct_users('search'),
+            'payment_users': lambda: self._distinct_users('payment'),
+            'confirmation_users': lambda: self._distinct_users('confirmation'),
+            'home_to_search': lambda: self._distinct_users('home', 'search'),
+            'search_to_payment': lambda: self._distinct_users('search', 'payment'),
+            'payment_to_confirmation': lambda: self._distinct_users('payment', 'confirmation')
+        })
+        return funnel_df, overall_conversion, user_sets
+
+    def overall(self):
+        patterns = self._patterns()
+        funnel_df, overall_conversion = SPEC.funnel(patterns)
+        drop_off_df = SPEC.drop_off(patterns)
+        return {
+            'funnel': funnel_df,
+            'conversion_rate': overall_conversion,
+            'drop_off': drop_off_df
+        }
+
+    def _values(self, attribute):
+        # mesma ordem de user_df[attribute].unique(): ordem da primeira aparicao
+        return [value for (value,) in self.conn.execute(
+            f"SELECT {attribute} FROM users WHERE {attribute} IS NOT NULL GROUP BY {attribute} ORDER BY MIN(rowid)"
+        )]
+
+    def segment_by_attribute(self, attribute):
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(users)")]
+        if attribute not in columns:
+            print(f"Error: {attribute} is not a valid column in user_df")
+            return None
+
+        values = self._values(attribute)
+
+        patterns = {value: np.zeros(SPEC.n_patterns, dtype=np.int64) for value in values}
+        for value, mask, count in self.conn.execute(f"""
+            SELECT u.{attribute}, m.mask, COUNT(*) FROM ({USER_MASKS_SQL}) m
+            JOIN users u ON u.user_id = m.user_id
+            WHERE u.{attribute} IS NOT NULL
+            GROUP BY u.{attribute}, m.mask
+        """):
+            patterns[value][mask] = count
+
+        rows = {value: dict.fromkeys(SPEC.names, 0) for value in values}
+        for stage, table in PAGE_TABLES.items():
+            for value, count in self.conn.execute(f"""
+                SELECT u.{attribute}, COUNT(*) FROM {table} p
+                JOIN users u ON u.user_id = p.user_id
+                WHERE u.{attribute} IS NOT NULL
+                GROUP BY u.{attribute}
+            """):
+                rows[value][stage] = count
+
+        results = {}
+        for value in values:
+            funnel_df, overall_conversion = SPEC.funnel(patterns[value])
+            results[value] = {
+                'funnel_df': funnel_df,
+                'overall_conversion': overall_conversion,
+                'counts': rows[value]
+            }
+        return results
+
+    def _user_type_cutoff(self, days_threshold):
+        (max_date,) = self.conn.execute("SELECT MAX(date) FROM users").fetchone()
+        if max_date is None:
+            raise ValueError("Nenhuma data válida encontrada em user_df['date'].")
+        return (pd.Timestamp(max_date) - pd.Timedelta(days=days_threshold)).strftime(DATE_FORMAT)
+
+    def user_counts(self, days_threshold=7):
+        cutoff = self._user_type_cutoff(days_threshold)
+        total, new, existing = self.conn.execute(
+            "SELECT COUNT(*), SUM(date >= ?), SUM(date < ?) FROM users", (cutoff, cutoff)
+        ).fetchone()
+        return {'total': total, 'new': new or 0, 'existing': existing or 0}
+
+    def user_type_segments(self, days_threshold=7):
+        cutoff = self._user_type_cutoff(days_threshold)
+        counts = self.user_counts(days_threshold)
+        new_user_funnel, new_user_overall = SPEC.funnel(self._patterns('u.date >= ?', (cutoff,)))
+        existing_user_funnel, existing_user_overall = SPEC.funnel(self._patterns('u.date < ?', (cutoff,)))
+        return {
+            'new': {
+                'funnel': new_user_funnel,
+                'overall_conversion': new_user_overall,
+                'count': counts['new']
+            },
+            'existing': {
+                'funnel': existing_user_funnel,
+                'overall_conversion': existing_user_overall,
+                'count': counts['existing']
+            }
+        }
+
+    def cube(self, days_threshold=7):
+        """
+        FunnelCube of the SQLite tables. Users are grouped by signup day,
+        device, sex, user type and stage mask inside SQLite, so only the
+        groups (not the events) reach Python.
+        """
+        cutoff = self._user_type_cutoff(days_threshold)
+        rows = ', '.join(f"SUM(COALESCE(s.{column}, 0))" for column in row_columns(SPEC))
+        query = f"""
+            SELECT 1, substr(u.date, 1, 10) AS day, u.device, u.sex,
+                   CASE WHEN u.date >= ? THEN 0 WHEN u.date < ? THEN 1 ELSE -1 END AS user_type,
+                   COALESCE({USER_ROWS_MASK}, 0) AS mask, COUNT(*), {rows}
+            FROM users u LEFT JOIN ({USER_ROWS_SQL}) s ON s.user_id = u.user_id
+            GROUP BY day, u.device, u.sex, user_type, mask
+            UNION ALL
+            SELECT 0, NULL, NULL, NULL, -1, {USER_ROWS_MASK} AS mask, COUNT(*), {rows}
+            FROM ({USER_ROWS_SQL}) s
+            WHERE s.user_id NOT IN (SELECT user_id FROM users)
+            GROUP BY mask
+        """
+        groups = pd.DataFrame(
+            self.conn.execute(query, (cutoff, cutoff)).fetchall(),
+            columns=['known', 'date', 'device', 'sex', 'user_type', 'mask', 'users'] + row_columns(SPEC)
+        )
+        groups['known'] = groups['known'].astype(bool)
+
+        categories = {dim: self._values(dim) for dim in ['device', 'sex']}
+        categories['user_type'] = list(USER_TYPES)
+        for dim in ['device', 'sex']:
+            # valores fora das categorias (NULL) viram -1, como em pd.factorize
+            codes = pd.Categorical(groups[dim], categories=categories[dim]).codes
+            groups[dim] = codes.astype(np.int64)
+        return FunnelCube.from_groups(groups, categories, spec=SPEC, days_threshold=days_threshold)
+
+    def analysis_results(self):
+        overall = self.overall()
+        user_type = self.user_type_segments()
+        counts = self.user_counts()
+        return build_analysis_results(
+            overall['funnel'], overall['conversion_rate'], overall['drop_off'],
+            self.segment_by_attribute('device'), self.segment_by_attribute('sex'),
+            user_type['new']['funnel'], user_type['new']['overall_conversion'],
+            user_type['existing']['funnel'], user_type['existing']['overall_conversion'],
+            counts['total'], counts['new'], counts['existing']
+        )
+
+def check_against_pandas(backend=None):
+    """
+    Run the SQLite and pandas paths on the bundled data and return the list
+    of keys whose results differ (empty when both agree).
+    """
+    from utils import load_data
+    from analysis import perform_funnel_analysis
+
+    backend = backend or SQLiteBackend()
+    expected = perform_funnel_analysis(*load_data())
+    actual = backend.analysis_results()
+
+    mismatches = []
+
+    def compare(left, right, path):
+        if isinstance(left, pd.DataFrame):
+            if not left.equals(right):
+                mismatches.append(path)
+        elif isinstance(left, dict):
+            if list(left) != list(right):
+                mismatches.append(path)
+                return
+            for key in left:
+                compare(left[key], right[key], f"{path}.{key}")
+        elif left != right:
+            mismatches.append(path)
+
+    compare(expected, actual, 'analysis_results')
+    return mismatches
+
+if __name__ == '__main__':
+    mismatches = check_against_pandas()
+    if mismatches:
+        print("SQLite backend differs from pandas at:")
+        for path in mismatches:
+            print(f"  {path}")
+    else:
+        print("SQLite backend matches the pandas results.")
@@ -0,0 +1,83 @@
+import pandas as pd
+import numpy as np
+import os
+from utils import PROCESSED_DIR, TABLE_FILES, build_user_journeys
+from user_set import UserSet
+from sketches import HyperLogLog, DEFAULT_PRECISION, sketch_funnel
+
+STAGE_TABLES = ['home', 'search', 'payment', 'confirmation']
+
+DEFAULT_CHUNKSIZE = 100_000
+
+def stream_stage_users(csv_path, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Read an event table in chunks and fold it into a sorted array of distinct
+    user ids. Memory grows with the number of distinct users, not event rows.
+    """
+    users = np.empty(0, dtype=np.int64)
+    pending = []
+    pending_size = 0
+
+    for chunk in pd.read_csv(csv_path, usecols=['user_id'], dtype={'user_id': np.int64}, chunksize=chunksize):
+        chunk_users = np.unique(chunk['user_id'].to_numpy())
+        pending.append(chunk_users)
+        pending_size += len(chunk_users)
+
+        # junta os pendentes so quando eles passam do tamanho do acumulado,
+        # assim cada merge custa no maximo ~2x o numero de usuarios distintos
+        if pending_size >= max(len(users), chunksize):
+            users = np.unique(np.concatenate([users] + pending))
+            pending = []
+            pending_size = 0
+
+    if pending:
+        users = np.unique(np.concatenate([users] + pending))
+
+    return users
+
+def stream_user_journeys(data_dir=PROCESSED_DIR, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Streaming counterpart of calculate_user_journeys: reads the four page
+    tables chunk by chunk and returns the same (funnel_df, overall_conversion,
+    user_sets) triple.
+    """
+    stage_users = {}
+    for table in STAGE_TABLES:
+        path = os.path.join(data_dir, TABLE_FILES[table])
+        stage_users[table] = stream_stage_users(path, chunksize=chunksize)
+        print(f"Streamed {table}: {len(stage_users[table])} distinct users")
+
+    # os arrays ja estao ordenados e sem repeticao
+    return build_user_journeys(
+        UserSet.from_sorted(stage_users['home']),
+        UserSet.from_sorted(stage_users['search']),
+        UserSet.from_sorted(stage_users['payment']),
+        UserSet.from_sorted(stage_users['confirmation'])
+    )
+
+def stream_stage_sketch(csv_path, chunksize=DEFAULT_CHUNKSIZE, precision=DEFAULT_PRECISION):
+    """
+    HyperLogLog sketch of the distinct users of an event table, read in
+    chunks. Memory is fixed by the precision, whatever the number of users.
+    """
+    sketch = HyperLogLog(precision)
+    for chunk in pd.read_csv(csv_path, usecols=['user_id'], dtype={'user_id': np.int64}, chunksize=chunksize):
+        sketch.add(chunk['user_id'].to_numpy())
+    return sketch
+
+def stream_sketch_journeys(data_dir=PROCESSED_DIR, chunksize=DEFAULT_CHUNKSIZE, precision=DEFAULT_PRECISION):
+    """
+    Approximate counterpart of stream_user_journeys for exploratory runs:
+    (funnel_df, overall_conversion, sketches), with the standard error of
+    every stage count in funnel_df['Users_Error']. The sketches can be
+    saved with to_bytes() and merged with later batches.
+    """
+    sketches = {}
+    for table in STAGE_TABLES:
+        path = os.path.join(data_dir, TABLE_FILES[table])
+        sketches[table] = stream_stage_sketch(path, chunksize=chunksize, precision=precision)
+        value, error = sketches[table].count()
+        print(f"Streamed {table}: ~{value:,.0f} ± {error:,.0f} distinct users")
+
+    funnel_df, overall_conversion = sketch_funnel([sketches[table] for table in STAGE_TABLES])
+    return funnel_df, overall_conversion, sketches
@@ -0,0 +1,126 @@
+import pandas as pd
+import numpy as np
+
+# rotulos dos codigos 0 e 1 de 'user_type' e as chaves dos resultados na mesma ordem
+USER_TYPES = ['New User', 'Existing User']
+USER_TYPE_KEYS = ['new', 'existing']
+
+# atributos derivados, alem das colunas de user_df
+DERIVED_ATTRIBUTES = ('user_type', 'signup_date')
+
+# ids densos o bastante usam uma tabela de enderecamento direto (id -> linha)
+# em vez de searchsorted; limite de tamanho da tabela em posicoes
+DIRECT_TABLE_MIN_SIZE = 1 << 22
+DIRECT_TABLE_RATIO = 16
+
+class UserIndex:
+    """
+    user_id -> row of user_df, plus every user attribute encoded as integer
+    codes (pd.factorize order, -1 = missing). Built once per user table and
+    shared by every analysis: labeling a page table or splitting users into
+    segments is a searchsorted and a gather, with no hash joins.
+
+    Attributes are the user_df columns plus 'user_type' (New User /
+    Existing User, as identify_new_users) and 'signup_date' (day of 'date').
+    A repeated user_id maps to its first row.
+    """
+
+    def __init__(self, user_df, days_threshold=7):
+        self.user_df = user_df
+        self.days_threshold = days_threshold
+        self.user_ids, self.first_rows = np.unique(user_df['user_id'].to_numpy(dtype=np.int64), return_index=True)
+        self.n_rows = len(user_df)
+        self._codes = {}
+        self._categories = {}
+        self._table = None
+
+        if len(self.user_ids):
+            self._offset = int(self.user_ids[0])
+            span = int(self.user_ids[-1]) - self._offset + 1
+            if span <= max(DIRECT_TABLE_RATIO * len(self.user_ids), DIRECT_TABLE_MIN_SIZE):
+                self._table = np.full(span, -1, dtype=np.int32 if self.n_rows < 2 ** 31 else np.int64)
+                self._table[self.user_ids - self._offset] = self.first_rows
+
+    def _encode(self, attribute):
+        if attribute in self._codes:
+            return
+
+        if attribute in DERIVED_ATTRIBUTES:
+            if 'date' not in self.user_df.columns:
+                raise ValueError("user_df precisa ter a coluna 'date'.")
+            dates = pd.to_datetime(self.user_df['date'], errors='coerce')
+            if attribute == 'user_type':
+                # mesmo corte de identify_new_users
+                max_date = dates.max()
+                if pd.isnull(max_date):
+                    raise ValueError("Nenhuma data válida encontrada em user_df['date'].")
+                cutoff = max_date - pd.Timedelta(days=self.days_threshold)
+                codes = np.where(dates >= cutoff, 0, np.where(dates < cutoff, 1, -1))
+                categories = list(USER_TYPES)
+            else:
+                codes, categories = pd.factorize(dates.dt.normalize(), sort=True)
+                categories = list(categories)
+        elif attribute in self.user_df.columns:
+            codes, categories = pd.factorize(self.user_df[attribute])
+            categories = list(categories)
+        else:
+            raise KeyError(f"{attribute} is not a user attribute")
+
+        self._codes[attribute] = np.asarray(codes, dtype=np.int64)
+        self._categories[attribute] = categories
+
+    @property
+    def nbytes(self):
+        table = self._table.nbytes if self._table is not None else 0
+        return self.user_ids.nbytes + self.first_rows.nbytes + table + sum(codes.nbytes for codes in self._codes.values())
+
+    def categories(self, attribute):
+        self._encode(attribute)
+        return self._categories[attribute]
+
+    def row_codes(self, attribute):
+        """Code of every user_df row (same length and order as user_df)."""
+        self._encode(attribute)
+        return self._codes[attribute]
+
+    def user_codes(self, attribute):
+        """Code of every distinct user, aligned with self.user_ids."""
+        return self.row_codes(attribute)[self.first_rows]
+
+    def value_counts(self, attribute):
+        """user_df rows per value, as len() of the filtered user table."""
+        codes = self.row_codes(attribute)
+        counts = np.bincount(codes[codes >= 0], minlength=len(self.categories(attribute)))
+        return dict(zip(self.categories(attribute), counts.tolist()))
+
+    def positions(self, user_ids):
+        """user_df row of each id (-1 when the id is not in user_df)."""
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        if len(self.user_ids) == 0:
+            return np.full(len(user_ids), -1)
+        if self._table is not None:
+            offsets = user_ids - self._offset
+            inside = (offsets >= 0) & (offsets < len(self._table))
+            return np.where(inside, self._table[np.where(inside, offsets, 0)], -1)
+        pos = np.minimum(np.searchsorted(self.user_ids, user_ids), len(self.user_ids) - 1)
+        return np.where(self.user_ids[pos] == user_ids, self.first_rows[pos], -1)
+
+    def _codes_at(self, rows, attribute):
+        return np.where(rows >= 0, self.row_codes(attribute)[np.maximum(rows, 0)], -1)
+
+    def codes_for(self, user_ids, attribute):
+        return self._codes_at(self.positions(user_ids), attribute)
+
+    def values_for(self, user_ids, attribute):
+        """Attribute of each id as a Categorical (NaN for unknown users)."""
+        return pd.Categorical.from_codes(self.codes_for(user_ids, attribute), categories=self.categories(attribute))
+
+    def label(self, page_df, *attributes):
+        """page_df with one column per attribute, like a left merge with user_df."""
+        rows = self.positions(page_df['user_id'].to_numpy(dtype=np.int64))
+        labels = {}
+        for attribute in attributes:
+            labels[attribute] = pd.Categorical.from_codes(
+                self._codes_at(rows, attribute), categories=self.categories(attribute)
+            )
+        return page_df.assign(**labels)
@@ -0,0 +1,145 @@
+import pandas as pd
+import numpy as np
+from collections.abc import Set
+
+# ids que cabem em 32 bits ocupam 4 bytes cada, contra ~60-70 bytes num set do Python
+_UINT32_MAX = np.iinfo(np.uint32).max
+
+def _compact(ids):
+    if len(ids) and ids[0] >= 0 and ids[-1] <= _UINT32_MAX:
+        return ids.astype(np.uint32, copy=False)
+    return ids.astype(np.int64, copy=False)
+
+class UserSet(Set):
+    """
+    Immutable set of integer user ids stored as one sorted array of unique
+    values (uint32 when the ids fit, int64 otherwise).
+
+    Intersection, union and difference are merges of sorted arrays, and
+    intersections with a much smaller set only search the small side into
+    the big one. Behaves like a frozenset for len, `in`, iteration,
+    comparison and the &, |, - operators.
+    """
+
+    __slots__ = ('ids',)
+
+    def __init__(self, ids=()):
+        if isinstance(ids, UserSet):
+            ids = ids.ids
+        elif isinstance(ids, (set, frozenset)):
+            ids = np.fromiter(ids, dtype=np.int64, count=len(ids))
+        elif isinstance(ids, (pd.Series, pd.Index)):
+            ids = ids.to_numpy(dtype=np.int64)
+        ids = np.asarray(ids)
+        if ids.dtype.kind not in 'iu':
+            ids = ids.astype(np.int64)
+        self.ids = _compact(np.unique(ids))
+
+    @classmethod
+    def from_sorted(cls, ids):
+        """Wrap an array that is already sorted and unique, without copying."""
+        user_set = cls.__new__(cls)
+        user_set.ids = _compact(np.asarray(ids))
+        return user_set
+
+    @classmethod
+    def _from_iterable(cls, iterable):
+        # usado pelos operadores herdados de Set (ex.: set - UserSet)
+        return cls(np.fromiter(iterable, dtype=np.int64))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids.tolist())
+
+    def __contains__(self, user_id):
+        if not isinstance(user_id, (int, np.integer)) or len(self.ids) == 0:
+            return False
+        if not self.ids[0] <= user_id <= self.ids[-1]:
+            return False
+        pos = np.searchsorted(self.ids, user_id)
+        return pos < len(self.ids) and self.ids[pos] == user_id
+
+    def __repr__(self):
+        preview = ', '.join(map(str, self.ids[:5].tolist()))
+        more = ', ...' if len(self.ids) > 5 else ''
+        return f"UserSet({{{preview}{more}}}, size={len(self.ids)})"
+
+    @property
+    def nbytes(self):
+        return self.ids.nbytes
+
+    def contains_many(self, user_ids):
+        """Boolean array: which of `user_ids` are in the set (vectorized `in`)."""
+        user_ids = np.asarray(user_ids)
+        if len(self.ids) == 0:
+            return np.zeros(len(user_ids), dtype=bool)
+        pos = np.minimum(np.searchsorted(self.ids, user_ids), len(self.ids) - 1)
+        return self.ids[pos] == user_ids
+
+    def _ids_of(self, other):
+        return other.ids if isinstance(other, UserSet) else UserSet(other).ids
+
+    def intersection(self, *others):
+        result = self.ids
+        for other in others:
+            other_ids = self._ids_of(other)
+            small, big = (result, other_ids) if len(result) <= len(other_ids) else (other_ids, result)
+            if len(small) * 16 < len(big):
+                # lado pequeno procurado no grande: O(m log n) em vez de O(m + n)
+                result = small[UserSet.from_sorted(big).contains_many(small)]
+            else:
+                result = np.intersect1d(small, big, assume_unique=True)
+        return UserSet.from_sorted(result)
+
+    def union(self, *others):
+        if not others:
+            return self
+        return UserSet(np.concatenate([self.ids.astype(np.int64)] + [self._ids_of(o).astype(np.int64) for o in others]))
+
+    def difference(self, *others):
+        result = self.ids
+        for other in others:
+            other_ids = self._ids_of(other)
+            result = result[~UserSet.from_sorted(other_ids).contains_many(result)]
+        return UserSet.from_sorted(result)
+
+    def isdisjoint(self, other):
+        return len(self.intersection(other)) == 0
+
+    def issubset(self, other):
+        return len(self.difference(other)) == 0
+
+    def __and__(self, other):
+        if not isinstance(other, Set):
+            return NotImplemented
+        return self.intersection(other)
+
+    def __or__(self, other):
+        if not isinstance(other, Set):
+            return NotImplemented
+        return self.union(other)
+
+    def __sub__(self, other):
+        if not isinstance(other, Set):
+            return NotImplemented
+        return self.difference(other)
+
+    __rand__ = __and__
+    __ror__ = __or__
+
+    def __eq__(self, other):
+        if isinstance(other, UserSet):
+            return np.array_equal(self.ids, other.ids)
+        if isinstance(other, Set):
+            return len(self) == len(other) and self.issubset(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def tolist(self):
+        return self.ids.tolist()
+
+    def to_set(self):
+        return set(self.ids.tolist())
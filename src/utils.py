@@ -1,35 +1,191 @@
 import pandas as pd
 import numpy as np
 import os
-import pandas as pd
+import json
+import hashlib
+import time
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from collections.abc import Mapping
+from schema import compact_table, parse_dtypes, memory_report
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+PROCESSED_DIR = os.path.join(PROJECT_ROOT, 'data', 'processed')
+CACHE_DIR = os.path.join(PROJECT_ROOT, 'data', 'cache')
+
+TABLE_FILES = {
+    'home': 'home_page_table.csv',
+    'search': 'search_page_table.csv',
+    'payment': 'payment_page_table.csv',
+    'confirmation': 'payment_confirmation_table.csv',
+    'user': 'user_table.csv'
+}
+
+def file_fingerprint(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
 
-def load_data():
-    base_path = os.path.abspath(os.path.dirname(__file__))  
-    project_root = os.path.abspath(os.path.join(base_path, '..'))  
+def content_hash(path, chunk_size=1 << 20):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-    home_path = os.path.join(project_root, 'data', 'processed', 'home_page_table.csv')
-    search_path = os.path.join(project_root, 'data', 'processed', 'search_page_table.csv')
-    payment_path = os.path.join(project_root, 'data', 'processed', 'payment_page_table.csv')
-    confirmation_path = os.path.join(project_root, 'data', 'processed', 'payment_confirmation_table.csv')
-    user_path = os.path.join(project_root, 'data', 'processed', 'user_table.csv')
+def _cache_paths(csv_path, cache_dir, schema=None):
+    # o caminho absoluto entra na chave: CSVs de mesmo nome em pastas diferentes nao se sobrescrevem
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    path_key = hashlib.blake2b(os.path.abspath(csv_path).encode(), digest_size=6).hexdigest()
+    base = os.path.join(cache_dir, f"{name}-{path_key}")
+    if schema is not None:
+        # a versao compacta tem tipos diferentes e fica em outro arquivo
+        base += '-compact'
+    return f"{base}.parquet", f"{base}.json"
 
+def _replace_atomically(path, write):
+    # arquivo temporario unico na mesma pasta: escritores concorrentes nao disputam o mesmo .tmp
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix='.tmp', delete=False) as f:
+        tmp_path = f.name
     try:
-        home_df = pd.read_csv(home_path)
-        search_df = pd.read_csv(search_path)
-        payment_df = pd.read_csv(payment_path)
-        confirmation_df = pd.read_csv(confirmation_path)
-        user_df = pd.read_csv(user_path)
-        
-        #convertendo a coluna 'date' para datetime depois de carregar
-        if 'date' in user_df.columns:
-            user_df['date'] = pd.to_datetime(user_df['date'], errors='coerce')
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _write_json(data, path):
+    def write(tmp_path):
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+    _replace_atomically(path, write)
+
+def _cache_is_valid(csv_path, meta_path, date_columns=()):
+    """
+    Check the cached copy against the CSV: size first, then mtime, and only
+    when the mtime moved is the content hash recomputed to confirm a change.
+    A cache written with other date columns is not valid.
+    """
+    if not os.path.exists(meta_path):
+        return False
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+
+    if meta.get('date_columns') != list(date_columns):
+        return False
+
+    current = file_fingerprint(csv_path)
+    if current['size'] != meta.get('size'):
+        return False
+    if current['mtime_ns'] == meta.get('mtime_ns'):
+        return True
+
+    # mtime changed (touch, checkout, copy) but the content may still be the same
+    if content_hash(csv_path) != meta.get('hash'):
+        return False
+
+    meta['mtime_ns'] = current['mtime_ns']
+    _write_json(meta, meta_path)
+    return True
+
+def _write_cache(df, csv_path, parquet_path, meta_path, date_columns=()):
+    os.makedirs(os.path.dirname(parquet_path), exist_ok=True)
+    meta = file_fingerprint(csv_path)
+    meta['hash'] = content_hash(csv_path)
+    meta['date_columns'] = list(date_columns)
+
+    # escreve em arquivo temporario e troca, para nunca deixar um cache pela metade
+    _replace_atomically(parquet_path, lambda tmp_path: df.to_parquet(tmp_path, index=False))
+    _write_json(meta, meta_path)
+
+def read_table(csv_path, date_columns=(), use_cache=True, cache_dir=CACHE_DIR, schema=None):
+    """
+    Read a processed CSV through a Parquet cache keyed on the file's size,
+    mtime, content hash and date columns. Falls back to plain CSV if
+    pyarrow is missing.
+
+    `schema` names a table of schema.py ('home', ..., 'user'): its compact
+    types are used while parsing and the compact table is what gets cached.
+    """
+    parquet_path, meta_path = _cache_paths(csv_path, cache_dir, schema)
+
+    if use_cache:
+        try:
+            if _cache_is_valid(csv_path, meta_path, date_columns):
+                return pd.read_parquet(parquet_path)
+        except (OSError, ValueError, ImportError) as e:
+            print(f"Ignoring cache for {csv_path}: {str(e)}")
+
+    if schema is None:
+        df = pd.read_csv(csv_path)
+    else:
+        try:
+            df = pd.read_csv(csv_path, dtype=parse_dtypes(schema))
+        except (ValueError, OverflowError) as e:
+            # ids nulos ou fora do uint32: le na largura normal e compacta depois
+            print(f"Compact parse failed for {csv_path}, reading full width: {str(e)}")
+            df = pd.read_csv(csv_path)
+    for column in date_columns:
+        if column in df.columns:
+            df[column] = pd.to_datetime(df[column], errors='coerce')
+    if schema is not None:
+        df = compact_table(df, schema)
+
+    if use_cache:
+        try:
+            _write_cache(df, csv_path, parquet_path, meta_path, date_columns)
+        except (OSError, ValueError, ImportError) as e:
+            print(f"Could not write cache for {csv_path}: {str(e)}")
+
+    return df
+
+# tempos de leitura (em segundos) da ultima chamada de load_data, por tabela
+LAST_LOAD_TIMINGS = {}
+
+def _timed_read(name, use_cache, compact):
+    start = time.perf_counter()
+    date_columns = ['date'] if name == 'user' else ()
+    df = read_table(
+        os.path.join(PROCESSED_DIR, TABLE_FILES[name]), date_columns=date_columns,
+        use_cache=use_cache, schema=name if compact else None
+    )
+    return df, time.perf_counter() - start
+
+def load_data(use_cache=True, compact=False, max_workers=len(TABLE_FILES)):
+    try:
+        start = time.perf_counter()
+        tables = {}
+        timings = {}
+
+        #as cinco tabelas sao lidas em paralelo; max_workers=1 volta a leitura sequencial
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = {name: executor.submit(_timed_read, name, use_cache, compact) for name in TABLE_FILES}
+            for name, future in futures.items():
+                tables[name], timings[name] = future.result()
+
+        timings['total'] = time.perf_counter() - start
+        LAST_LOAD_TIMINGS.clear()
+        LAST_LOAD_TIMINGS.update(timings)
+
+        home_df, search_df, payment_df, confirmation_df, user_df = (
+            tables['home'], tables['search'], tables['payment'],
+            tables['confirmation'], tables['user']
+        )
 
         print(f"Loaded data successfully. Dimensions:")
-        print(f"Home page: {home_df.shape}")
-        print(f"Search page: {search_df.shape}")
-        print(f"Payment page: {payment_df.shape}")
-        print(f"Confirmation page: {confirmation_df.shape}")
-        print(f"User table: {user_df.shape}")
+        print(f"Home page: {home_df.shape} in {timings['home']:.3f}s")
+        print(f"Search page: {search_df.shape} in {timings['search']:.3f}s")
+        print(f"Payment page: {payment_df.shape} in {timings['payment']:.3f}s")
+        print(f"Confirmation page: {confirmation_df.shape} in {timings['confirmation']:.3f}s")
+        print(f"User table: {user_df.shape} in {timings['user']:.3f}s")
+        print(f"Total load time: {timings['total']:.3f}s")
+        if compact:
+            # antes = tipos padrao do read_csv, estimado a partir da tabela compacta
+            report = memory_report(tables)
+            print("Memory usage with compact schema:")
+            print(report.to_string(index=False))
+            print(f"Total: {report['Before_MB'].sum():.2f} MB -> {report['After_MB'].sum():.2f} MB")
         
         return home_df, search_df, payment_df, confirmation_df, user_df
     
@@ -41,27 +197,19 @@ def merge_with_users(page_df, user_df):
     merged_df = pd.merge(page_df, user_df, on='user_id', how='left')
     return merged_df
 
-def calculate_user_journeys(home_df, search_df, payment_df, confirmation_df):
-    home_users = set(home_df['user_id'])
-    search_users = set(search_df['user_id'])
-    payment_users = set(payment_df['user_id'])
-    confirmation_users = set(confirmation_df['user_id'])
-    home_to_search = home_users.intersection(search_users)
-    search_to_payment = search_users.intersection(payment_users)
-    payment_to_confirmation = payment_users.intersection(confirmation_users)
-    
+def build_funnel_df(home, home_to_search, search_to_payment, payment_to_confirmation):
     funnel_data = {
         'Stage': ['Home', 'Search', 'Payment', 'Confirmation'],
-        'Users': [len(home_users), len(home_to_search), len(search_to_payment), len(payment_to_confirmation)]
+        'Users': [home, home_to_search, search_to_payment, payment_to_confirmation]
     }
     
     funnel_df = pd.DataFrame(funnel_data)
     
     funnel_df['Conversion_Rate'] = [
         100.0,  
-        round(len(home_to_search) / len(home_users) * 100, 2),  
-        round(len(search_to_payment) / len(home_to_search) * 100, 2) if len(home_to_search) > 0 else 0,  
-        round(len(payment_to_confirmation) / len(search_to_payment) * 100, 2) if len(search_to_payment) > 0 else 0 
+        round(home_to_search / home * 100, 2),  
+        round(search_to_payment / home_to_search * 100, 2) if home_to_search > 0 else 0,  
+        round(payment_to_confirmation / search_to_payment * 100, 2) if search_to_payment > 0 else 0 
     ]
     funnel_df['Drop_Off_Rate'] = [
         0,  
@@ -70,8 +218,26 @@ def calculate_user_journeys(home_df, search_df, payment_df, confirmation_df):
         round(100 - funnel_df.loc[3, 'Conversion_Rate'], 2)   
     ]
     
-    overall_conversion = round(len(payment_to_confirmation) / len(home_users) * 100, 2) if len(home_users) > 0 else 0
-    
+    overall_conversion = round(payment_to_confirmation / home * 100, 2) if home > 0 else 0
+
+    return funnel_df, overall_conversion
+
+def calculate_user_journeys(*stage_dfs, spec=None, n_resamples=0):
+    # motor vetorizado de mascaras de bits; os conjuntos de usuarios so sao montados se forem lidos
+    # as tabelas de etapa seguem a ordem do spec (padrao: home, search, payment, confirmation)
+    # n_resamples > 0 acrescenta intervalos de confianca bootstrap ao funnel_df
+    from funnel_analysis import calculate_user_journeys_bitmask
+    return calculate_user_journeys_bitmask(*stage_dfs, spec=spec, n_resamples=n_resamples)
+
+def build_user_journeys(home_users, search_users, payment_users, confirmation_users):
+    home_to_search = home_users.intersection(search_users)
+    search_to_payment = search_users.intersection(payment_users)
+    payment_to_confirmation = payment_users.intersection(confirmation_users)
+
+    funnel_df, overall_conversion = build_funnel_df(
+        len(home_users), len(home_to_search), len(search_to_payment), len(payment_to_confirmation)
+    )
+
     return funnel_df, overall_conversion, {
         'home_users': home_users,
         'search_users': search_users,
@@ -82,38 +248,36 @@ def calculate_user_journeys(home_df, search_df, payment_df, confirmation_df):
         'payment_to_confirmation': payment_to_confirmation
     }
 
-def segment_by_attribute(home_df, search_df, payment_df, confirmation_df, user_df, attribute):
+def segment_by_attribute(*args, spec=None, index=None):
+    # chamada como segment_by_attribute(*stage_dfs, user_df, attribute)
+    *stage_dfs, user_df, attribute = args
     if attribute not in user_df.columns:
         print(f"Error: {attribute} is not a valid column in user_df")
         return None
 
-    unique_values = user_df[attribute].unique()
+    from funnel_spec import DEFAULT_FUNNEL
+    from user_index import UserIndex
+    spec = spec or DEFAULT_FUNNEL
+    # o indice de usuarios pode ser compartilhado entre varias segmentacoes
+    index = index or UserIndex(user_df)
+
+    # codigos na ordem de primeira aparicao, a mesma de unique()
+    unique_values = index.categories(attribute)
+
+    # uma unica reducao agrupada para todos os valores do atributo
+    patterns, rows = spec.segment_patterns(
+        stage_dfs, index.user_ids, index.user_codes(attribute), len(unique_values)
+    )
     
     results = {}
     
-    for value in unique_values:
-        filtered_users = user_df[user_df[attribute] == value]['user_id']
-        
-        
-        filtered_home = home_df[home_df['user_id'].isin(filtered_users)]
-        filtered_search = search_df[search_df['user_id'].isin(filtered_users)]
-        filtered_payment = payment_df[payment_df['user_id'].isin(filtered_users)]
-        filtered_confirmation = confirmation_df[confirmation_df['user_id'].isin(filtered_users)]
-        
-       
-        funnel_df, overall_conversion, _ = calculate_user_journeys(
-            filtered_home, filtered_search, filtered_payment, filtered_confirmation
-        )
+    for i, value in enumerate(unique_values):
+        funnel_df, overall_conversion = spec.funnel(patterns[i])
         
         results[value] = {
             'funnel_df': funnel_df,
             'overall_conversion': overall_conversion,
-            'counts': {
-                'home': len(filtered_home),
-                'search': len(filtered_search),
-                'payment': len(filtered_payment),
-                'confirmation': len(filtered_confirmation)
-            }
+            'counts': {stage: int(rows[i, j]) for j, stage in enumerate(spec.names)}
         }
     
     return results
@@ -123,20 +287,47 @@ def identify_new_users(user_df, days_threshold=7):
         raise ValueError("user_df precisa ter a coluna 'date'.")
 
     # 🔥 Forçar transformação para datetime SEMPRE aqui
+    # em uma Series local: o user_df de quem chama nao e alterado
     try:
-        user_df['date'] = pd.to_datetime(user_df['date'], errors='coerce')
+        dates = pd.to_datetime(user_df['date'], errors='coerce')
     except Exception as e:
         raise ValueError(f"Erro convertendo 'date' para datetime: {e}")
 
     # 🔥 Agora a data é garantidamente datetime
-    max_date = user_df['date'].max()
+    max_date = dates.max()
 
     if pd.isnull(max_date):
         raise ValueError("Nenhuma data válida encontrada em user_df['date'].")
 
-    new_users = user_df[user_df['date'] >= (max_date - pd.Timedelta(days=days_threshold))]
-    existing_users = user_df[user_df['date'] < (max_date - pd.Timedelta(days=days_threshold))]
+    new_users = user_df[dates >= (max_date - pd.Timedelta(days=days_threshold))]
+    existing_users = user_df[dates < (max_date - pd.Timedelta(days=days_threshold))]
 
     return new_users, existing_users
 
+class LazyDict(Mapping):
+    """
+    Read-only mapping whose values are produced by zero-argument callables
+    on first access and then memoized.
+    """
+
+    def __init__(self, factories):
+        self._factories = factories
+        self._values = {}
+
+    def __getitem__(self, key):
+        if key not in self._values:
+            self._values[key] = self._factories[key]()
+        return self._values[key]
 
+    def __iter__(self):
+        return iter(self._factories)
+
+    def __len__(self):
+        return len(self._factories)
+
+    def materialize(self):
+        """Compute every value and return plain nested dicts."""
+        return {
+            key: value.materialize() if isinstance(value, LazyDict) else value
+            for key, value in self.items()
+        }
@@ -6,6 +6,17 @@ import plotly.express as px
 import plotly.graph_objects as go
 import streamlit as st
 
+FUNNEL_COLORS = ["#0068c9", "#83c9ff", "#29b09d", "#7defa1"]
+DROP_OFF_COLORS = ['#ff6b6b', '#ff9e7d', '#ffcd56']
+
+def _palette(colors, n):
+    # repete a paleta quando o funil tem mais etapas que cores
+    return [colors[i % len(colors)] for i in range(n)]
+
+def step_labels(funnel_df):
+    stages = funnel_df['Stage'].tolist()
+    return [f"{a} to {b}" for a, b in zip(stages, stages[1:])]
+
 def create_funnel_chart(funnel_df, title="Conversion Funnel"):
     """
     Create a funnel chart visualizing the conversion funnel
@@ -15,7 +26,7 @@ def create_funnel_chart(funnel_df, title="Conversion Funnel"):
         y=funnel_df['Stage'],
         x=funnel_df['Users'],
         textinfo="value+percent initial",
-        marker={"color": ["#0068c9", "#83c9ff", "#29b09d", "#7defa1"]}
+        marker={"color": _palette(FUNNEL_COLORS, len(funnel_df))}
     ))
     
     fig.update_layout(
@@ -31,15 +42,15 @@ def create_conversion_rate_chart(funnel_df, title="Conversion Rates by Funnel St
     Create a bar chart showing conversion rates between funnel stages
     """
     # For conversion rates between stages
-    stages = ['Home to Search', 'Search to Payment', 'Payment to Confirmation']
-    rates = funnel_df['Conversion_Rate'].values[1:]  # Skip the first one (Home)
+    stages = step_labels(funnel_df)
+    rates = funnel_df['Conversion_Rate'].values[1:]  # Skip the first stage
     
     fig = go.Figure(go.Bar(
         x=stages,
         y=rates,
         text=[f"{rate}%" for rate in rates],
         textposition='auto',
-        marker_color=['#83c9ff', '#29b09d', '#7defa1']
+        marker_color=_palette(FUNNEL_COLORS[1:], len(stages))
     ))
     
     fig.update_layout(
@@ -61,7 +72,7 @@ def create_drop_off_chart(drop_off_df, title="Drop-off Rates by Funnel Stage"):
         y=drop_off_df['Drop_Off_Percentage'],
         text=[f"{rate}%" for rate in drop_off_df['Drop_Off_Percentage']],
         textposition='auto',
-        marker_color=['#ff6b6b', '#ff9e7d', '#ffcd56']
+        marker_color=_palette(DROP_OFF_COLORS, len(drop_off_df))
     ))
     
     fig.update_layout(
@@ -114,14 +125,13 @@ def create_stage_comparison_by_segment(segments, segment_type):
     Create a grouped bar chart comparing conversion at each stage across segments
     """
     labels = list(segments.keys())
-    stages = ['Home', 'Search', 'Payment', 'Confirmation']
     
     fig = go.Figure()
     
     for i, label in enumerate(labels):
         funnel_df = segments[label]['funnel_df']
         fig.add_trace(go.Bar(
-            x=stages,
+            x=funnel_df['Stage'],
             y=funnel_df['Users'],
             name=str(label),
             text=[f"{count}" for count in funnel_df['Users']],
@@ -165,7 +175,7 @@ def create_new_vs_existing_comparison(analysis_results):
     )
     
     # Funnel stage comparison
-    stages = ['Home', 'Search', 'Payment', 'Confirmation']
+    stages = new_data['funnel']['Stage']
     
     fig2 = go.Figure()
     
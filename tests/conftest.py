@@ -0,0 +1,9 @@
+import pytest
+from utils import load_data
+
+@pytest.fixture(scope='session')
+def tables():
+    """The five processed tables bundled in data/processed (read without the Parquet cache)."""
+    tables = load_data(use_cache=False)
+    assert tables[0] is not None, "data/processed is missing"
+    return tables
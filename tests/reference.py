@@ -0,0 +1,131 @@
+import pandas as pd
+
+# Versao original, com conjuntos Python, das analises do funil: e a referencia
+# contra a qual os motores vetorizados sao comparados nos testes.
+
+def set_journeys(home_df, search_df, payment_df, confirmation_df):
+    home_users = set(home_df['user_id'])
+    search_users = set(search_df['user_id'])
+    payment_users = set(payment_df['user_id'])
+    confirmation_users = set(confirmation_df['user_id'])
+    home_to_search = home_users.intersection(search_users)
+    search_to_payment = search_users.intersection(payment_users)
+    payment_to_confirmation = payment_users.intersection(confirmation_users)
+
+    funnel_df = pd.DataFrame({
+        'Stage': ['Home', 'Search', 'Payment', 'Confirmation'],
+        'Users': [len(home_users), len(home_to_search), len(search_to_payment), len(payment_to_confirmation)]
+    })
+    funnel_df['Conversion_Rate'] = [
+        100.0,
+        round(len(home_to_search) / len(home_users) * 100, 2) if len(home_users) > 0 else 0,
+        round(len(search_to_payment) / len(home_to_search) * 100, 2) if len(home_to_search) > 0 else 0,
+        round(len(payment_to_confirmation) / len(search_to_payment) * 100, 2) if len(search_to_payment) > 0 else 0
+    ]
+    funnel_df['Drop_Off_Rate'] = [0] + [round(100 - rate, 2) for rate in funnel_df['Conversion_Rate'][1:]]
+
+    overall_conversion = round(len(payment_to_confirmation) / len(home_users) * 100, 2) if len(home_users) > 0 else 0
+
+    return funnel_df, overall_conversion, {
+        'home_users': home_users,
+        'search_users': search_users,
+        'payment_users': payment_users,
+        'confirmation_users': confirmation_users,
+        'home_to_search': home_to_search,
+        'search_to_payment': search_to_payment,
+        'payment_to_confirmation': payment_to_confirmation
+    }
+
+def filter_users(page_dfs, user_ids):
+    return [df[df['user_id'].isin(user_ids)] for df in page_dfs]
+
+def set_segments(home_df, search_df, payment_df, confirmation_df, user_df, attribute):
+    page_dfs = (home_df, search_df, payment_df, confirmation_df)
+    results = {}
+    for value in user_df[attribute].unique():
+        filtered = filter_users(page_dfs, user_df[user_df[attribute] == value]['user_id'])
+        funnel_df, overall_conversion, _ = set_journeys(*filtered)
+        results[value] = {
+            'funnel_df': funnel_df,
+            'overall_conversion': overall_conversion,
+            'counts': {stage: len(df) for stage, df in zip(['home', 'search', 'payment', 'confirmation'], filtered)}
+        }
+    return results
+
+def set_user_types(user_df, days_threshold=7):
+    dates = pd.to_datetime(user_df['date'], errors='coerce')
+    cutoff = dates.max() - pd.Timedelta(days=days_threshold)
+    return user_df[dates >= cutoff], user_df[dates < cutoff]
+
+def set_analysis(home_df, search_df, payment_df, confirmation_df, user_df):
+    """perform_funnel_analysis as it was before the vectorized engines."""
+    page_dfs = (home_df, search_df, payment_df, confirmation_df)
+    funnel_df, overall_conversion, user_sets = set_journeys(*page_dfs)
+    new_users, existing_users = set_user_types(user_df)
+    new_funnel, new_overall, _ = set_journeys(*filter_users(page_dfs, new_users['user_id']))
+    existing_funnel, existing_overall, _ = set_journeys(*filter_users(page_dfs, existing_users['user_id']))
+
+    starts = [user_sets['home_users'], user_sets['search_users'], user_sets['payment_users']]
+    steps = [user_sets['home_to_search'], user_sets['search_to_payment'], user_sets['payment_to_confirmation']]
+    drop_off_df = pd.DataFrame({
+        'Stage': ['Home to Search', 'Search to Payment', 'Payment to Confirmation'],
+        'Drop_Off_Count': [len(start) - len(step) for start, step in zip(starts, steps)]
+    })
+    drop_off_df['Drop_Off_Percentage'] = [
+        round(count / len(start) * 100, 2) if len(start) > 0 else 0
+        for count, start in zip(drop_off_df['Drop_Off_Count'], starts)
+    ]
+
+    return {
+        'overall': {'funnel': funnel_df, 'conversion_rate': overall_conversion, 'drop_off': drop_off_df},
+        'segments': {
+            'device': set_segments(*page_dfs, user_df, 'device'),
+            'gender': set_segments(*page_dfs, user_df, 'sex'),
+            'user_type': {
+                'new': {'funnel': new_funnel, 'overall_conversion': new_overall, 'count': len(new_users)},
+                'existing': {'funnel': existing_funnel, 'overall_conversion': existing_overall, 'count': len(existing_users)}
+            }
+        },
+        'user_counts': {'total': len(user_df), 'new': len(new_users), 'existing': len(existing_users)}
+    }
+
+def user_stages(*stage_dfs):
+    """Stages (positions in stage_dfs) of every user, one Python set per user."""
+    stages = {}
+    for i, df in enumerate(stage_dfs):
+        for user_id in df['user_id'].tolist():
+            stages.setdefault(user_id, set()).add(i)
+    return stages
+
+def loop_depth(*stage_dfs):
+    """Users per number of stages reached, counted user by user (the old Advanced Analytics loop)."""
+    depth = {}
+    for stages in user_stages(*stage_dfs).values():
+        depth[len(stages)] = depth.get(len(stages), 0) + 1
+    return [depth.get(steps, 0) for steps in range(1, len(stage_dfs) + 1)]
+
+def loop_funnel_users(*stage_dfs, strict=False):
+    """
+    Users counted at each stage, user by user: a loose step needs the
+    previous stage and this one, a strict step every stage up to this one.
+    """
+    users = [0] * len(stage_dfs)
+    for stages in user_stages(*stage_dfs).values():
+        for i in range(len(stage_dfs)):
+            needed = set(range(i + 1)) if strict else {max(i - 1, 0), i}
+            if needed <= stages:
+                users[i] += 1
+    return users
+
+def assert_same_results(expected, actual, path='results'):
+    """Same keys (in the same order), equal DataFrames and equal values, recursively."""
+    if isinstance(expected, pd.DataFrame):
+        pd.testing.assert_frame_equal(
+            expected.reset_index(drop=True), actual.reset_index(drop=True), check_dtype=False, obj=path
+        )
+    elif isinstance(expected, dict):
+        assert list(expected) == list(actual), f"{path}: {list(expected)} != {list(actual)}"
+        for key in expected:
+            assert_same_results(expected[key], actual[key], f"{path}.{key}")
+    else:
+        assert expected == actual, f"{path}: {expected!r} != {actual!r}"
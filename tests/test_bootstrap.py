@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from analysis import perform_funnel_analysis
+from bootstrap import CI_HIGH, CI_LOW, funnel_intervals
+from funnel_spec import DEFAULT_FUNNEL
+
+# histograma pequeno: quantos usuarios tem cada padrao de etapas (bit 0 = Home, ...)
+SMALL_PATTERNS = np.zeros(DEFAULT_FUNNEL.n_patterns, dtype=np.int64)
+SMALL_PATTERNS[[0b0001, 0b0011, 0b0111, 0b1111, 0b0101, 0b0010]] = [120, 60, 25, 10, 8, 5]
+
+def index_bootstrap(pattern_counts, n_resamples, confidence=0.95, seed=0):
+    # bootstrap classico: sorteia N indices de usuarios com reposicao em cada reamostragem
+    rng = np.random.default_rng(seed)
+    masks = np.repeat(np.arange(len(pattern_counts)), pattern_counts)
+    samples = masks[rng.integers(0, len(masks), size=(n_resamples, len(masks)))]
+    counts = np.stack([np.bincount(sample, minlength=len(pattern_counts)) for sample in samples])
+    users = counts @ DEFAULT_FUNNEL.reached_matrix
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = np.concatenate([users[:, 1:] / users[:, :-1], users[:, -1:] / users[:, :1]], axis=1) * 100
+    tail = (1 - confidence) / 2 * 100
+    return np.nanpercentile(rates, [tail, 100 - tail], axis=0)
+
+def test_same_seed_same_intervals():
+    first = funnel_intervals(SMALL_PATTERNS, n_resamples=500, seed=7)
+    second = funnel_intervals(SMALL_PATTERNS, n_resamples=500, seed=7)
+    other = funnel_intervals(SMALL_PATTERNS, n_resamples=500, seed=8)
+    assert all(np.array_equal(a, b) for a, b in zip(first, second))
+    assert not all(np.array_equal(a, b) for a, b in zip(first, other))
+
+def test_multinomial_matches_per_user_resample():
+    low, high = funnel_intervals(SMALL_PATTERNS, n_resamples=20_000, seed=1)
+    brute_low, brute_high = index_bootstrap(SMALL_PATTERNS, n_resamples=20_000, seed=2)
+    # as duas distribuicoes sao a mesma; a diferenca e so ruido de Monte Carlo
+    assert low == pytest.approx(brute_low, abs=0.75)
+    assert high == pytest.approx(brute_high, abs=0.75)
+
+def test_stacked_histograms_match_one_by_one():
+    stack = np.vstack([SMALL_PATTERNS, SMALL_PATTERNS * 3])
+    low, high = funnel_intervals(stack, n_resamples=5_000, seed=0)
+    for i, patterns in enumerate(stack):
+        single_low, single_high = funnel_intervals(patterns, n_resamples=5_000, seed=3)
+        assert low[i] == pytest.approx(single_low, abs=2)
+        assert high[i] == pytest.approx(single_high, abs=2)
+
+def test_intervals_contain_the_point_estimates(tables):
+    results = perform_funnel_analysis(*tables, n_resamples=500)
+    funnels = [(results['overall']['funnel'], results['overall']['conversion_rate'], results['overall']['conversion_rate_ci'])]
+    for dimension, funnel_key in [('device', 'funnel_df'), ('gender', 'funnel_df'), ('user_type', 'funnel')]:
+        for data in results['segments'][dimension].values():
+            funnels.append((data[funnel_key], data['overall_conversion'], data['overall_conversion_ci']))
+
+    for funnel_df, overall_conversion, (overall_low, overall_high) in funnels:
+        assert (funnel_df[CI_LOW] <= funnel_df['Conversion_Rate']).all()
+        assert (funnel_df['Conversion_Rate'] <= funnel_df[CI_HIGH]).all()
+        assert overall_low <= overall_conversion <= overall_high
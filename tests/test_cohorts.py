@@ -0,0 +1,25 @@
+import pandas as pd
+import pytest
+from cohorts import rolling_cohort_funnels
+from reference import filter_users, set_journeys
+
+@pytest.mark.parametrize('window_days', [1, 7, 30])
+def test_windows_match_direct_filter(tables, window_days):
+    *page_dfs, user_df = tables
+    cohorts = rolling_cohort_funnels(*page_dfs, user_df=user_df, window_days=window_days)
+    dates = pd.to_datetime(user_df['date']).dt.normalize()
+    assert len(cohorts) == (dates.max() - dates.min()).days - window_days + 2
+
+    # algumas janelas espalhadas pelo periodo, cada uma filtrando os eventos
+    rate_columns = [column for column in cohorts.columns if column.endswith('_Rate')]
+    for _, row in cohorts.iloc[::max(1, len(cohorts) // 6)].iterrows():
+        users = user_df[dates.between(row['Window_Start'], row['Window_End'])]
+        funnel_df, overall_conversion, _ = set_journeys(*filter_users(page_dfs, users['user_id']))
+        assert row['Signups'] == len(users)
+        assert row[list(funnel_df['Stage'])].tolist() == funnel_df['Users'].tolist()
+        assert row[rate_columns].tolist() == funnel_df['Conversion_Rate'][1:].tolist()
+        assert row['Overall_Conversion'] == overall_conversion
+
+def test_window_longer_than_range(tables):
+    *page_dfs, user_df = tables
+    assert rolling_cohort_funnels(*page_dfs, user_df=user_df, window_days=10_000).empty
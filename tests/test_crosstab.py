@@ -0,0 +1,43 @@
+import pandas as pd
+from crosstab import step_conversion, step_dropoff, step_segment_counts
+
+# segmento sem nenhuma linha: a taxa fica vazia
+SEGMENTS = ['Desktop', 'Mobile', 'Tablet']
+
+def loop_rates(step_dfs, segments, segment_name, column, rate):
+    # versao original da aba Advanced Analytics: um filtro por (etapa, segmento)
+    rows = []
+    for step_idx in range(len(step_dfs) - 1):
+        start_step, next_step = step_dfs[step_idx], step_dfs[step_idx + 1]
+        for segment in segments:
+            start_segment = start_step[start_step[segment_name] == segment]
+            next_segment = next_step[next_step[segment_name] == segment]
+            value = None if len(start_segment) == 0 else rate(len(next_segment) / len(start_segment))
+            rows.append({
+                column: f"Step {step_idx + 1} → {step_idx + 2}",
+                'Segment': segment,
+                'Rate': round(value * 100, 2) if value is not None else None
+            })
+    return pd.DataFrame(rows)
+
+def labeled_steps(tables):
+    *page_dfs, user_df = tables
+    return [pd.merge(df, user_df[['user_id', 'device']], on='user_id', how='left') for df in page_dfs]
+
+def test_dropoff_matches_loop(tables):
+    step_dfs = labeled_steps(tables)
+    expected = loop_rates(step_dfs, SEGMENTS, 'device', 'From Step', lambda ratio: 1 - ratio)
+    expected = expected.rename(columns={'Rate': 'Drop-off Rate'})
+    actual = step_dropoff([df['device'] for df in step_dfs], SEGMENTS)
+    pd.testing.assert_frame_equal(expected, actual, check_dtype=False)
+
+def test_conversion_matches_loop(tables):
+    step_dfs = labeled_steps(tables)
+    expected = loop_rates(step_dfs, SEGMENTS, 'device', 'Step', lambda ratio: ratio)
+    expected = expected.rename(columns={'Rate': 'Conversion Rate'})
+    actual = step_conversion([df['device'] for df in step_dfs], SEGMENTS)
+    pd.testing.assert_frame_equal(expected, actual, check_dtype=False)
+
+def test_counts_skip_missing_and_unknown_labels():
+    labels = [pd.Series(['a', 'b', None, 'c', 'a']), pd.Series(['b', 'b'])]
+    assert step_segment_counts(labels, ['a', 'b']).tolist() == [[2, 1], [0, 2]]
@@ -0,0 +1,13 @@
+import pandas as pd
+from dataset import FunnelDataset
+
+def test_users_without_signup_date_have_no_user_type(tables):
+    *page_dfs, user_df = tables
+    user_df = user_df.head(5).assign(date=pd.to_datetime(['2015-04-30', '2015-01-01', None, '2015-04-28', 'x'], errors='coerce'))
+    dataset = FunnelDataset(use_cache=False)
+    # tabelas ja carregadas, sem ler os CSVs
+    dataset._products['tables'] = (*page_dfs, user_df)
+
+    assert dataset.user_types.tolist()[:2] == ['New User', 'Existing User']
+    assert dataset.user_types.isna().tolist() == [False, False, True, False, True]
+    assert dataset.user_counts == {'total': 5, 'new': 2, 'existing': 1}
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+from analysis import perform_funnel_analysis
+from funnel_analysis import calculate_user_journeys_bitmask, funnel_depth, popcount
+from funnel_spec import DEFAULT_FUNNEL, FunnelSpec
+from reference import set_journeys, set_analysis, assert_same_results, loop_depth, loop_funnel_users
+
+def test_bitmask_journeys_match_sets(tables):
+    expected_df, expected_overall, expected_sets = set_journeys(*tables[:4])
+    funnel_df, overall_conversion, user_sets = calculate_user_journeys_bitmask(*tables[:4])
+
+    assert_same_results(expected_df, funnel_df)
+    assert overall_conversion == expected_overall
+    assert list(user_sets) == list(expected_sets)
+    for key, users in expected_sets.items():
+        assert set(user_sets[key]) == users, key
+
+def test_analysis_matches_set_baseline(tables):
+    assert_same_results(set_analysis(*tables), perform_funnel_analysis(*tables))
+
+def skipping_stages():
+    # usuarios que pulam etapas: os funis frouxo e estrito diferem
+    rng = np.random.default_rng(5)
+    return [pd.DataFrame({'user_id': rng.choice(500, size=size)}) for size in [600, 300, 200, 80]]
+
+@pytest.mark.parametrize('data', ['bundled', 'skipping'])
+@pytest.mark.parametrize('strict', [False, True])
+def test_funnel_depth_matches_per_user_loop(tables, data, strict):
+    stage_dfs = list(tables[:4]) if data == 'bundled' else skipping_stages()
+    spec = FunnelSpec(DEFAULT_FUNNEL.names, strict=strict)
+    depth_df, pattern_df = funnel_depth(*stage_dfs, spec=spec)
+
+    assert depth_df['Steps_Completed'].tolist() == [1, 2, 3, 4]
+    assert depth_df['Users'].tolist() == loop_depth(*stage_dfs)
+    assert pattern_df['Users'].sum() == depth_df['Users'].sum()
+    assert (pattern_df['Steps_Completed'] == popcount(pattern_df['Pattern'].to_numpy())).all()
+
+    # o histograma de padroes reproduz o funil do spec, frouxo ou estrito
+    pattern_counts = np.concatenate([[0], pattern_df['Users'].to_numpy()])
+    assert spec.stage_users(pattern_counts).tolist() == loop_funnel_users(*stage_dfs, strict=strict)
+
+def test_loose_and_strict_differ_when_stages_are_skipped():
+    stage_dfs = skipping_stages()
+    assert loop_funnel_users(*stage_dfs) != loop_funnel_users(*stage_dfs, strict=True)
+
+def test_popcount():
+    values = np.array([0, 1, 3, 15, 2 ** 40 + 1], dtype=np.uint64)
+    assert popcount(values).tolist() == [0, 1, 2, 4, 2]
@@ -0,0 +1,128 @@
+import pandas as pd
+import pytest
+from analysis import perform_funnel_analysis
+from funnel_cube import FunnelCube
+from funnel_spec import FunnelSpec, FunnelStage
+from sql_backend import SQLiteBackend
+from reference import filter_users, set_analysis, set_journeys, set_user_types, assert_same_results
+
+FILTERS = [
+    {'device': 'Mobile'},
+    {'sex': ['Female'], 'user_type': 'New User'},
+    {'date': ('2015-02-01', '2015-03-15')},
+    {'device': 'Desktop', 'sex': 'Male', 'date': ('2015-03-01', '2015-04-30')},
+]
+
+@pytest.fixture(scope='module')
+def cube(tables):
+    return FunnelCube.build(*tables)
+
+def filter_user_df(user_df, filters):
+    # o tipo de usuario usa o corte da tabela inteira, como o cubo
+    new_users, _ = set_user_types(user_df)
+    user_type = user_df['user_id'].isin(new_users['user_id']).map({True: 'New User', False: 'Existing User'})
+    columns = {'device': user_df['device'], 'sex': user_df['sex'], 'user_type': user_type}
+    selected = pd.Series(True, index=user_df.index)
+    for dim, value in filters.items():
+        if dim == 'date':
+            dates = pd.to_datetime(user_df['date']).dt.normalize()
+            selected &= dates.between(pd.Timestamp(value[0]), pd.Timestamp(value[1]))
+        else:
+            selected &= columns[dim].isin(value if isinstance(value, list) else [value])
+    return user_df[selected], user_type[selected]
+
+def direct_results(tables, filters):
+    """analysis_results of the users matching the filters, filtering the events directly."""
+    *page_dfs, user_df = tables
+    users, user_type = filter_user_df(user_df, filters)
+    page_dfs = filter_users(page_dfs, users['user_id'])
+    results = set_analysis(*page_dfs, users)
+
+    user_types = {}
+    for key, label in zip(['new', 'existing'], ['New User', 'Existing User']):
+        funnel_df, overall_conversion, _ = set_journeys(*filter_users(page_dfs, users['user_id'][user_type == label]))
+        user_types[key] = {'funnel': funnel_df, 'overall_conversion': overall_conversion, 'count': int((user_type == label).sum())}
+    results['segments']['user_type'] = user_types
+    results['user_counts'] = {'total': len(users), 'new': user_types['new']['count'], 'existing': user_types['existing']['count']}
+    return results
+
+def in_cube_order(expected, actual):
+    # o cubo lista os valores na ordem da tabela inteira
+    assert set(expected) == set(actual)
+    return {value: expected[value] for value in actual}
+
+def test_unfiltered_cube_matches_baseline(tables, cube):
+    assert_same_results(set_analysis(*tables), cube.analysis_results())
+
+@pytest.mark.parametrize('filters', FILTERS)
+def test_filtered_cube_matches_direct_filter(tables, cube, filters):
+    expected = direct_results(tables, filters)
+    actual = cube.analysis_results(**filters)
+    for dimension in ['device', 'gender']:
+        expected['segments'][dimension] = in_cube_order(expected['segments'][dimension], actual['segments'][dimension])
+    assert_same_results(expected, actual)
+
+def test_rollup_rows(tables, cube):
+    *page_dfs, user_df = tables
+    users, _ = filter_user_df(user_df, {'device': 'Mobile'})
+    _, rows = cube.rollup(device='Mobile')
+    assert rows.tolist() == [len(df) for df in filter_users(page_dfs, users['user_id'])]
+
+def test_date_filter_uses_whole_days(tables):
+    *page_dfs, user_df = tables
+    # horarios na data de cadastro: o dia final entra inteiro
+    user_df = user_df.assign(date=pd.to_datetime(user_df['date']) + pd.Timedelta(hours=18))
+    cube = FunnelCube.build(*page_dfs, user_df)
+    filters = {'date': ('2015-02-01', '2015-02-28')}
+    assert cube.user_count(**filters) == len(filter_user_df(user_df, filters)[0])
+
+def test_saved_cube_is_checked_against_the_fingerprint(cube, tmp_path):
+    path = str(tmp_path / 'cube.parquet')
+    cube.save('abc', path)
+    loaded = FunnelCube.load('abc', path)
+    assert_same_results(cube.analysis_results(device='Mobile'), loaded.analysis_results(device='Mobile'))
+    with pytest.raises(ValueError):
+        FunnelCube.load('other data', path)
+
+def test_failed_save_leaves_no_temp_file(cube, tmp_path, monkeypatch):
+    def failing_to_parquet(self, path, **kwargs):
+        raise OSError("disk full")
+    monkeypatch.setattr(pd.DataFrame, 'to_parquet', failing_to_parquet)
+    with pytest.raises(OSError):
+        cube.save('abc', str(tmp_path / 'cube.parquet'))
+    assert list(tmp_path.iterdir()) == []
+
+def test_cube_follows_a_custom_spec(tables, tmp_path):
+    *page_dfs, user_df = tables
+    home_df, search_df, payment_df, confirmation_df = page_dfs
+    spec = FunnelSpec(['home', 'search', FunnelStage('cart', table='cart_page_table.csv'), 'payment', 'confirmation'])
+    cart_df = search_df.sample(frac=0.5, random_state=4)
+    stage_dfs = [home_df, search_df, cart_df, payment_df, confirmation_df]
+
+    cube = FunnelCube.build(*stage_dfs, user_df, spec=spec)
+    assert cube.patterns.shape[1] == spec.n_patterns
+    assert_same_results(perform_funnel_analysis(*stage_dfs, user_df, spec=spec), cube.analysis_results())
+
+    mobile = user_df[user_df['device'] == 'Mobile']
+    expected = perform_funnel_analysis(*filter_users(stage_dfs, mobile['user_id']), mobile, spec=spec)
+    actual = cube.analysis_results(device='Mobile')
+    assert_same_results(expected['overall'], actual['overall'])
+    gender = actual['segments']['gender']
+    assert_same_results(in_cube_order(expected['segments']['gender'], gender), gender)
+
+    # um cubo salvo so volta com o mesmo funil
+    path = str(tmp_path / 'cube.parquet')
+    cube.save('abc', path)
+    assert_same_results(cube.analysis_results(sex='Male'), FunnelCube.load('abc', path, spec=spec).analysis_results(sex='Male'))
+    with pytest.raises(ValueError):
+        FunnelCube.load('abc', path)
+
+@pytest.fixture(scope='module')
+def sqlite_cube(tmp_path_factory):
+    backend = SQLiteBackend(db_path=str(tmp_path_factory.mktemp('sqlite') / 'funnel.sqlite'))
+    yield backend.cube()
+    backend.conn.close()
+
+@pytest.mark.parametrize('filters', [{}] + FILTERS)
+def test_sqlite_cube_matches_pandas_cube(cube, sqlite_cube, filters):
+    assert_same_results(cube.analysis_results(**filters), sqlite_cube.analysis_results(**filters))
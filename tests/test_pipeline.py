@@ -0,0 +1,47 @@
+import os
+import pandas as pd
+import pytest
+from utils import TABLE_FILES
+from pipeline import run_pipeline
+
+@pytest.fixture
+def dirs(tables, tmp_path):
+    raw_dir, processed_dir = tmp_path / 'raw', tmp_path / 'processed'
+    raw_dir.mkdir()
+    processed_dir.mkdir()
+    # amostra pequena de cada tabela, com linhas repetidas nas paginas
+    for name, df in zip(TABLE_FILES, tables):
+        sample = df.head(200)
+        if name != 'user':
+            sample = pd.concat([sample, sample.head(20)])
+        sample.to_csv(raw_dir / TABLE_FILES[name], index=False)
+    return str(raw_dir), str(processed_dir), str(tmp_path / 'manifest.json')
+
+def run(dirs, **kwargs):
+    raw_dir, processed_dir, manifest_path = dirs
+    return run_pipeline(raw_dir=raw_dir, processed_dir=processed_dir, manifest_path=manifest_path, **kwargs)
+
+def test_second_run_skips_every_table(dirs):
+    assert set(run(dirs).values()) == {'built'}
+    assert set(run(dirs).values()) == {'skipped'}
+
+    processed = pd.read_csv(os.path.join(dirs[1], TABLE_FILES['home']))
+    assert len(processed) == 200
+
+def test_touched_raw_file_with_same_content_is_skipped(dirs):
+    run(dirs)
+    raw_path = os.path.join(dirs[0], TABLE_FILES['home'])
+    os.utime(raw_path, ns=(0, 0))
+    assert run(dirs)['home'] == 'skipped'
+
+def test_changed_inputs_and_outputs_are_rebuilt(dirs):
+    run(dirs)
+    with open(os.path.join(dirs[0], TABLE_FILES['search']), 'a') as f:
+        f.write("999999999,search_page\n")
+    os.remove(os.path.join(dirs[1], TABLE_FILES['payment']))
+
+    status = run(dirs)
+    assert status['search'] == 'built'
+    assert status['payment'] == 'built'
+    assert status['home'] == 'skipped'
+    assert run(dirs, tables=['home'], force=True) == {'home': 'built'}
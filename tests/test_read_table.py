@@ -0,0 +1,87 @@
+import os
+import pandas as pd
+import pytest
+import utils
+from utils import _cache_is_valid, _cache_paths, read_table
+
+CSV = "user_id,date,device,sex\n1,2015-01-01,Desktop,Male\n2,2015-02-01,Mobile,Female\n"
+
+@pytest.fixture
+def csv_reads(monkeypatch):
+    # conta as leituras do CSV: cache reaproveitado nao passa por read_csv
+    calls = []
+    read_csv = pd.read_csv
+    def counting_read_csv(*args, **kwargs):
+        calls.append(args[0])
+        return read_csv(*args, **kwargs)
+    monkeypatch.setattr(utils.pd, 'read_csv', counting_read_csv)
+    return calls
+
+def write_csv(tmp_path, content=CSV):
+    path = tmp_path / 'user_table.csv'
+    path.write_text(content)
+    return str(path)
+
+def read(csv_path, tmp_path, **kwargs):
+    return read_table(csv_path, cache_dir=str(tmp_path / 'cache'), **kwargs)
+
+def test_unchanged_file_reuses_cache(tmp_path, csv_reads):
+    csv_path = write_csv(tmp_path)
+    first = read(csv_path, tmp_path)
+    second = read(csv_path, tmp_path)
+    assert len(csv_reads) == 1
+    pd.testing.assert_frame_equal(first, second)
+
+def test_touch_with_same_content_reuses_cache(tmp_path, csv_reads):
+    csv_path = write_csv(tmp_path)
+    read(csv_path, tmp_path)
+    parquet_path, meta_path = _cache_paths(csv_path, str(tmp_path / 'cache'))
+    parquet_mtime = os.stat(parquet_path).st_mtime_ns
+
+    stat = os.stat(csv_path)
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert _cache_is_valid(csv_path, meta_path)
+    read(csv_path, tmp_path)
+
+    assert len(csv_reads) == 1
+    assert os.stat(parquet_path).st_mtime_ns == parquet_mtime
+
+@pytest.mark.parametrize('new_content', [
+    # mesmo tamanho, conteudo diferente
+    CSV.replace('Desktop', 'Tablet!'),
+    # tamanho diferente
+    CSV + "3,2015-03-01,Desktop,Male\n"
+])
+def test_changed_file_rebuilds_cache(tmp_path, csv_reads, new_content):
+    csv_path = write_csv(tmp_path)
+    stat = os.stat(csv_path)
+    read(csv_path, tmp_path)
+
+    write_csv(tmp_path, new_content)
+    # mtime restaurado: so o tamanho ou o hash podem denunciar a mudanca
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    df = read(csv_path, tmp_path)
+
+    assert len(csv_reads) == 2
+    pd.testing.assert_frame_equal(df, pd.read_csv(csv_path))
+
+def test_date_columns_are_part_of_the_key(tmp_path):
+    csv_path = write_csv(tmp_path)
+    plain = read(csv_path, tmp_path)
+    dated = read(csv_path, tmp_path, date_columns=['date'])
+    plain_again = read(csv_path, tmp_path)
+
+    assert not pd.api.types.is_datetime64_any_dtype(plain['date'])
+    assert pd.api.types.is_datetime64_any_dtype(dated['date'])
+    assert not pd.api.types.is_datetime64_any_dtype(plain_again['date'])
+
+def test_schema_is_part_of_the_key(tmp_path):
+    csv_path = write_csv(tmp_path)
+    compact = read(csv_path, tmp_path, schema='user')
+    wide = read(csv_path, tmp_path)
+    compact_again = read(csv_path, tmp_path, schema='user')
+
+    assert isinstance(compact['device'].dtype, pd.CategoricalDtype)
+    assert not isinstance(wide['device'].dtype, pd.CategoricalDtype)
+    assert wide['user_id'].dtype == 'int64'
+    pd.testing.assert_frame_equal(compact, compact_again)
@@ -0,0 +1,100 @@
+import sys
+import threading
+import time
+import numpy as np
+import pandas as pd
+from result_cache import ResultCache, estimate_size
+from utils import LazyDict
+
+ARRAY_BYTES = 8_000
+
+def block(value=0):
+    # 1000 int64 = 8000 bytes
+    return np.full(1000, value, dtype=np.int64)
+
+def test_least_recently_used_entry_is_evicted_first():
+    cache = ResultCache(max_bytes=3 * ARRAY_BYTES)
+    for key in 'abc':
+        cache.put(key, block())
+    cache.get('a')
+    cache.put('d', block())
+
+    assert 'b' not in cache
+    assert list(cache._entries) == ['c', 'a', 'd']
+    assert cache.stats()['evictions'] == 1
+
+def test_memory_cap():
+    cache = ResultCache(max_bytes=5 * ARRAY_BYTES // 2)
+    for i in range(10):
+        cache.put(i, block(i))
+        assert cache.total_bytes <= cache.max_bytes
+    assert list(cache._entries) == [8, 9]
+    assert cache.total_bytes == 2 * ARRAY_BYTES
+
+    # valores maiores que o limite nao entram, mas sao devolvidos
+    big = np.zeros(10_000, dtype=np.int64)
+    assert cache.put('big', big) is big
+    assert 'big' not in cache
+    assert list(cache._entries) == [8, 9]
+
+def test_replacing_a_key_updates_the_size():
+    cache = ResultCache(max_bytes=10 * ARRAY_BYTES)
+    cache.put('a', block())
+    cache.put('a', np.zeros(2000, dtype=np.int64))
+    assert cache.total_bytes == 2 * ARRAY_BYTES
+    cache.discard('a')
+    assert cache.total_bytes == 0 and len(cache) == 0
+
+def test_concurrent_get_or_compute_runs_once():
+    cache = ResultCache()
+    calls = []
+    start = threading.Barrier(8)
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return block(7)
+
+    results = []
+    def worker():
+        start.wait()
+        results.append(cache.get_or_compute('key', compute))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len(results) == 8 and all(result is results[0] for result in results)
+    assert cache.stats()['misses'] == 1
+
+def test_estimate_size_of_tables_and_arrays():
+    df = pd.DataFrame({'user_id': np.arange(1000), 'device': ['Desktop', 'Mobile'] * 500})
+    assert estimate_size(df) == int(df.memory_usage(index=True, deep=True).sum())
+    assert estimate_size(df['user_id']) == int(df['user_id'].memory_usage(index=True, deep=True))
+    assert estimate_size(block()) == ARRAY_BYTES
+    assert estimate_size(None) == 0
+
+def test_estimate_size_of_nested_dicts_counts_shared_values_once():
+    shared = block()
+    nested = {'a': {'b': shared, 'c': [shared, block()]}}
+    size = estimate_size(nested)
+    assert 2 * ARRAY_BYTES < size < 3 * ARRAY_BYTES
+
+def test_estimate_size_of_lazy_dict():
+    lazy = LazyDict({'a': block, 'b': lambda: np.zeros(100_000)})
+    # so o que ja foi calculado pesa
+    assert estimate_size(lazy) < ARRAY_BYTES
+    lazy['a']
+    assert ARRAY_BYTES < estimate_size(lazy) < 2 * ARRAY_BYTES
+
+def test_estimate_size_of_classes_and_objects():
+    class Holder:
+        def __init__(self):
+            self.values = block()
+            self.dtype = np.uint8
+
+    assert estimate_size(np.uint8) == sys.getsizeof(np.uint8)
+    assert ARRAY_BYTES < estimate_size(Holder()) < 2 * ARRAY_BYTES
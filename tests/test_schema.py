@@ -0,0 +1,22 @@
+import os
+import pandas as pd
+import pytest
+from utils import PROCESSED_DIR, TABLE_FILES, read_table
+from schema import full_width_memory, memory_report, table_memory
+
+@pytest.mark.parametrize('name', list(TABLE_FILES))
+def test_full_width_estimate_matches_a_wide_read(name, tmp_path):
+    csv_path = os.path.join(PROCESSED_DIR, TABLE_FILES[name])
+    date_columns = ['date'] if name == 'user' else ()
+    compact = read_table(csv_path, date_columns=date_columns, use_cache=False, schema=name)
+
+    # leitura larga com texto em object, como o read_csv do pandas 2
+    wide = pd.read_csv(csv_path, dtype={'page': object, 'device': object, 'sex': object})
+    for column in date_columns:
+        wide[column] = pd.to_datetime(wide[column], errors='coerce')
+    assert full_width_memory(compact) == table_memory(wide)
+
+def test_memory_report_rows(tables):
+    report = memory_report(dict(zip(TABLE_FILES, tables)))
+    assert report['Table'].tolist() == list(TABLE_FILES)
+    assert report['Rows'].tolist() == [len(df) for df in tables]
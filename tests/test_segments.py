@@ -0,0 +1,32 @@
+import pandas as pd
+import pytest
+from utils import identify_new_users, segment_by_attribute
+from user_index import UserIndex
+from reference import set_segments, assert_same_results
+
+@pytest.mark.parametrize('attribute', ['device', 'sex'])
+def test_grouped_segments_match_filter_loop(tables, attribute):
+    expected = set_segments(*tables, attribute)
+    assert_same_results(expected, segment_by_attribute(*tables, attribute))
+
+def test_shared_index_and_partial_user_table(tables):
+    *page_dfs, user_df = tables
+    # usuarios de eventos fora de user_df nao entram em nenhum segmento
+    users = user_df.sample(frac=0.3, random_state=3)
+    index = UserIndex(users)
+    for attribute in ['device', 'sex']:
+        assert_same_results(
+            set_segments(*page_dfs, users, attribute),
+            segment_by_attribute(*page_dfs, users, attribute, index=index)
+        )
+
+def test_unknown_attribute(tables):
+    assert segment_by_attribute(*tables, 'country') is None
+
+def test_identify_new_users_leaves_user_df_unchanged():
+    user_df = pd.DataFrame({'user_id': [1, 2, 3], 'date': ['2015-04-30', '2015-01-01', 'x']})
+    before = user_df.copy()
+    new_users, existing_users = identify_new_users(user_df)
+    pd.testing.assert_frame_equal(user_df, before)
+    assert new_users['user_id'].tolist() == [1]
+    assert existing_users['user_id'].tolist() == [2]
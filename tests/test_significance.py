@@ -0,0 +1,73 @@
+import math
+from itertools import combinations
+import numpy as np
+import pytest
+from analysis import perform_funnel_analysis
+from significance import adjust_pvalues, analysis_tests, segment_pair_tests, two_proportion_z
+
+def scalar_z(successes_a, trials_a, successes_b, trials_b):
+    # teste z de duas proporcoes, um par por vez
+    pooled = (successes_a + successes_b) / (trials_a + trials_b)
+    se = math.sqrt(pooled * (1 - pooled) * (1 / trials_a + 1 / trials_b))
+    return (successes_a / trials_a - successes_b / trials_b) / se
+
+def chi_square(successes_a, trials_a, successes_b, trials_b):
+    observed = np.array([[successes_a, trials_a - successes_a], [successes_b, trials_b - successes_b]], dtype=float)
+    expected = observed.sum(axis=1, keepdims=True) * observed.sum(axis=0) / observed.sum()
+    return ((observed - expected) ** 2 / expected).sum()
+
+@pytest.fixture(scope='module')
+def results(tables):
+    return perform_funnel_analysis(*tables)
+
+def test_batched_tests_match_pair_loop(results):
+    segments = results['segments']['device']
+    tests = segment_pair_tests(segments)
+
+    rows = iter(tests.itertuples(index=False))
+    for a, b in combinations(segments, 2):
+        users_a = segments[a]['funnel_df']['Users'].tolist()
+        users_b = segments[b]['funnel_df']['Users'].tolist()
+        pairs = list(zip(users_a[1:], users_a[:-1], users_b[1:], users_b[:-1]))
+        pairs.append((users_a[-1], users_a[0], users_b[-1], users_b[0]))
+        for counts in pairs:
+            row = next(rows)
+            z = scalar_z(*counts)
+            assert (row.Segment_A, row.Segment_B) == (a, b)
+            assert row.Z == round(z, 3)
+            assert row.P_Value == pytest.approx(math.erfc(abs(z) / math.sqrt(2)))
+            assert z ** 2 == pytest.approx(chi_square(*counts))
+    assert next(rows, None) is None
+
+def test_empty_side_is_not_significant():
+    z, p_value = two_proportion_z([0, 5], [0, 10], [3, 5], [10, 0])
+    assert z.tolist() == [0.0, 0.0]
+    assert p_value.tolist() == [1.0, 1.0]
+
+def test_corrections_match_textbook_loops():
+    p_values = np.array([0.01, 0.04, 0.03, 0.2, 0.005])
+    n = len(p_values)
+    order = np.argsort(p_values)
+
+    holm = np.empty(n)
+    running = 0.0
+    for rank, i in enumerate(order):
+        running = max(running, p_values[i] * (n - rank))
+        holm[i] = min(running, 1.0)
+
+    bh = np.empty(n)
+    running = 1.0
+    for rank in range(n - 1, -1, -1):
+        i = order[rank]
+        running = min(running, p_values[i] * n / (rank + 1))
+        bh[i] = running
+
+    assert adjust_pvalues(p_values, 'holm') == pytest.approx(holm)
+    assert adjust_pvalues(p_values, 'fdr_bh') == pytest.approx(bh)
+    assert adjust_pvalues(p_values, 'bonferroni') == pytest.approx(np.minimum(p_values * n, 1))
+
+def test_analysis_tests_cover_every_dimension(results):
+    tests = analysis_tests(results)
+    assert set(tests['Dimension']) == {'device', 'gender', 'user_type'}
+    assert (tests['P_Adjusted'] >= tests['P_Value']).all()
+    assert (tests['Significant'] == (tests['P_Adjusted'] < 0.05)).all()
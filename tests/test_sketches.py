@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sketches import FunnelSketches, HyperLogLog, intersection_count, relative_error, sketch_funnel
+from reference import filter_users, set_journeys
+
+# margem de 4 erros padrao: os hashes sao deterministicos, entao o teste tambem e
+TOLERANCE = 4
+
+def random_ids(n, seed):
+    return np.random.default_rng(seed).choice(10 ** 9, size=n, replace=False)
+
+@pytest.mark.parametrize('precision', [10, 14])
+@pytest.mark.parametrize('n', [100, 5_000, 200_000])
+def test_count_within_error_bound(precision, n):
+    sketch = HyperLogLog.from_ids(random_ids(n, seed=n), precision)
+    value, error = sketch.count()
+    assert error == pytest.approx(value * relative_error(precision))
+    assert abs(value - n) <= TOLERANCE * n * relative_error(precision)
+
+def test_repeated_ids_are_counted_once():
+    ids = random_ids(3_000, seed=1)
+    once = HyperLogLog.from_ids(ids)
+    assert HyperLogLog.from_ids(np.concatenate([ids, ids[::-1]])) == once
+
+def test_merge_is_the_sketch_of_the_union():
+    a, b = random_ids(20_000, seed=2), random_ids(20_000, seed=3)
+    union = HyperLogLog.from_ids(np.concatenate([a, b]))
+    assert HyperLogLog.from_ids(a) | HyperLogLog.from_ids(b) == union
+    assert HyperLogLog.from_ids(a).update(HyperLogLog.from_ids(b)) == union
+    assert HyperLogLog.from_bytes(union.to_bytes()) == union
+    with pytest.raises(ValueError):
+        HyperLogLog.from_ids(a, 12) | HyperLogLog.from_ids(b, 14)
+
+def test_intersection_within_error_bound():
+    ids = random_ids(60_000, seed=4)
+    value, error = intersection_count([HyperLogLog.from_ids(ids[:40_000]), HyperLogLog.from_ids(ids[20_000:])])
+    assert abs(value - 20_000) <= TOLERANCE * error
+
+def test_sketch_funnel_within_error_bound(tables):
+    expected_df, _, _ = set_journeys(*tables[:4])
+    funnel_df, _ = sketch_funnel([HyperLogLog.from_ids(df['user_id'].to_numpy()) for df in tables[:4]])
+    assert funnel_df['Stage'].tolist() == expected_df['Stage'].tolist()
+    for users, estimate, error in zip(expected_df['Users'], funnel_df['Users'], funnel_df['Users_Error']):
+        assert abs(estimate - users) <= TOLERANCE * error
+
+def test_sketch_grid_range_within_error_bound(tables):
+    *page_dfs, user_df = tables
+    grid = FunnelSketches.build(*page_dfs, user_df=user_df)
+    dates = pd.to_datetime(user_df['date']).dt.normalize()
+    users = user_df[dates.between('2015-02-01', '2015-02-28') & (user_df['device'] == 'Mobile')]
+    expected_df, _, _ = set_journeys(*filter_users(page_dfs, users['user_id']))
+
+    funnel_df, _ = grid.funnel('2015-02-01', '2015-02-28', 'Mobile')
+    for users, estimate, error in zip(expected_df['Users'], funnel_df['Users'], funnel_df['Users_Error']):
+        assert abs(estimate - users) <= TOLERANCE * error
+
+def test_grids_of_two_batches_merge_into_the_full_grid(tables):
+    *page_dfs, user_df = tables
+    full = FunnelSketches.build(*page_dfs, user_df=user_df)
+    first, second = user_df.iloc[:len(user_df) // 2], user_df.iloc[len(user_df) // 2:]
+    merged = FunnelSketches.build(*filter_users(page_dfs, first['user_id']), user_df=first).merge(
+        FunnelSketches.build(*filter_users(page_dfs, second['user_id']), user_df=second)
+    )
+    assert merged.categories == full.categories
+    assert np.array_equal(merged.registers, full.registers)
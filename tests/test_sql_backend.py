@@ -0,0 +1,23 @@
+import pytest
+from sql_backend import SQLiteBackend
+from reference import set_journeys, set_analysis, assert_same_results
+
+@pytest.fixture(scope='module')
+def backend(tmp_path_factory):
+    backend = SQLiteBackend(db_path=str(tmp_path_factory.mktemp('sqlite') / 'funnel.sqlite'))
+    yield backend
+    backend.conn.close()
+
+def test_sqlite_matches_set_baseline(tables, backend):
+    assert_same_results(set_analysis(*tables), backend.analysis_results())
+
+def test_sqlite_user_sets_match(tables, backend):
+    _, _, expected_sets = set_journeys(*tables[:4])
+    _, _, user_sets = backend.calculate_user_journeys()
+    for key, users in expected_sets.items():
+        assert set(user_sets[key]) == users, key
+
+def test_reopened_database_is_fresh(backend):
+    reopened = SQLiteBackend(db_path=backend.db_path)
+    assert reopened._is_fresh()
+    reopened.conn.close()
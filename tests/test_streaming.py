@@ -0,0 +1,19 @@
+import os
+import numpy as np
+from utils import PROCESSED_DIR, TABLE_FILES
+from streaming import stream_stage_users, stream_user_journeys
+from reference import set_journeys, assert_same_results
+
+def test_stream_stage_users_are_sorted_distinct_ids(tables):
+    users = stream_stage_users(os.path.join(PROCESSED_DIR, TABLE_FILES['home']), chunksize=7_000)
+    assert users.tolist() == np.unique(tables[0]['user_id'].to_numpy(dtype=np.int64)).tolist()
+
+def test_streamed_journeys_match_sets(tables):
+    expected_df, expected_overall, expected_sets = set_journeys(*tables[:4])
+    # pedacos pequenos: varias fusoes do acumulado por tabela
+    funnel_df, overall_conversion, user_sets = stream_user_journeys(chunksize=5_000)
+
+    assert_same_results(expected_df, funnel_df)
+    assert overall_conversion == expected_overall
+    for key, users in expected_sets.items():
+        assert set(user_sets[key]) == users, key
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+from user_set import UserSet
+
+BIG_ID = 2 ** 40
+
+def random_ids(rng, kind):
+    """Ids with repeats; 'uint32' fits in 32 bits, 'int64' has negatives and ids above 2**32."""
+    size = int(rng.integers(0, 60))
+    if kind == 'empty':
+        return np.empty(0, dtype=np.int64)
+    if kind == 'uint32':
+        return rng.integers(0, 80, size=size).astype(np.uint32)
+    values = rng.integers(-20, 80, size=size)
+    values[::3] += BIG_ID
+    return values.astype(np.int64)
+
+def cases(n=60):
+    # pares de conjuntos: vazios, so uint32, so int64 e misturados, com ids repetidos
+    kinds = ['empty', 'uint32', 'int64']
+    rng = np.random.default_rng(0)
+    return [
+        (random_ids(rng, kinds[i % 3]), random_ids(rng, kinds[(i // 3) % 3]))
+        for i in range(n)
+    ]
+
+@pytest.mark.parametrize('a_ids, b_ids', cases())
+def test_operators_match_frozenset(a_ids, b_ids):
+    a, b = UserSet(a_ids), UserSet(b_ids)
+    fa, fb = frozenset(a_ids.tolist()), frozenset(b_ids.tolist())
+
+    assert len(a) == len(fa)
+    assert sorted(a) == sorted(fa)
+    assert (a & b) == fa & fb
+    assert (a | b) == fa | fb
+    assert (a - b) == fa - fb
+    assert (a ^ b) == fa ^ fb
+    assert (a == b) == (fa == fb)
+    assert (a <= b) == (fa <= fb)
+    assert (a < b) == (fa < fb)
+    assert a.isdisjoint(b) == fa.isdisjoint(fb)
+
+    # frozenset do outro lado do operador
+    assert (fa & b) == fa & fb
+    assert (fa | b) == fa | fb
+    assert (fa - b) == fa - fb
+    assert a == fa and fa == a
+
+@pytest.mark.parametrize('a_ids, b_ids', cases())
+def test_membership_matches_frozenset(a_ids, b_ids):
+    a, fa = UserSet(a_ids), frozenset(a_ids.tolist())
+    queries = np.concatenate([b_ids.astype(np.int64), [-1, 0, BIG_ID, 2 ** 33]])
+    assert [q in a for q in queries.tolist()] == [q in fa for q in queries.tolist()]
+    assert a.contains_many(queries).tolist() == [q in fa for q in queries.tolist()]
+    assert 'x' not in a and 1.5 not in a
+
+def test_small_side_intersection():
+    # lado pequeno procurado no grande (mais de 16x menor)
+    big = np.arange(0, 10_000, 3)
+    small = np.array([0, 3, 4, 9_999, 20_000, 9_000])
+    assert (UserSet(small) & UserSet(big)) == frozenset(small.tolist()) & frozenset(big.tolist())
+    assert (UserSet(big) & UserSet(small)) == frozenset(small.tolist()) & frozenset(big.tolist())
+
+def test_storage_is_sorted_unique_and_compact():
+    assert UserSet(np.array([5, 1, 5, 3], dtype=np.int64)).ids.tolist() == [1, 3, 5]
+    assert UserSet([1, 2]).ids.dtype == np.uint32
+    assert UserSet([-1, 2]).ids.dtype == np.int64
+    assert UserSet([BIG_ID]).ids.dtype == np.int64
+    assert UserSet({3, 1}) == UserSet(UserSet([1, 3, 3]))
+    assert len(UserSet()) == 0 and UserSet() == frozenset()